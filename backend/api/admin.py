@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Cart, Favorite, Ingredient, Recipe, Tag
+from .models import Cart, ExportJob, Favorite, Ingredient, Recipe, Tag
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -13,11 +13,15 @@ class IngredientAdmin(admin.ModelAdmin):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'count_favorites')
+    list_display = ('name', 'author', 'favorites_count', 'in_carts_count')
     list_filter = ('author', 'name', 'tags')
 
-    def count_favorites(self, obj):
-        return obj.favorites.count()
+
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'kind', 'export_format', 'status',
+                    'attempts', 'created_at', 'expires_at')
+    list_filter = ('status', 'kind')
+    exclude = ('payload',)
 
 
 admin.site.register(Tag, TagAdmin)
@@ -25,3 +29,4 @@ admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Cart)
 admin.site.register(Favorite)
+admin.site.register(ExportJob, ExportJobAdmin)
@@ -0,0 +1,442 @@
+"""
+Замеры маршрутов api.urls и users.urls через django.test.Client.
+
+Каждый сценарий — последовательность запросов, которые выполняются
+вместе на каждой итерации (например, добавить рецепт в избранное и
+убрать его обратно). Шаг сценария, который идёт не через HTTP (воркер
+выгрузок, рендеринг книги рецептов), описывается Task и замеряется так
+же, а в отчёте получает статус 200 или 500, если упал. Для каждого шага
+записываются число SQL-запросов, время в СУБД и задержка. Весь прогон
+идёт в транзакции, которая откатывается в конце, а загруженные картинки
+и файлы выгрузок пишутся во временный MEDIA_ROOT, так что база и
+медиафайлы остаются нетронутыми.
+"""
+import base64
+import io
+import math
+import tempfile
+import time
+from collections import namedtuple
+from urllib.parse import urlencode
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import get_resolver, reverse
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from api import jobs
+from api.exports import get_recipe_book, render_recipe_book
+from api.models import ExportJob, Ingredient, Recipe, Tag
+from users.models import Follow
+
+User = get_user_model()
+
+# Маршруты, которые требуют писем или одноразовых токенов из них, и
+# корень api, который перекрыт корнем api_users с тем же адресом
+EXCLUDED = {
+    'api:api-root',
+    'api_users:user-activation',
+    'api_users:user-resend-activation',
+    'api_users:user-reset-password',
+    'api_users:user-reset-password-confirm',
+    'api_users:user-reset-username',
+    'api_users:user-reset-username-confirm',
+}
+NAMESPACES = ('api', 'api_users')
+SEED_PASSWORD = 'seed-password'
+# METRICS_TOKEN на время замера: без токена метрики видят только
+# администраторы
+METRICS_TOKEN = 'benchmark-metrics'
+
+Case = namedtuple('Case', 'name method url_name kwargs params data auth',
+                  defaults=(None, None, None, 'user'))
+Task = namedtuple('Task', 'name run method url_name',
+                  defaults=('task', None))
+
+
+def _image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (200, 120, 60)).save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+def _recipe_payload(sample, state):
+    return {
+        'name': 'Замер',
+        'text': 'Рецепт для замера',
+        'cooking_time': 10,
+        'image': sample.image,
+        'tags': sample.tag_ids[:2],
+        'ingredients': [{'id': ingredient_id, 'amount': 100}
+                        for ingredient_id in sample.ingredient_ids],
+    }
+
+
+def _work_exports(sample, state):
+    # Воркер выгрузок в том же процессе: очередь пуста после шага
+    while jobs.run_next() is not None:
+        pass
+
+
+def _render_recipe_book(sample, state):
+    render_recipe_book(get_recipe_book(sample.recipe_ids)).close()
+
+
+def _export_steps(name, kind):
+    """
+    Returns:
+        list: Создание выгрузки `kind` в PDF, работа воркера, статус и
+        скачивание файла. Со второй итерации создание возвращает готовое
+        задание с теми же входными данными.
+    """
+    return [
+        Case(f'{name} create', 'post', 'api:export-list',
+             data={'kind': kind, 'format': 'pdf'}),
+        Task(f'{name} worker', _work_exports),
+        Case(f'{name} status', 'get', 'api:export-detail',
+             lambda s, state: {'pk': state['id']}),
+        Case(f'{name} download', 'get', 'api:export-download',
+             lambda s, state: {'pk': state['id']}),
+    ]
+
+
+SCENARIOS = [
+    [Case('api root', 'get', 'api_users:api-root', auth=None)],
+    [Case('tags list', 'get', 'api:tag-list', auth=None)],
+    [Case('tags detail', 'get', 'api:tag-detail',
+          lambda s, _: {'pk': s.tag_ids[0]}, auth=None)],
+    [Case('ingredients list', 'get', 'api:ingredient-list', auth=None)],
+    [Case('ingredients search', 'get', 'api:ingredient-list',
+          params={'name': 'сы'}, auth=None)],
+    [Case('ingredients detail', 'get', 'api:ingredient-detail',
+          lambda s, _: {'pk': s.ingredient_ids[0]}, auth=None)],
+    [Case('recipes list anonymous', 'get', 'api:recipe-list', auth=None)],
+    [Case('recipes list', 'get', 'api:recipe-list')],
+    [Case('recipes list filtered', 'get', 'api:recipe-list',
+          params=lambda s, _: {'tags': s.tag_slugs[:2],
+                               'is_favorited': 1})],
+    [Case('recipes search', 'get', 'api:recipe-list',
+          params={'search': 'рецепт 12'})],
+    [Case('recipes popular', 'get', 'api:recipe-list',
+          params={'ordering': '-favorites_count'})],
+    [Case('recipes feed', 'get', 'api:recipe-feed')],
+    [Case('recipes cook with', 'get', 'api:recipe-cook-with',
+          params=lambda s, _: {'ingredients': ','.join(
+              map(str, s.ingredient_ids))})],
+    [Case('recipes list cursor', 'get', 'api:recipe-list',
+          params={'cursor': '', 'limit': 6})],
+    [Case('recipes detail', 'get', 'api:recipe-detail',
+          lambda s, _: {'pk': s.recipe_id})],
+    [
+        Case('recipes create', 'post', 'api:recipe-list',
+             data=_recipe_payload),
+        Case('recipes update', 'patch', 'api:recipe-detail',
+             lambda s, state: {'pk': state['id']},
+             data=lambda s, state: {'ingredients': [
+                 {'id': s.ingredient_ids[0], 'amount': 50}]}),
+        Case('recipes delete', 'delete', 'api:recipe-detail',
+             lambda s, state: {'pk': state['id']}),
+    ],
+    [
+        Case('favorite add', 'post', 'api:recipe-favorite',
+             lambda s, _: {'pk': s.recipe_id}),
+        Case('favorite remove', 'delete', 'api:recipe-favorite',
+             lambda s, _: {'pk': s.recipe_id}),
+    ],
+    [
+        Case('shopping cart add', 'post', 'api:recipe-shopping-cart',
+             lambda s, _: {'pk': s.recipe_id}),
+        Case('shopping cart remove', 'delete', 'api:recipe-shopping-cart',
+             lambda s, _: {'pk': s.recipe_id}),
+    ],
+    [
+        Case('favorite batch add', 'post', 'api:recipe-favorite-batch',
+             data=lambda s, _: {'recipes': s.recipe_ids}),
+        Case('favorite batch remove', 'delete', 'api:recipe-favorite-batch',
+             data=lambda s, _: {'recipes': s.recipe_ids}),
+    ],
+    [
+        Case('shopping cart batch add', 'post',
+             'api:recipe-shopping-cart-batch',
+             data=lambda s, _: {'recipes': s.recipe_ids}),
+        Case('shopping cart batch remove', 'delete',
+             'api:recipe-shopping-cart-batch',
+             data=lambda s, _: {'recipes': s.recipe_ids}),
+    ],
+    [Case('shopping cart pdf', 'get', 'api:recipe-download-shopping-cart',
+          params={'format': 'pdf'})],
+    [Case('shopping cart txt', 'get', 'api:recipe-download-shopping-cart',
+          params={'format': 'txt'})],
+    _export_steps('export', ExportJob.SHOPPING_LIST),
+    [Case('exports list', 'get', 'api:export-list')],
+    _export_steps('recipe book', ExportJob.RECIPE_BOOK),
+    [Task('recipe book render', _render_recipe_book)],
+    [Case('metrics', 'get', 'api:metrics', auth='metrics')],
+    [Case('users list', 'get', 'api_users:user-list', auth=None)],
+    [Case('users detail', 'get', 'api_users:user-detail',
+          lambda s, _: {'id': s.author_id})],
+    [Case('users me', 'get', 'api_users:user-me')],
+    [Case('users subscriptions', 'get', 'api_users:user-subscriptions',
+          params={'recipes_limit': 3})],
+    [
+        Case('subscribe', 'post', 'api_users:user-subscribe',
+             lambda s, _: {'id': s.author_id}),
+        Case('unsubscribe', 'delete', 'api_users:user-subscribe',
+             lambda s, _: {'id': s.author_id}),
+    ],
+    [Case('users register', 'post', 'api_users:user-list',
+          data=lambda s, state: {
+              'email': f'bench{state["iteration"]}@example.com',
+              'username': f'bench{state["iteration"]}',
+              'first_name': 'Замер', 'last_name': 'Замер',
+              'password': SEED_PASSWORD}, auth=None)],
+    [Case('users set password', 'post', 'api_users:user-set-password',
+          data={'current_password': SEED_PASSWORD,
+                'new_password': SEED_PASSWORD})],
+    # Имена bench<N> уже заняты сценарием регистрации
+    [Case('users set username', 'post', 'api_users:user-set-username',
+          data=lambda s, state: {
+              'current_password': SEED_PASSWORD,
+              'new_username': f'renamed{state["iteration"]}'})],
+    [
+        Case('token login', 'post', 'api_users:login',
+             data=lambda s, _: {'email': s.other.email,
+                                'password': SEED_PASSWORD}, auth=None),
+        Case('token logout', 'post', 'api_users:logout', auth='state'),
+    ],
+]
+
+
+class Sample:
+    """
+    Объекты, на которых идут замеры: пользователь с токеном, автор, на
+    которого он не подписан, и рецепт, которого нет в его списках.
+
+    Пользователям выставляется пароль SEED_PASSWORD. С `seed_only`
+    берутся только пользователи seed_data: так замер, изменения которого
+    не откатываются, не трогает настоящие учётные записи.
+    """
+
+    def __init__(self, seed_only=False):
+        users = User.objects.order_by('id')
+        seeded = users.filter(username__startswith='seed')
+        if seed_only:
+            users = seeded
+        self.user = seeded.first() or users.first()
+        if self.user is None:
+            raise ValueError('В базе нет пользователей seed_data, '
+                             'запустите seed_data')
+        self.user.set_password(SEED_PASSWORD)
+        self.user.save(update_fields=['password'])
+        self.token = Token.objects.get_or_create(user=self.user)[0].key
+        self.other = users.exclude(id=self.user.id).first() or self.user
+        self.other.set_password(SEED_PASSWORD)
+        self.other.save(update_fields=['password'])
+        followed = Follow.objects.filter(user=self.user).values('author_id')
+        self.author_id = (
+            User.objects.exclude(id=self.user.id).exclude(id__in=followed)
+            .filter(recipes__isnull=False).values_list('id', flat=True)
+            .first() or self.other.id)
+        # Меню на неделю для пачек: рецепты не в избранном и не в корзине
+        self.recipe_ids = list(
+            Recipe.objects.exclude(favorites__user=self.user)
+            .exclude(cart__user=self.user).values_list('id', flat=True)[:7])
+        self.recipe_id = self.recipe_ids[0] if self.recipe_ids else None
+        tags = list(Tag.objects.values_list('id', 'slug'))
+        self.tag_ids = [tag_id for tag_id, _ in tags]
+        self.tag_slugs = [slug for _, slug in tags]
+        self.ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True)[:5])
+        self.image = _image()
+
+
+class QueryRecorder:
+    """Обёртка execute_wrapper: считает запросы и время в СУБД."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+def percentile(values, percent):
+    """
+    Returns:
+        float: Перцентиль по методу ближайшего ранга.
+    """
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def _resolve(value, sample, state):
+    return value(sample, state) if callable(value) else value
+
+
+def _perform_task(task, sample, state):
+    recorder = QueryRecorder()
+    status = 200
+    with connection.execute_wrapper(recorder):
+        start = time.perf_counter()
+        try:
+            # Упавший шаг откатывается до точки сохранения, и прогон
+            # продолжается в исправной транзакции
+            with transaction.atomic():
+                task.run(sample, state)
+        except Exception:
+            status = 500
+        latency = time.perf_counter() - start
+    return status, recorder.count, recorder.duration, latency
+
+
+def _perform(client, case, sample, state):
+    if isinstance(case, Task):
+        return _perform_task(case, sample, state)
+    kwargs = _resolve(case.kwargs, sample, state)
+    url = reverse(case.url_name, kwargs=kwargs)
+    params = _resolve(case.params, sample, state)
+    data = _resolve(case.data, sample, state)
+    headers = {}
+    token = {'user': sample.token,
+             'state': state.get('auth_token')}.get(case.auth)
+    if token:
+        headers['HTTP_AUTHORIZATION'] = f'Token {token}'
+    elif case.auth == 'metrics':
+        headers['HTTP_AUTHORIZATION'] = f'Bearer {METRICS_TOKEN}'
+    request = getattr(client, case.method)
+    if case.method == 'get':
+        call = (url, params)
+        options = {}
+    else:
+        if params:
+            url = f'{url}?{urlencode(params, doseq=True)}'
+        call = (url, data)
+        options = {'content_type': 'application/json'}
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        start = time.perf_counter()
+        response = request(*call, **options, **headers)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        latency = time.perf_counter() - start
+    if response.get('Content-Type', '').startswith('application/json'):
+        payload = response.json() if response.content else None
+        if isinstance(payload, dict):
+            state.update(payload)
+    return response.status_code, recorder.count, recorder.duration, latency
+
+
+def run(iterations=20, warmup=3, scenarios=SCENARIOS, only=()):
+    """
+    Прогоняет сценарии и откатывает все изменения в базе.
+
+    Args:
+        only (Iterable[str]): Имена запросов; сценарий выполняется, если
+            в нём есть хотя бы один из них. Пусто — все сценарии.
+
+    Returns:
+        dict: Отчёт `{'meta': {...}, 'endpoints': {name: {...}}}`.
+    """
+    samples = {}
+    with tempfile.TemporaryDirectory() as media, \
+            override_settings(MEDIA_ROOT=media,
+                              METRICS_TOKEN=METRICS_TOKEN), \
+            transaction.atomic():
+        sample = Sample()
+        # Готовые выгрузки ссылаются на файлы вне временного MEDIA_ROOT:
+        # повторная выгрузка вернула бы такое задание вместо нового
+        ExportJob.objects.filter(user=sample.user).delete()
+        client = Client(raise_request_exception=False)
+        for scenario in scenarios:
+            if only and not any(case.name in only for case in scenario):
+                continue
+            for iteration in range(warmup + iterations):
+                state = {'iteration': iteration}
+                for case in scenario:
+                    measured = _perform(client, case, sample, state)
+                    if iteration >= warmup:
+                        samples.setdefault(case.name, (case, []))[1].append(
+                            measured)
+        meta = {
+            'vendor': connection.vendor,
+            'iterations': iterations,
+            'warmup': warmup,
+            'users': User.objects.count(),
+            'recipes': Recipe.objects.count(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        transaction.set_rollback(True)
+    return {'meta': meta, 'endpoints': {
+        name: summarize(case, measured)
+        for name, (case, measured) in samples.items()
+    }}
+
+
+def is_success(status_code):
+    return 200 <= status_code < 400
+
+
+def summarize(case, measured):
+    statuses, queries, db_times, latencies = zip(*measured)
+    return {
+        'method': case.method.upper(),
+        'url_name': case.url_name,
+        'statuses': sorted(set(statuses)),
+        # Замер ответа с ошибкой ничего не говорит о скорости маршрута
+        'ok': all(is_success(code) for code in statuses),
+        'queries': max(queries),
+        'db_ms': round(sum(db_times) / len(db_times) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def uncovered_routes(scenarios=SCENARIOS):
+    """
+    Returns:
+        list[str]: Именованные маршруты api.urls и users.urls, для
+        которых нет ни сценария, ни записи в EXCLUDED.
+    """
+    covered = {case.url_name for scenario in scenarios for case in scenario}
+    resolver = get_resolver()
+    names = set()
+    for namespace in NAMESPACES:
+        _, namespace_resolver = resolver.namespace_dict[namespace]
+        names.update(f'{namespace}:{name}'
+                     for name in namespace_resolver.reverse_dict
+                     if isinstance(name, str))
+    return sorted(names - covered - EXCLUDED)
+
+
+def compare(previous, current, threshold=20):
+    """
+    Сравнивает отчёт с предыдущим прогоном.
+
+    Регрессией считается рост числа запросов или рост p95 больше чем
+    на `threshold` процентов.
+
+    Returns:
+        list[tuple[str, dict, dict, bool]]: Имя, старые и новые замеры,
+        признак регрессии.
+    """
+    rows = []
+    for name, new in current['endpoints'].items():
+        old = previous['endpoints'].get(name)
+        if old is None:
+            continue
+        regression = (
+            new['queries'] > old['queries']
+            or new['p95_ms'] > old['p95_ms'] * (1 + threshold / 100))
+        rows.append((name, old, new, regression))
+    return rows
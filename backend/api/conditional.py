@@ -0,0 +1,84 @@
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+from api.versions import get_validators, version_key
+
+
+class NotModified(APIException):
+    status_code = status.HTTP_304_NOT_MODIFIED
+    default_detail = ''
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET-запросы по счётчикам изменений таблиц.
+
+    `versioned_models` — таблицы, от которых зависит ответ;
+    `viewer_models` — таблицы со связями пользователя (избранное,
+    корзина, подписки), их счётчики берутся для текущего пользователя.
+    На совпавший If-None-Match отвечает 304 до выполнения queryset.
+    Если get_version_keys вернул None, ответ не зависит от счётчиков
+    целиком и отдаётся без валидаторов.
+    """
+
+    versioned_models = ()
+    viewer_models = ()
+    conditional_actions = ('list', 'retrieve')
+
+    validators = None
+
+    def get_version_keys(self):
+        keys = [version_key(model) for model in self.versioned_models]
+        user = self.request.user
+        if user.is_authenticated:
+            keys.extend(version_key(model, user.id)
+                        for model in self.viewer_models)
+        return keys
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (request.method not in ('GET', 'HEAD')
+                or self.action not in self.conditional_actions):
+            return
+        keys = self.get_version_keys()
+        if keys is None:
+            return
+        self.validators = get_validators(keys)
+        etag, last_modified = self.validators
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            etags = parse_etags(if_none_match)
+            if '*' in etags or etag in etags:
+                raise NotModified()
+            return
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        if (last_modified is not None and if_modified_since is not None
+                and int(last_modified.timestamp()) <= if_modified_since):
+            raise NotModified()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return self.set_validators(
+                Response(status=status.HTTP_304_NOT_MODIFIED))
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            self.set_validators(response)
+        return response
+
+    def set_validators(self, response):
+        if self.validators is None:
+            return response
+        etag, last_modified = self.validators
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        patch_vary_headers(response, ('Authorization',))
+        return response
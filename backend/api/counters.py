@@ -0,0 +1,166 @@
+"""
+Денормализованные счётчики: Recipe.favorites_count, Recipe.in_carts_count,
+AuthorStats.recipes_count и AuthorStats.followers_count.
+
+Счётчики меняются одним UPDATE ... SET x = x ± 1 в той же транзакции,
+что и связь, поэтому конкурентные запросы не теряют изменений. Каскадные
+удаления (пользователь вместе с избранным и подписками) и правки через
+админку мимо представлений счётчики не трогают: такие расхождения
+находит и исправляет команда reconcile_counters.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from api.models import Cart, Favorite, Recipe
+from users.models import AuthorStats, Follow
+
+User = get_user_model()
+
+# Связь пользователя с рецептом: поле-счётчик рецепта
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    Cart: 'in_carts_count',
+}
+# Поле AuthorStats: (модель, поле автора в ней)
+AUTHOR_COUNTERS = {
+    'recipes_count': (Recipe, 'author'),
+    'followers_count': (Follow, 'author'),
+}
+
+
+def _change(queryset, field, delta):
+    if delta < 0:
+        # Не уводим счётчик ниже нуля, если он уже разошёлся с таблицей
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def change_recipe_counter(model, recipe_id, delta):
+    """Прибавляет `delta` к счётчику связей `model` у рецепта."""
+    _change(Recipe.objects.filter(id=recipe_id), RECIPE_COUNTERS[model],
+            delta)
+
+
+def change_recipe_counters(model, recipe_ids, delta):
+    """То же для нескольких рецептов, одним UPDATE."""
+    _change(Recipe.objects.filter(id__in=recipe_ids),
+            RECIPE_COUNTERS[model], delta)
+
+
+def change_author_counter(user_id, field, delta):
+    """Прибавляет `delta` к счётчику автора `field`."""
+    if _change(AuthorStats.objects.filter(user_id=user_id), field, delta):
+        return
+    # Строки ещё нет (пользователь создан в обход сигнала) или счётчик
+    # уже на нуле: считаем автора заново
+    AuthorStats.objects.get_or_create(user_id=user_id)
+    expected = author_counts([user_id]).get(user_id, {})
+    AuthorStats.objects.filter(user_id=user_id).update(**{
+        name: expected.get(name, 0) for name in AUTHOR_COUNTERS})
+
+
+def _count_of(model, field):
+    return Coalesce(Subquery(model.objects.filter(
+        **{field: OuterRef('pk')}).order_by().values(field).annotate(
+        total=Count('id')).values('total')), 0)
+
+
+def recipe_counts(recipe_ids=None):
+    """
+    Returns:
+        dict: {recipe_id: {поле: (сохранено, ожидается)}}.
+    """
+    queryset = Recipe.objects.all()
+    if recipe_ids is not None:
+        queryset = queryset.filter(id__in=recipe_ids)
+    fields = list(RECIPE_COUNTERS.values())
+    rows = queryset.annotate(**{
+        f'expected_{field}': _count_of(model, 'recipe')
+        for model, field in RECIPE_COUNTERS.items()
+    }).order_by().values_list(
+        'id', *fields, *(f'expected_{field}' for field in fields))
+    return {
+        row[0]: {field: (row[1 + i], row[1 + len(fields) + i])
+                 for i, field in enumerate(fields)}
+        for row in rows
+    }
+
+
+def author_counts(user_ids=None):
+    """
+    Считает счётчики авторов заново.
+
+    Returns:
+        dict: {user_id: {поле: количество}}, только ненулевые.
+    """
+    counts = {}
+    for name, (model, field) in AUTHOR_COUNTERS.items():
+        queryset = model.objects.all()
+        if user_ids is not None:
+            queryset = queryset.filter(**{f'{field}__in': user_ids})
+        for user_id, total in queryset.order_by().values(field).annotate(
+                total=Count('id')).values_list(field, 'total'):
+            counts.setdefault(user_id, {})[name] = total
+    return counts
+
+
+def find_drift(recipe_ids=None, user_ids=None):
+    """
+    Сравнивает сохранённые счётчики с пересчитанными.
+
+    Returns:
+        list[tuple]: (модель, id, поле, сохранено, ожидается) для каждого
+        расходящегося счётчика; отсутствующая строка AuthorStats
+        сохранена как None.
+    """
+    drift = []
+    for recipe_id, fields in sorted(recipe_counts(recipe_ids).items()):
+        for field, (stored, expected) in fields.items():
+            if stored != expected:
+                drift.append(('recipe', recipe_id, field, stored, expected))
+    users = User.objects.all()
+    if user_ids is not None:
+        users = users.filter(id__in=user_ids)
+    stored = {
+        user_id: dict(zip(AUTHOR_COUNTERS, values))
+        for user_id, *values in AuthorStats.objects.filter(
+            user__in=users).values_list('user_id', *AUTHOR_COUNTERS)
+    }
+    expected = author_counts(user_ids)
+    for user_id in users.order_by('id').values_list('id', flat=True):
+        have = stored.get(user_id, {})
+        want = expected.get(user_id, {})
+        for name in AUTHOR_COUNTERS:
+            if have.get(name) != want.get(name, 0):
+                drift.append(('author', user_id, name, have.get(name),
+                              want.get(name, 0)))
+    return drift
+
+
+def reconcile(drift, batch_size=1000):
+    """
+    Записывает ожидаемые значения расходящихся счётчиков.
+
+    Args:
+        drift (list[tuple]): Результат find_drift.
+
+    Returns:
+        int: Число исправленных строк.
+    """
+    recipes, authors = {}, {}
+    for kind, pk, field, _, expected in drift:
+        target = recipes if kind == 'recipe' else authors
+        target.setdefault(pk, {})[field] = expected
+    for recipe_id, values in recipes.items():
+        Recipe.objects.filter(id=recipe_id).update(**values)
+    existing = set(AuthorStats.objects.filter(
+        user_id__in=authors).values_list('user_id', flat=True))
+    AuthorStats.objects.bulk_create(
+        [AuthorStats(user_id=user_id, **values)
+         for user_id, values in authors.items() if user_id not in existing],
+        batch_size=batch_size, ignore_conflicts=True)
+    for user_id, values in authors.items():
+        if user_id in existing:
+            AuthorStats.objects.filter(user_id=user_id).update(**values)
+    return len(recipes) + len(authors)
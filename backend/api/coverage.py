@@ -0,0 +1,134 @@
+"""
+Подбор рецептов по ингредиентам, которые уже есть у пользователя.
+
+Индекс хранит в памяти процесса списки рецептов для каждого ингредиента
+(posting lists) и состав каждого рецепта. Совпадения считаются
+подсчётом вхождений рецептов во всех списках переданных ингредиентов
+(Counter.update работает на C), без запросов к IngredientAmount.
+
+Изменения состава рецептов применяются к индексу этого процесса точечно
+после коммита; изменения из других процессов подхватываются полной
+перестройкой раз в COVERAGE_INDEX_TTL секунд.
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+from itertools import chain
+
+from django.conf import settings
+from django.db import transaction
+
+from api.models import IngredientAmount
+
+INDEX_TTL = getattr(settings, 'COVERAGE_INDEX_TTL', 300)
+
+
+class CoverageIndex:
+    """Списки рецептов по ингредиентам и состав рецептов."""
+
+    def __init__(self, ttl=INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._state = None
+
+    def invalidate(self):
+        self._state = None
+
+    def _build(self):
+        recipes = defaultdict(set)
+        for recipe_id, ingredient_id in IngredientAmount.objects.values_list(
+                'recipe_id', 'ingredient_id').order_by().iterator(
+                chunk_size=10000):
+            recipes[recipe_id].add(ingredient_id)
+        postings = defaultdict(set)
+        for recipe_id, ingredients in recipes.items():
+            for ingredient_id in ingredients:
+                postings[ingredient_id].add(recipe_id)
+        # Множества не изменяются на месте: обновление заменяет их
+        # новыми, поэтому читать индекс можно без блокировки
+        return {
+            'built_at': time.monotonic(),
+            'recipes': {recipe_id: frozenset(ingredients)
+                        for recipe_id, ingredients in recipes.items()},
+            'postings': {ingredient_id: frozenset(recipe_ids)
+                         for ingredient_id, recipe_ids in postings.items()},
+        }
+
+    def _get_state(self):
+        state = self._state
+        if state is None or time.monotonic() - state['built_at'] > self.ttl:
+            with self._lock:
+                state = self._state
+                if (state is None
+                        or time.monotonic() - state['built_at'] > self.ttl):
+                    state = self._state = self._build()
+        return state
+
+    def update_recipes(self, recipe_ids):
+        """Перечитывает состав рецептов и обновляет их в индексе."""
+        if self._state is None:
+            return
+        fresh = defaultdict(set)
+        for recipe_id, ingredient_id in IngredientAmount.objects.filter(
+                recipe_id__in=recipe_ids).values_list(
+                'recipe_id', 'ingredient_id').order_by():
+            fresh[recipe_id].add(ingredient_id)
+        with self._lock:
+            state = self._state
+            if state is None:
+                return
+            recipes, postings = state['recipes'], state['postings']
+            for recipe_id in recipe_ids:
+                old = recipes.get(recipe_id, frozenset())
+                new = frozenset(fresh.get(recipe_id, ()))
+                for ingredient_id in old - new:
+                    postings[ingredient_id] = (
+                        postings[ingredient_id] - {recipe_id})
+                for ingredient_id in new - old:
+                    postings[ingredient_id] = (
+                        postings.get(ingredient_id, frozenset())
+                        | {recipe_id})
+                if new:
+                    recipes[recipe_id] = new
+                else:
+                    recipes.pop(recipe_id, None)
+
+    def schedule(self, recipe_ids):
+        """Обновляет рецепты в индексе после коммита транзакции."""
+        recipe_ids = list(recipe_ids)
+        transaction.on_commit(lambda: self.update_recipes(recipe_ids))
+
+    def match(self, ingredient_ids, max_missing=None):
+        """
+        Ранжирует рецепты по числу ингредиентов, которые уже есть.
+
+        Args:
+            ingredient_ids (Iterable[int]): Ингредиенты пользователя.
+            max_missing (int | None): Отбросить рецепты, где не хватает
+                больше ингредиентов.
+
+        Returns:
+            list[tuple[int, int, int]]: (id рецепта, есть, не хватает):
+            сначала больше совпадений, затем меньше недостающих,
+            затем новые рецепты.
+        """
+        state = self._get_state()
+        recipes, postings = state['recipes'], state['postings']
+        matched = Counter()
+        matched.update(chain.from_iterable(
+            postings.get(ingredient_id, ())
+            for ingredient_id in set(ingredient_ids)))
+        ranked = []
+        for recipe_id, count in matched.items():
+            ingredients = recipes.get(recipe_id)
+            if ingredients is None:
+                # Рецепт удалён, пока шёл подсчёт
+                continue
+            missing = max(len(ingredients) - count, 0)
+            if max_missing is None or missing <= max_missing:
+                ranked.append((recipe_id, count, missing))
+        ranked.sort(key=lambda row: (-row[1], row[2], -row[0]))
+        return ranked
+
+
+coverage_index = CoverageIndex()
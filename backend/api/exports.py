@@ -0,0 +1,253 @@
+import csv
+import io
+import os
+import tempfile
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch
+from django.http import FileResponse, StreamingHttpResponse
+from reportlab.lib.utils import ImageReader, simpleSplit
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from api.models import IngredientAmount, Recipe, ShoppingListItem
+
+FONT_NAME = 'Slimamif'
+FONT_PATH = os.path.join(settings.BASE_DIR, 'Slimamif.ttf')
+# Размер куска, которым PDF отдаётся клиенту
+CHUNK_SIZE = 64 * 1024
+# PDF больше этого размера собирается не в памяти, а во временном файле
+SPOOL_SIZE = 1024 * 1024
+# Вертикальная разметка страницы списка покупок
+PAGE_TOP = 800
+PAGE_BOTTOM = 50
+LINE_HEIGHT = 25
+# Разметка книги рецептов
+PAGE_LEFT = 60
+PAGE_WIDTH = 475
+IMAGE_BOX = 250, 150
+
+
+@lru_cache(maxsize=None)
+def register_font():
+    """
+    Разбирает и регистрирует шрифт один раз на процесс.
+
+    Returns:
+        str: Имя зарегистрированного шрифта.
+    """
+    pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH, 'UTF-8'))
+    return FONT_NAME
+
+
+def get_shopping_list(user):
+    """
+    Читает сумму ингредиентов всех рецептов из корзины пользователя.
+
+    Returns:
+        QuerySet[dict]: Строки с названием, единицей измерения и суммой.
+    """
+    return ShoppingListItem.objects.filter(user=user).values(
+        'ingredient__name', 'ingredient__measurement_unit', 'total')
+
+
+def get_recipe_book(recipe_ids):
+    """
+    Читает рецепты для книги вместе с автором и составом.
+
+    Returns:
+        list[Recipe]: Рецепты в порядке `recipe_ids`; удалённые
+        пропускаются.
+    """
+    recipes = Recipe.objects.filter(id__in=recipe_ids).select_related(
+        'author').prefetch_related(Prefetch(
+            'ingredientamount_set',
+            queryset=IngredientAmount.objects.select_related('ingredient')))
+    by_id = {recipe.id: recipe for recipe in recipes}
+    return [by_id[recipe_id] for recipe_id in recipe_ids
+            if recipe_id in by_id]
+
+
+def format_line(number, row):
+    return (f'<{number}> {row.get("ingredient__name")}'
+            + f' - {row.get("total")}, '
+            + f'{row.get("ingredient__measurement_unit")}')
+
+
+def iter_txt(rows):
+    for number, row in enumerate(rows, 1):
+        yield format_line(number, row) + '\n'
+
+
+class _Echo:
+    """Псевдофайл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in rows:
+        yield writer.writerow((row.get('ingredient__name'),
+                               row.get('ingredient__measurement_unit'),
+                               row.get('total')))
+
+
+def render_pdf(rows):
+    """
+    Рисует список покупок с переносом на новые страницы.
+
+    reportlab пишет документ целиком при `save()`, поэтому PDF не
+    отдаётся потоком: он собирается во временном файле, который растёт
+    в памяти только до SPOOL_SIZE.
+
+    Returns:
+        SpooledTemporaryFile: Готовый PDF, прочитанный с начала.
+    """
+    font = register_font()
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    page = canvas.Canvas(buffer)
+    page.setFont(font, size=24)
+    page.drawString(200, PAGE_TOP, 'Список ингредиентов')
+    page.setFont(font, size=16)
+    height = PAGE_TOP - 2 * LINE_HEIGHT
+    for number, row in enumerate(rows, 1):
+        if height < PAGE_BOTTOM:
+            page.showPage()
+            page.setFont(font, size=16)
+            height = PAGE_TOP
+        page.drawString(75, height, format_line(number, row))
+        height -= LINE_HEIGHT
+    page.showPage()
+    page.save()
+    buffer.seek(0)
+    return buffer
+
+
+class _Book:
+    """Холст книги рецептов: строки сверху вниз с переносом страниц."""
+
+    def __init__(self, buffer):
+        self.font = register_font()
+        self.canvas = canvas.Canvas(buffer)
+        self.height = PAGE_TOP
+
+    def new_page(self):
+        self.canvas.showPage()
+        self.height = PAGE_TOP
+
+    def reserve(self, height):
+        if self.height - height < PAGE_BOTTOM:
+            self.new_page()
+
+    def text(self, text, size=12, indent=0):
+        """Пишет абзац, перенося строки по ширине страницы."""
+        width = PAGE_WIDTH - indent
+        for line in simpleSplit(text, self.font, size, width) or ['']:
+            self.reserve(size * 1.4)
+            self.canvas.setFont(self.font, size)
+            self.height -= size * 1.4
+            self.canvas.drawString(PAGE_LEFT + indent, self.height, line)
+
+    def image(self, name):
+        width, height = IMAGE_BOX
+        self.reserve(height + 10)
+        try:
+            with default_storage.open(name, 'rb') as f:
+                reader = ImageReader(io.BytesIO(f.read()))
+        except (OSError, ValueError):
+            # Картинка недоступна: книга собирается без неё
+            return
+        self.height -= height + 10
+        self.canvas.drawImage(reader, PAGE_LEFT, self.height, width, height,
+                              preserveAspectRatio=True, anchor='sw')
+
+
+def _image_name(recipe):
+    variants = recipe.image_variants or {}
+    if variants.get('source') == recipe.image.name:
+        return variants.get('card', {}).get('jpeg', recipe.image.name)
+    return recipe.image.name
+
+
+def render_recipe_book(recipes):
+    """
+    Рисует книгу рецептов: каждый рецепт с новой страницы, с картинкой,
+    составом и описанием. Как и render_pdf, собирает документ во
+    временном файле.
+
+    Returns:
+        SpooledTemporaryFile: Готовый PDF, прочитанный с начала.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    book = _Book(buffer)
+    book.text('Книга рецептов', size=24)
+    for recipe in recipes:
+        book.new_page()
+        book.text(recipe.name, size=20)
+        book.text(f'Автор: {recipe.author.get_full_name()}'
+                  f' ({recipe.author.username}), '
+                  f'{recipe.cooking_time} мин.', size=11)
+        if recipe.image:
+            book.image(_image_name(recipe))
+        book.text('Ингредиенты', size=14)
+        for amount in recipe.ingredientamount_set.all():
+            book.text(f'{amount.ingredient.name} - {amount.amount}, '
+                      f'{amount.ingredient.measurement_unit}', indent=15)
+        book.text('Приготовление', size=14)
+        for paragraph in recipe.text.splitlines():
+            book.text(paragraph)
+    book.canvas.showPage()
+    book.canvas.save()
+    buffer.seek(0)
+    return buffer
+
+
+def spool(chunks):
+    """
+    Пишет куски выгрузки (строки или байты) во временный файл.
+
+    Returns:
+        SpooledTemporaryFile: Файл, прочитанный с начала.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    for chunk in chunks:
+        buffer.write(chunk.encode('utf-8') if isinstance(chunk, str)
+                     else chunk)
+    buffer.seek(0)
+    return buffer
+
+
+# Формат выгрузки: (content type, рендеринг). PDF рендерится в файл,
+# txt и csv — генератором строк
+SHOPPING_LIST_FORMATS = {
+    'pdf': ('application/pdf', render_pdf),
+    'txt': ('text/plain; charset=utf-8', iter_txt),
+    'csv': ('text/csv; charset=utf-8', iter_csv),
+}
+
+
+def shopping_list_response(rows, export_format='pdf'):
+    """
+    Отдаёт список покупок в выбранном формате: txt и csv потоком по
+    мере чтения строк, PDF — готовым файлом кусками по CHUNK_SIZE.
+
+    Returns:
+        StreamingHttpResponse: Файл `shopping_list.<format>`.
+    """
+    content_type, render = SHOPPING_LIST_FORMATS[export_format]
+    content = render(rows)
+    filename = f'shopping_list.{export_format}'
+    if hasattr(content, 'read'):
+        response = FileResponse(content, as_attachment=True,
+                                filename=filename, content_type=content_type)
+        response.block_size = CHUNK_SIZE
+        return response
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,140 @@
+"""
+Лента рецептов авторов, на которых подписан пользователь.
+
+Рецепты раскладываются по лентам подписчиков при публикации (fan-out on
+write): лента читается из TimelineEntry по индексу (user, recipe), сколько
+бы авторов ни было в подписках. При подписке в ленту копируются уже
+опубликованные рецепты автора, при отписке они из неё удаляются.
+
+Авторов, у которых подписчиков или рецептов слишком много для рассылки
+и копирования, помечает AuthorStats.pull_feed: их рецепты читаются при
+запросе ленты по индексу (author, -id) и сливаются с записями ленты
+(fan-out on read). Публикация и подписка, идущие одновременно, могут
+разминуться; такие пропуски исправляет команда rebuild_feeds.
+"""
+import heapq
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, ExpressionWrapper, Q
+
+from api.models import Recipe, TimelineEntry
+from users.models import AuthorStats, Follow
+
+# Рецепты автора с таким числом подписчиков не рассылаются по лентам
+FANOUT_MAX_FOLLOWERS = getattr(settings, 'FEED_FANOUT_MAX_FOLLOWERS', 1000)
+# Рецепты автора с таким числом рецептов не копируются при подписке
+BACKFILL_MAX_RECIPES = getattr(settings, 'FEED_BACKFILL_MAX_RECIPES', 500)
+
+
+def _push_stats(author_id, count_field, limit):
+    """
+    Returns:
+        bool: Рецепты автора по-прежнему раскладываются по лентам;
+        если `count_field` дорос до `limit`, автор переводится на
+        чтение при запросе.
+    """
+    stats, _ = AuthorStats.objects.get_or_create(user_id=author_id)
+    if stats.pull_feed:
+        return False
+    if getattr(stats, count_field) >= limit:
+        AuthorStats.objects.filter(user_id=author_id).update(pull_feed=True)
+        return False
+    return True
+
+
+def publish(recipe, batch_size=1000):
+    """Раскладывает новый рецепт по лентам подписчиков автора."""
+    if not _push_stats(recipe.author_id, 'followers_count',
+                       FANOUT_MAX_FOLLOWERS):
+        return
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, recipe_id=recipe.id,
+                       author_id=recipe.author_id)
+         for user_id in Follow.objects.filter(
+            author_id=recipe.author_id).values_list('user_id', flat=True)],
+        batch_size=batch_size, ignore_conflicts=True)
+
+
+def follow(user_id, author_id, batch_size=1000):
+    """Копирует опубликованные рецепты автора в ленту подписчика."""
+    if not _push_stats(author_id, 'recipes_count', BACKFILL_MAX_RECIPES):
+        return
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                       author_id=author_id)
+         for recipe_id in Recipe.objects.filter(
+            author_id=author_id).values_list('id', flat=True)],
+        batch_size=batch_size, ignore_conflicts=True)
+
+
+def unfollow(user_id, author_id):
+    """Убирает рецепты автора из ленты бывшего подписчика."""
+    TimelineEntry.objects.filter(user_id=user_id,
+                                 author_id=author_id).delete()
+
+
+def page(user_id, before=None, limit=6):
+    """
+    Выбирает страницу ленты по ключу: рецепты с id меньше `before`.
+
+    Returns:
+        list[int]: До `limit` id рецептов по убыванию.
+    """
+    entries = TimelineEntry.objects.filter(user_id=user_id)
+    if before is not None:
+        entries = entries.filter(recipe_id__lt=before)
+    sources = [list(entries.order_by('-recipe_id').values_list(
+        'recipe_id', flat=True)[:limit])]
+    pulled = list(Follow.objects.filter(
+        user_id=user_id, author__author_stats__pull_feed=True).values_list(
+        'author_id', flat=True))
+    if pulled:
+        recipes = Recipe.objects.filter(author_id__in=pulled)
+        if before is not None:
+            recipes = recipes.filter(id__lt=before)
+        sources.append(list(recipes.order_by('-id').values_list(
+            'id', flat=True)[:limit]))
+    recipe_ids = []
+    # Записи, оставшиеся с тех пор, как автор ещё рассылал рецепты,
+    # совпадают с прочитанными напрямую
+    for recipe_id in heapq.merge(*sources, reverse=True):
+        if not recipe_ids or recipe_ids[-1] != recipe_id:
+            recipe_ids.append(recipe_id)
+    return recipe_ids[:limit]
+
+
+def rebuild(batch_size=1000):
+    """
+    Заново расставляет AuthorStats.pull_feed по порогам и заполняет
+    ленты подписчиков остальных авторов.
+
+    Returns:
+        int: Число записей в лентах.
+    """
+    with transaction.atomic():
+        AuthorStats.objects.update(pull_feed=ExpressionWrapper(
+            Q(followers_count__gte=FANOUT_MAX_FOLLOWERS)
+            | Q(recipes_count__gte=BACKFILL_MAX_RECIPES),
+            output_field=BooleanField()))
+        TimelineEntry.objects.all().delete()
+        recipes = defaultdict(list)
+        for author_id, recipe_id in Recipe.objects.exclude(
+                author__author_stats__pull_feed=True).values_list(
+                'author_id', 'id').order_by():
+            recipes[author_id].append(recipe_id)
+        batch, count = [], 0
+        for user_id, author_id in Follow.objects.filter(
+                author_id__in=recipes).values_list(
+                'user_id', 'author_id').order_by().iterator():
+            batch.extend(
+                TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                              author_id=author_id)
+                for recipe_id in recipes[author_id])
+            if len(batch) >= batch_size:
+                TimelineEntry.objects.bulk_create(batch, batch_size)
+                count += len(batch)
+                batch = []
+        TimelineEntry.objects.bulk_create(batch, batch_size)
+    return count + len(batch)
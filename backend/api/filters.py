@@ -1,43 +1,45 @@
-from enum import Enum
-
 from django.contrib.auth import get_user_model
+from django_filters.constants import EMPTY_VALUES
 from django_filters.rest_framework import FilterSet, filters
-from rest_framework.filters import SearchFilter
 
+from api import fulltext
 from api.models import Recipe
+from api.tags import filter_by_tags
+from api.utils import UrlQueries
 
 User = get_user_model()
 
 
-class UrlQueries(str, Enum):
-    # Параметр для поиска ингредиентов по вхождению значения в название
-    SEARCH_ING_NAME = 'name'
-    # Параметр для поиска объектов в списке "избранное"
-    FAVORITE = 'is_favorited'
-    # Параметр для поиска объектов в списке "покупки"
-    SHOP_CART = 'is_in_shopping_cart'
-    # Параметр для поиска объектов по автору
-    AUTHOR = 'author'
-    # Параметр для поиска объектов по тэгам
-    TAGS = 'tags'
-
+class StableOrderingFilter(filters.OrderingFilter):
+    """
+    Сортировка, в которой последним ключом идёт `-id`: рецепты с равными
+    счётчиками не переставляются между страницами.
+    """
 
-class IngredientSearchFilter(SearchFilter):
-    search_param = 'name'
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        qs = super().filter(qs, value)
+        return qs.order_by(*qs.query.order_by, '-id')
 
 
 class AuthorAndTagFilter(FilterSet):
-    tags = filters.BooleanFilter(method='filter_tags')
+    search = filters.CharFilter(method='filter_search')
+    ordering = StableOrderingFilter(
+        fields=('favorites_count', 'in_carts_count'))
+    tags = filters.CharFilter(method='filter_tags')
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
 
     def filter_tags(self, queryset, name, value):
-        if value and not self.request.user.is_anonymous:
-            tags = self.request.query_params.getlist(UrlQueries.TAGS.value)
-            return queryset.filter(tags__slug__in=tags)
-        return queryset
+        tags = self.request.query_params.getlist(UrlQueries.TAGS.value)
+        match = self.request.query_params.get(UrlQueries.TAGS_MATCH.value)
+        return filter_by_tags(queryset, tags, match_all=match == 'all')
+
+    def filter_search(self, queryset, name, value):
+        return fulltext.search(queryset, value)
 
     def filter_is_favorited(self, queryset, name, value):
         if value and not self.request.user.is_anonymous:
@@ -51,4 +53,4 @@ class AuthorAndTagFilter(FilterSet):
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author')
+        fields = ('search', 'tags', 'author', 'ordering')
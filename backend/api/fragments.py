@@ -0,0 +1,97 @@
+import copy
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from api.metrics import timed
+from api.models import IngredientAmount, Recipe
+from api.serializers import RecipeSerializer
+from api.viewer import get_viewer
+
+# Время жизни закешированного представления рецепта, секунды
+FRAGMENT_TIMEOUT = getattr(settings, 'RECIPE_FRAGMENT_TIMEOUT', 3600)
+
+
+def fragment_key(recipe_id, version):
+    return f'recipe-fragment:{recipe_id}:{version}'
+
+
+def ingredient_amounts():
+    """
+    Returns:
+        QuerySet[IngredientAmount]: Состав рецептов для prefetch вместе
+        с ингредиентами.
+    """
+    return IngredientAmount.objects.select_related('ingredient')
+
+
+def plan_queryset(queryset):
+    """
+    Подгружает всё, что нужно RecipeSerializer, фиксированным числом
+    запросов: автора, теги и ингредиенты.
+
+    Returns:
+        QuerySet[Recipe]: Queryset с select_related/prefetch_related.
+    """
+    return queryset.select_related('author').prefetch_related(
+        'tags',
+        Prefetch('ingredientamount_set', queryset=ingredient_amounts()),
+    )
+
+
+def render_fragments(rows):
+    """
+    Возвращает общие для всех пользователей представления рецептов.
+
+    Args:
+        rows (list[dict]): Строки `{'id', 'version'}` в нужном порядке.
+
+    Returns:
+        list[dict]: Представления без пользовательских флагов и с
+        относительными ссылками на картинки.
+    """
+    keys = {fragment_key(row['id'], row['version']): row['id']
+            for row in rows}
+    fragments = {keys[key]: value
+                 for key, value in cache.get_many(keys).items()}
+    missing = [row['id'] for row in rows if row['id'] not in fragments]
+    if missing:
+        recipes = plan_queryset(Recipe.objects.filter(id__in=missing))
+        fresh = {}
+        for recipe in recipes:
+            fragment = RecipeSerializer(recipe).data
+            fragments[recipe.id] = fragment
+            fresh[fragment_key(recipe.id, recipe.version)] = fragment
+        cache.set_many(fresh, FRAGMENT_TIMEOUT)
+    return [fragments[row['id']] for row in rows if row['id'] in fragments]
+
+
+def overlay(fragment, request):
+    """
+    Дополняет общее представление флагами текущего пользователя.
+
+    Returns:
+        dict: Представление рецепта для ответа на запрос.
+    """
+    viewer = get_viewer(request)
+    data = copy.copy(fragment)
+    data['author'] = dict(fragment['author'])
+    data['is_favorited'] = viewer.is_favorited(data['id'])
+    data['is_in_shopping_cart'] = viewer.is_in_shopping_cart(data['id'])
+    data['author']['is_subscribed'] = viewer.is_subscribed(
+        data['author']['id'])
+    if data.get('image'):
+        data['image'] = request.build_absolute_uri(data['image'])
+    data['image_variants'] = {
+        variant: {image_format: request.build_absolute_uri(url)
+                  for image_format, url in formats.items()}
+        for variant, formats in fragment.get('image_variants', {}).items()
+    }
+    return data
+
+
+def render_recipes(rows, request):
+    with timed('serialize'):
+        return [overlay(fragment, request)
+                for fragment in render_fragments(rows)]
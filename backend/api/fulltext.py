@@ -0,0 +1,146 @@
+"""
+Полнотекстовый поиск рецептов по названию, ингредиентам и описанию.
+
+Индекс — отдельная таблица api_recipesearch, которую создаёт миграция
+0011: на PostgreSQL это tsvector с GIN-индексом, на SQLite —
+виртуальная таблица FTS5 (rowid = id рецепта). Документ рецепта
+пересчитывается одним INSERT ... SELECT при сохранении рецепта или его
+ингредиентов, после коммита транзакции. На других СУБД поиск сводится
+к icontains по названию и описанию без ранжирования.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from api.models import Recipe
+
+TABLE = 'api_recipesearch'
+# Конфигурация разбора текста PostgreSQL: стемминг русских слов
+SEARCH_CONFIG = getattr(settings, 'RECIPE_SEARCH_CONFIG', 'russian')
+# Веса полей в bm25 SQLite: название, ингредиенты, описание
+FTS5_WEIGHTS = '10.0, 4.0, 1.0'
+
+WORD = re.compile(r'\w+')
+
+_DOCUMENTS = """
+    SELECT r.id, r.name, COALESCE({aggregate}(i.name, ' '), '') AS
+           ingredients, r.text
+    FROM api_recipe r
+    LEFT JOIN api_ingredientamount ia ON ia.recipe_id = r.id
+    LEFT JOIN api_ingredient i ON i.id = ia.ingredient_id
+    WHERE r.id IN ({ids})
+    GROUP BY r.id, r.name, r.text
+"""
+
+_POSTGRESQL_INSERT = f"""
+    INSERT INTO {TABLE} (recipe_id, document)
+    SELECT d.id,
+           setweight(to_tsvector(%s::regconfig, d.name), 'A')
+           || setweight(to_tsvector(%s::regconfig, d.ingredients), 'B')
+           || setweight(to_tsvector(%s::regconfig, d.text), 'C')
+    FROM ({{documents}}) d
+    ON CONFLICT (recipe_id) DO UPDATE SET document = EXCLUDED.document
+"""
+
+
+def supported():
+    return connection.vendor in ('postgresql', 'sqlite')
+
+
+def _words(query):
+    return WORD.findall(query.casefold())
+
+
+def index_recipes(recipe_ids):
+    """
+    Пересчитывает документы рецептов; удалённые рецепты убирает из
+    индекса.
+    """
+    recipe_ids = [int(pk) for pk in recipe_ids]
+    if not recipe_ids or not supported():
+        return
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    key = 'recipe_id' if connection.vendor == 'postgresql' else 'rowid'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {TABLE} WHERE {key} IN ({placeholders})',
+            recipe_ids)
+        if connection.vendor == 'postgresql':
+            documents = _DOCUMENTS.format(ids=placeholders,
+                                          aggregate='STRING_AGG')
+            cursor.execute(_POSTGRESQL_INSERT.format(documents=documents),
+                           [SEARCH_CONFIG] * 3 + recipe_ids)
+        else:
+            documents = _DOCUMENTS.format(ids=placeholders,
+                                          aggregate='GROUP_CONCAT')
+            cursor.execute(
+                f'INSERT INTO {TABLE} (rowid, name, ingredients, text) '
+                f'SELECT id, name, ingredients, text FROM ({documents})',
+                recipe_ids)
+
+
+def schedule(recipe_ids):
+    """Пересчитывает документы рецептов после коммита транзакции."""
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(lambda: index_recipes(recipe_ids))
+
+
+def rebuild(batch_size=1000):
+    """
+    Returns:
+        int: Число проиндексированных рецептов.
+    """
+    ids = list(Recipe.objects.values_list('id', flat=True))
+    with transaction.atomic():
+        if supported():
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {TABLE}')
+        for start in range(0, len(ids), batch_size):
+            index_recipes(ids[start:start + batch_size])
+    return len(ids)
+
+
+def search(queryset, query):
+    """
+    Оставляет рецепты, подходящие под запрос, и сортирует их по
+    релевантности: сначала совпадения в названии, затем в ингредиентах
+    и описании. Каждое слово запроса ищется как префикс.
+
+    Returns:
+        QuerySet[Recipe]: Queryset с аннотацией `search_rank`.
+    """
+    words = _words(query)
+    if not words:
+        return queryset
+    if connection.vendor == 'postgresql':
+        condition = 'document @@ to_tsquery(%s::regconfig, %s)'
+        params = [SEARCH_CONFIG, ' & '.join(f'{word}:*' for word in words)]
+        rank = 'ts_rank(document, to_tsquery(%s::regconfig, %s))'
+        rank_params = params
+        key = 'recipe_id'
+    elif connection.vendor == 'sqlite':
+        condition = f'{TABLE} MATCH %s'
+        params = [' '.join(f'"{word}"*' for word in words)]
+        # bm25 тем меньше, чем лучше совпадение; считается только в
+        # запросе с MATCH
+        rank = f'-bm25({TABLE}, {FTS5_WEIGHTS})'
+        rank_params = []
+        key = 'rowid'
+    else:
+        condition = Q()
+        for word in words:
+            condition &= Q(name__icontains=word) | Q(text__icontains=word)
+        return queryset.filter(condition)
+    found = RawSQL(f'SELECT {key} FROM {TABLE} WHERE {condition}', params)
+    # Ранг считается только для найденных рецептов, по ключу индекса.
+    # bm25 в SQLite доступен лишь рядом с MATCH, поэтому условие
+    # повторяется в подзапросе ранга
+    search_rank = RawSQL(
+        f'SELECT {rank} FROM {TABLE} WHERE {condition} '
+        f'AND {TABLE}.{key} = {Recipe._meta.db_table}.id',
+        rank_params + params, output_field=FloatField())
+    return queryset.filter(id__in=found).annotate(
+        search_rank=search_rank).order_by('-search_rank', '-id')
@@ -0,0 +1,123 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import F
+from PIL import Image
+
+from api.models import Recipe
+from api.utils import Tuples
+from api.versions import bump_model
+
+logger = logging.getLogger(__name__)
+
+# Вариант картинки: предельный размер (ширина, высота)
+VARIANTS = {
+    'thumb': Tuples.RECIPE_THUMB_SIZE.value,
+    'card': Tuples.RECIPE_IMAGE_SIZE.value,
+    'full': Tuples.RECIPE_FULL_SIZE.value,
+}
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+QUALITY = 82
+VARIANTS_DIR = 'recipes/variants'
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'IMAGE_WORKERS', 2),
+    thread_name_prefix='recipe-images',
+)
+
+
+def variant_name(source, variant, image_format):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return (f'{VARIANTS_DIR}/{stem}_{variant}.'
+            f'{EXTENSIONS[image_format]}')
+
+
+def build_variants(source):
+    """
+    Декодирует оригинал один раз и сохраняет все варианты картинки.
+
+    Returns:
+        dict: {'source': source, variant: {format: имя файла}}.
+    """
+    with default_storage.open(source, 'rb') as f:
+        original = Image.open(f)
+        original.load()
+    if original.mode not in ('RGB', 'L'):
+        background = Image.new('RGB', original.size, (255, 255, 255))
+        rgba = original.convert('RGBA')
+        background.paste(rgba, mask=rgba.split()[-1])
+        original = background
+    variants = {'source': source}
+    for variant, size in VARIANTS.items():
+        image = original.copy()
+        image.thumbnail(size, Image.LANCZOS)
+        variants[variant] = {}
+        for image_format in Tuples.RECIPE_IMAGE_FORMATS.value:
+            buffer = io.BytesIO()
+            image.save(buffer, image_format, quality=QUALITY,
+                       optimize=True)
+            name = variant_name(source, variant, image_format)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            variants[variant][image_format.lower()] = default_storage.save(
+                name, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def save_variants(recipe_id, source, variants):
+    """
+    Сохраняет варианты у рецепта, если его картинка всё ещё `source`.
+
+    update() не шлёт сигналов, поэтому счётчик изменений рецептов
+    (ETag списка) поднимается здесь.
+
+    Returns:
+        bool: Варианты сохранены.
+    """
+    if not Recipe.objects.filter(pk=recipe_id, image=source).update(
+            image_variants=variants, version=F('version') + 1):
+        return False
+    bump_model(Recipe)
+    return True
+
+
+def process_recipe_image(recipe_id, source):
+    """
+    Строит варианты картинки и сохраняет их у рецепта, если картинка
+    не успела смениться, пока шла обработка.
+    """
+    try:
+        save_variants(recipe_id, source, build_variants(source))
+    except Exception:
+        logger.exception('Не удалось обработать картинку %s', source)
+    finally:
+        connection.close()
+
+
+def schedule_variants(recipe_id, source):
+    """Ставит обработку картинки в очередь пула потоков."""
+    return _executor.submit(process_recipe_image, recipe_id, source)
+
+
+def variant_urls(recipe):
+    """
+    Returns:
+        dict: {variant: {format: url}} или пустой словарь, пока варианты
+        не построены.
+    """
+    variants = recipe.image_variants or {}
+    if not recipe.image or variants.get('source') != recipe.image.name:
+        return {}
+    return {
+        variant: {
+            image_format: default_storage.url(name)
+            for image_format, name in variants[variant].items()
+        }
+        for variant in VARIANTS if variant in variants
+    }
@@ -0,0 +1,306 @@
+"""
+Фоновые выгрузки: очередь заданий в таблице ExportJob.
+
+Представление только снимает входные данные и ставит задание в очередь;
+файл рендерит воркер (команда run_export_worker) — отдельный процесс с
+несколькими потоками, брокер сообщений не нужен. Воркер берёт задание
+условным UPDATE по статусу, поэтому два воркера не возьмут одно задание
+и на базе без SELECT ... FOR UPDATE SKIP LOCKED. Взятое задание
+арендуется на EXPORT_JOB_TIMEOUT секунд: если воркер упал, задание
+возьмёт другой.
+
+Файл результата называется по хешу входных данных: повторная выгрузка
+того же списка покупок или тех же рецептов не рендерится заново, а
+ссылается на готовый файл. Через EXPORT_RESULT_TTL секунд задание
+истекает; файл удаляется, когда на него не ссылается ни одно живое
+задание.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import (DatabaseError, close_old_connections, connection,
+                       transaction)
+from django.db.models import F, Q
+from django.utils import timezone
+
+from api.exports import (SHOPPING_LIST_FORMATS, get_recipe_book,
+                         get_shopping_list, render_recipe_book, spool)
+from api.models import ExportJob, Favorite
+
+logger = logging.getLogger(__name__)
+
+RESULT_TTL = getattr(settings, 'EXPORT_RESULT_TTL', 24 * 60 * 60)
+MAX_ATTEMPTS = getattr(settings, 'EXPORT_MAX_ATTEMPTS', 3)
+RETRY_DELAY = getattr(settings, 'EXPORT_RETRY_DELAY', 30)
+JOB_TIMEOUT = getattr(settings, 'EXPORT_JOB_TIMEOUT', 600)
+MAX_RUNNING = getattr(settings, 'EXPORT_MAX_RUNNING', 4)
+USER_ACTIVE_JOBS = getattr(settings, 'EXPORT_USER_ACTIVE_JOBS', 3)
+WORKER_THREADS = getattr(settings, 'EXPORT_WORKER_THREADS', 2)
+POLL_INTERVAL = getattr(settings, 'EXPORT_POLL_INTERVAL', 2)
+# Как часто воркер удаляет истёкшие задания, секунды
+PURGE_INTERVAL = 60
+RESULTS_DIR = 'exports'
+
+ACTIVE = (ExportJob.PENDING, ExportJob.RUNNING)
+
+
+class TooManyJobs(Exception):
+    """У пользователя уже EXPORT_USER_ACTIVE_JOBS незавершённых заданий."""
+
+
+def _shopping_list_payload(user):
+    return {'rows': list(get_shopping_list(user))}
+
+
+def _recipe_book_payload(user):
+    # Версия рецепта входит в хеш: изменённый рецепт рендерится заново
+    return {'recipes': [
+        list(row) for row in Favorite.objects.filter(user=user).values_list(
+            'recipe_id', 'recipe__version')]}
+
+
+def _render_shopping_list(export_format, payload):
+    _, render = SHOPPING_LIST_FORMATS[export_format]
+    content = render(payload['rows'])
+    return content if hasattr(content, 'read') else spool(content)
+
+
+def _render_recipe_book(export_format, payload):
+    return render_recipe_book(get_recipe_book(
+        [recipe_id for recipe_id, _ in payload['recipes']]))
+
+
+# Вид выгрузки: (форматы, снимок входных данных, рендеринг во временный
+# файл)
+EXPORTS = {
+    ExportJob.SHOPPING_LIST: (tuple(SHOPPING_LIST_FORMATS),
+                              _shopping_list_payload, _render_shopping_list),
+    ExportJob.RECIPE_BOOK: (('pdf',), _recipe_book_payload,
+                            _render_recipe_book),
+}
+
+
+def formats(kind):
+    return EXPORTS[kind][0]
+
+
+def content_type(export_format):
+    return SHOPPING_LIST_FORMATS[export_format][0]
+
+
+def filename(job):
+    return f'{job.kind}.{job.export_format}'
+
+
+def input_hash(kind, export_format, payload):
+    data = json.dumps([kind, export_format, payload], sort_keys=True,
+                      ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def submit(user, kind, export_format):
+    """
+    Ставит выгрузку в очередь.
+
+    Returns:
+        tuple[ExportJob, bool]: Задание и признак, что оно создано; если
+        у пользователя уже есть живое задание с теми же входными
+        данными, возвращается оно.
+
+    Raises:
+        TooManyJobs: Слишком много незавершённых заданий пользователя.
+    """
+    payload = EXPORTS[kind][1](user)
+    digest = input_hash(kind, export_format, payload)
+    now = timezone.now()
+    live = ExportJob.objects.filter(input_hash=digest).filter(
+        Q(status__in=ACTIVE) | Q(status=ExportJob.DONE, expires_at__gt=now))
+    existing = live.filter(user=user).first()
+    if existing is not None:
+        return existing, False
+    if ExportJob.objects.filter(
+            user=user, status__in=ACTIVE).count() >= USER_ACTIVE_JOBS:
+        raise TooManyJobs
+    job = ExportJob(user=user, kind=kind, export_format=export_format,
+                    payload=payload, input_hash=digest, run_after=now)
+    done = live.filter(status=ExportJob.DONE).first()
+    if done is not None and default_storage.exists(done.result):
+        # Такой файл уже отрендерен для другого задания
+        job.status = ExportJob.DONE
+        job.result = done.result
+        job.finished_at = now
+        job.expires_at = now + timedelta(seconds=RESULT_TTL)
+    job.save()
+    return job, True
+
+
+def requeue(job):
+    """Возвращает в очередь готовое задание, файл которого пропал."""
+    ExportJob.objects.filter(pk=job.pk, status=ExportJob.DONE).update(
+        status=ExportJob.PENDING, result='', attempts=0,
+        run_after=timezone.now(), finished_at=None, expires_at=None)
+
+
+def claim():
+    """
+    Берёт следующее задание: ожидающее или брошенное упавшим воркером.
+
+    Returns:
+        ExportJob | None: Задание со статусом RUNNING или None, если
+        очередь пуста или уже выполняется EXPORT_MAX_RUNNING заданий.
+    """
+    while True:
+        now = timezone.now()
+        if ExportJob.objects.filter(status=ExportJob.RUNNING,
+                                    locked_until__gte=now).count() \
+                >= MAX_RUNNING:
+            return None
+        with transaction.atomic():
+            job = ExportJob.objects.select_for_update(
+                skip_locked=True).filter(
+                Q(status=ExportJob.PENDING, run_after__lte=now)
+                | Q(status=ExportJob.RUNNING, locked_until__lt=now)
+            ).order_by('run_after', 'id').first()
+            if job is None:
+                return None
+            claimed = ExportJob.objects.filter(
+                pk=job.pk, status=job.status, attempts=job.attempts).update(
+                status=ExportJob.RUNNING, attempts=F('attempts') + 1,
+                locked_until=now + timedelta(seconds=JOB_TIMEOUT))
+        if claimed:
+            job.refresh_from_db()
+            return job
+        # Задание перехватил другой воркер: берём следующее
+
+
+def _render(job):
+    name = f'{RESULTS_DIR}/{job.input_hash}.{job.export_format}'
+    if default_storage.exists(name):
+        return name
+    with EXPORTS[job.kind][2](job.export_format, job.payload) as content:
+        return default_storage.save(name, File(content))
+
+
+def process(job):
+    """
+    Рендерит файл задания; при ошибке ставит задание на повтор с
+    растущей паузой, после EXPORT_MAX_ATTEMPTS попыток — FAILED.
+
+    Returns:
+        str: Итоговый статус задания.
+    """
+    mine = ExportJob.objects.filter(pk=job.pk, status=ExportJob.RUNNING,
+                                    attempts=job.attempts)
+    try:
+        if job.attempts > MAX_ATTEMPTS:
+            raise TimeoutError('Воркер не завершил задание')
+        result = _render(job)
+    except Exception as error:
+        logger.exception('Выгрузка %s не удалась', job)
+        now = timezone.now()
+        if job.attempts < MAX_ATTEMPTS:
+            mine.update(status=ExportJob.PENDING, error=str(error),
+                        locked_until=None, run_after=now + timedelta(
+                            seconds=RETRY_DELAY * 2 ** (job.attempts - 1)))
+            return ExportJob.PENDING
+        mine.update(status=ExportJob.FAILED, error=str(error),
+                    locked_until=None, finished_at=now,
+                    expires_at=now + timedelta(seconds=RESULT_TTL))
+        return ExportJob.FAILED
+    now = timezone.now()
+    mine.update(status=ExportJob.DONE, result=result, error='',
+                locked_until=None, finished_at=now,
+                expires_at=now + timedelta(seconds=RESULT_TTL))
+    return ExportJob.DONE
+
+
+def purge():
+    """
+    Удаляет истёкшие задания и файлы, на которые больше никто не
+    ссылается.
+
+    Returns:
+        int: Число удалённых заданий.
+    """
+    expired = ExportJob.objects.filter(expires_at__lt=timezone.now())
+    names = set(expired.exclude(result='').values_list('result', flat=True))
+    count, _ = expired.delete()
+    names -= set(ExportJob.objects.filter(result__in=names).values_list(
+        'result', flat=True))
+    for name in names:
+        default_storage.delete(name)
+    return count
+
+
+def run_next():
+    """
+    Returns:
+        str | None: Итоговый статус выполненного задания; None, если
+        очередь пуста или недоступна.
+    """
+    try:
+        job = claim()
+        return job and process(job)
+    except DatabaseError:
+        # Задание, которое не удалось закрыть, вернётся в очередь по
+        # истечении аренды
+        logger.exception('Ошибка очереди выгрузок')
+        return None
+
+
+def _serve(stop, once, poll_interval, outcomes, lock):
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            outcome = run_next()
+            if outcome is None:
+                if once:
+                    return
+                stop.wait(poll_interval)
+                continue
+            with lock:
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    finally:
+        connection.close()
+
+
+def work(threads=WORKER_THREADS, once=False, stop=None,
+         poll_interval=POLL_INTERVAL):
+    """
+    Выполняет задания в `threads` потоках, пока не выставлен `stop`;
+    с `once` — пока очередь не опустеет.
+
+    Returns:
+        dict: {статус: число заданий}, с которыми закончили потоки.
+    """
+    stop = stop or threading.Event()
+    outcomes = {}
+    lock = threading.Lock()
+    workers = [threading.Thread(
+        target=_serve, args=(stop, once, poll_interval, outcomes, lock),
+        name=f'export-{number}') for number in range(threads)]
+    for worker in workers:
+        worker.start()
+    purged = None
+    try:
+        while any(worker.is_alive() for worker in workers):
+            if purged is None or time.monotonic() - purged > PURGE_INTERVAL:
+                try:
+                    purge()
+                except DatabaseError:
+                    logger.exception('Не удалось удалить истёкшие выгрузки')
+                close_old_connections()
+                purged = time.monotonic()
+            stop.wait(poll_interval)
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+    return outcomes
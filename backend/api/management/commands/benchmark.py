@@ -0,0 +1,69 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import compare, run, uncovered_routes
+
+
+class Command(BaseCommand):
+    help = 'benchmarking api endpoints: query count, db time and latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', default=20, type=int)
+        parser.add_argument('--warmup', default=3, type=int)
+        parser.add_argument('--only', action='append', default=[],
+                            help='замерять только сценарии с этим именем')
+        parser.add_argument('--output', help='файл для JSON-отчёта')
+        parser.add_argument('--compare', help='отчёт предыдущего прогона')
+        parser.add_argument('--threshold', default=20, type=float,
+                            help='допустимый рост p95, проценты')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        for name in uncovered_routes():
+            self.stderr.write(f'Маршрут без сценария: {name}')
+        try:
+            report = run(options['iterations'], options['warmup'],
+                         only=options['only'])
+        except ValueError as error:
+            raise CommandError(error)
+        self.stdout.write(
+            f'{"endpoint":<28}{"method":>7}{"status":>10}{"queries":>9}'
+            f'{"db ms":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}')
+        failed = []
+        for name, row in report['endpoints'].items():
+            statuses = ','.join(map(str, row['statuses']))
+            line = (f'{name:<28}{row["method"]:>7}{statuses:>10}'
+                    f'{row["queries"]:>9}{row["db_ms"]:>9.2f}'
+                    f'{row["p50_ms"]:>9.2f}{row["p95_ms"]:>9.2f}'
+                    f'{row["p99_ms"]:>9.2f}')
+            if not row['ok']:
+                failed.append(name)
+                line = self.style.ERROR(f'{line}  ошибка')
+            self.stdout.write(line)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Отчёт сохранён в {options["output"]}')
+        if options['compare']:
+            self.compare(options, report)
+        if failed:
+            raise CommandError(
+                f'Ответы не 2xx/3xx: {", ".join(failed)}')
+
+    def compare(self, options, report):
+        with open(options['compare'], encoding='utf-8') as f:
+            previous = json.load(f)
+        regressions = 0
+        self.stdout.write(f'\nСравнение с {options["compare"]}:')
+        for name, old, new, regression in compare(
+                previous, report, options['threshold']):
+            line = (f'{name:<28} queries {old["queries"]} -> '
+                    f'{new["queries"]}, p95 {old["p95_ms"]:.2f} -> '
+                    f'{new["p95_ms"]:.2f} ms')
+            if regression:
+                regressions += 1
+                line = self.style.ERROR(f'{line}  регрессия')
+            self.stdout.write(line)
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'Регрессий: {regressions}')
@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import throughput
+
+MODES = ('wsgi', 'asgi')
+
+
+class Command(BaseCommand):
+    help = 'comparing concurrent-request throughput of WSGI and ASGI modes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=(*MODES, 'compare'),
+                            default='compare')
+        parser.add_argument('--concurrency', default=16, type=int,
+                            help='одновременных клиентов')
+        parser.add_argument('--duration', default=10, type=float,
+                            help='длительность замера, секунды')
+        parser.add_argument('--workers', default=1, type=int,
+                            help='синхронных воркеров в режиме wsgi')
+        parser.add_argument('--db-latency-ms', default=0, type=float,
+                            help='пауза перед каждым SQL-запросом')
+        parser.add_argument('--json', action='store_true',
+                            help='вывести отчёт одной строкой JSON')
+        parser.add_argument('--output', help='файл для JSON-отчёта')
+
+    def handle(self, *args, **options):
+        if options['mode'] == 'compare':
+            reports = [self.spawn(mode, options) for mode in MODES]
+        else:
+            reports = [self.measure(options['mode'], options)]
+        if options['json']:
+            self.stdout.write(json.dumps(reports))
+            return
+        self.stdout.write(
+            f'{"mode":<6}{"clients":>9}{"workers":>9}{"requests":>10}'
+            f'{"errors":>8}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}'
+            f'{"p99 ms":>10}')
+        for row in reports:
+            self.stdout.write(
+                f'{row["mode"]:<6}{row["concurrency"]:>9}'
+                f'{row["workers"] or "-":>9}{row["requests"]:>10}'
+                f'{row["errors"]:>8}{row["rps"]:>10.1f}'
+                f'{row["p50_ms"]:>10.2f}{row["p95_ms"]:>10.2f}'
+                f'{row["p99_ms"]:>10.2f}')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(reports, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Отчёт сохранён в {options["output"]}')
+
+    def measure(self, mode, options):
+        if (mode == 'asgi') != settings.ASYNC_VIEWS:
+            raise CommandError(
+                f'Режим {mode} замеряется с ASYNC_VIEWS='
+                f'{"true" if mode == "asgi" else "false"}')
+        try:
+            return throughput.run(
+                mode, options['concurrency'], options['duration'],
+                options['workers'], options['db_latency_ms'] / 1000)
+        except ValueError as error:
+            raise CommandError(error)
+
+    def spawn(self, mode, options):
+        """Замеряет режим в отдельном процессе с нужным ASYNC_VIEWS."""
+        env = {**os.environ,
+               'ASYNC_VIEWS': 'true' if mode == 'asgi' else 'false'}
+        command = [
+            sys.executable, '-m', 'django', 'benchmark_throughput',
+            '--mode', mode, '--json',
+            '--concurrency', str(options['concurrency']),
+            '--duration', str(options['duration']),
+            '--workers', str(options['workers']),
+            '--db-latency-ms', str(options['db_latency_ms']),
+        ]
+        self.stderr.write(f'Замер {mode}...')
+        result = subprocess.run(command, env=env, cwd=settings.BASE_DIR,
+                                capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(f'Замер {mode} не удался:\n{result.stderr}')
+        return json.loads(result.stdout.strip().splitlines()[-1])[0]
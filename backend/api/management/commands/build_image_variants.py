@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from api.images import build_variants, save_variants
+from api.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'building resized variants for recipe images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='перестроить и уже готовые варианты')
+
+    def handle(self, *args, **options):
+        built = 0
+        for recipe in Recipe.objects.exclude(image='').only(
+                'id', 'image', 'image_variants').iterator():
+            source = recipe.image.name
+            if (not options['force']
+                    and recipe.image_variants.get('source') == source):
+                continue
+            try:
+                variants = build_variants(source)
+            except (OSError, ValueError) as error:
+                self.stderr.write(f'{source}: {error}')
+                continue
+            if save_variants(recipe.pk, source, variants):
+                built += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {built}'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.query_plans import check_plans
+
+
+class Command(BaseCommand):
+    help = 'checking EXPLAIN plans of hot queries for sequential scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help='печатать планы всех запросов')
+
+    def handle(self, *args, **options):
+        try:
+            results = check_plans()
+        except LookupError as error:
+            raise CommandError(error)
+        failed = 0
+        for result in results:
+            status = 'ok' if result.ok else 'SEQ SCAN'
+            self.stdout.write(
+                f'[{status}] {result.query.name} ({result.query.table})')
+            if not result.ok or options['verbose_plans']:
+                self.stdout.write(result.plan)
+            failed += not result.ok
+        if failed:
+            raise CommandError(
+                f'Последовательное сканирование в {failed} запросах')
+        self.stdout.write(self.style.SUCCESS('Все планы используют индексы'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import shopping_list
+
+
+class Command(BaseCommand):
+    help = 'checking per-user shopping list aggregates for drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', dest='users', action='append',
+                            type=int, help='id пользователя (можно несколько)')
+        parser.add_argument('--fix', action='store_true',
+                            help='пересобрать списки с расхождениями')
+
+    def handle(self, *args, **options):
+        drift = shopping_list.find_drift(options['users'])
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+            return
+        for user_id, ingredient_id, stored, expected in drift:
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id} '
+                f'stored={stored} expected={expected}')
+        if options['fix']:
+            user_ids = sorted({user_id for user_id, *_ in drift})
+            shopping_list.rebuild(user_ids)
+            self.stdout.write(self.style.SUCCESS(
+                f'Пересобраны списки пользователей: {len(user_ids)}'))
+            return
+        raise CommandError(f'Найдено расхождений: {len(drift)}')
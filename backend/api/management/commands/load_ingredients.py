@@ -1,36 +1,150 @@
+import csv
+import io
 import json
 import os
+from itertools import islice
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from django.db.utils import IntegrityError
+from django.db import connection, transaction
 
 from api.models import Ingredient
+from api.search import ingredient_index
+from api.versions import bump_model
 
 DATA_ROOT = os.path.join(settings.BASE_DIR, 'data')
+# Сколько символов файла читается за раз при разборе JSON
+READ_SIZE = 64 * 1024
+
+
+def iter_json(file):
+    """
+    Читает элементы JSON-массива по одному, не загружая файл целиком.
+
+    Поддерживает и плоские записи `{"name", "measurement_unit"}`,
+    и фикстуры Django `{"model", "fields": {...}}`.
+    """
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив ингредиентов')
+    buffer = buffer[1:]
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError('Некорректный JSON в файле ингредиентов')
+            chunk = file.read(READ_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        yield item.get('fields', item)
+
+
+def iter_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield {'name': row[0], 'measurement_unit': row[1]}
+
+
+READERS = {
+    '.json': iter_json,
+    '.csv': iter_csv,
+}
+
+
+def iter_batches(rows, batch_size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
 
 
 class Command(BaseCommand):
-    help = 'loading ingredients from data in json'
+    help = 'loading ingredients from data in json or csv'
 
     def add_arguments(self, parser):
         parser.add_argument('filename', default='ingredients.json', nargs='?',
                             type=str)
+        parser.add_argument('--batch-size', default=1000, type=int)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='посчитать результат и откатить изменения')
+        parser.add_argument('--no-copy', action='store_true',
+                            help='не использовать COPY на PostgreSQL')
 
     def handle(self, *args, **options):
+        path = options['filename']
+        if not os.path.isabs(path) and not os.path.exists(path):
+            path = os.path.join(DATA_ROOT, path)
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .json и .csv')
+        use_copy = (connection.vendor == 'postgresql'
+                    and not options['no_copy'])
         try:
-            with open(os.path.join(DATA_ROOT, options['filename']), 'r',
-                      encoding='utf-8') as f:
-                data = json.load(f)
-                for ingredient in data:
-                    try:
-                        Ingredient.objects.create(name=ingredient["name"],
-                                                  measurement_unit=ingredient[
-                                                      "measurement_unit"])
-                    except IntegrityError:
-                        print(f'Ингридиет {ingredient["name"]} '
-                              f'{ingredient["measurement_unit"]} '
-                              f'уже есть в базе')
-
+            with open(path, 'r', encoding='utf-8') as f, \
+                    transaction.atomic():
+                before = Ingredient.objects.count()
+                if use_copy:
+                    total = self.load_copy(reader(f), options['batch_size'])
+                else:
+                    total = self.load_bulk(reader(f), options['batch_size'])
+                inserted = Ingredient.objects.count() - before
+                if options['dry_run']:
+                    transaction.set_rollback(True)
         except FileNotFoundError:
             raise CommandError('Файл отсутствует в директории data')
+        if not options['dry_run'] and inserted:
+            # bulk_create и COPY не отправляют сигналы
+            bump_model(Ingredient)
+            ingredient_index.invalidate()
+        prefix = '[dry-run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}Добавлено: {inserted}, пропущено: {total - inserted}'))
+
+    def load_bulk(self, rows, batch_size):
+        total = 0
+        for batch in iter_batches(rows, batch_size):
+            total += len(batch)
+            Ingredient.objects.bulk_create(
+                [Ingredient(name=row['name'],
+                            measurement_unit=row['measurement_unit'])
+                 for row in batch],
+                ignore_conflicts=True,
+            )
+        return total
+
+    def load_copy(self, rows, batch_size):
+        """Загружает строки через COPY во временную таблицу и переносит их
+        в таблицу ингредиентов одним INSERT ... ON CONFLICT DO NOTHING."""
+        table = Ingredient._meta.db_table
+        total = 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredient_load '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DROP')
+            raw = cursor.cursor
+            for batch in iter_batches(rows, batch_size):
+                total += len(batch)
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerows((row['name'], row['measurement_unit'])
+                                 for row in batch)
+                buffer.seek(0)
+                raw.copy_expert(
+                    'COPY ingredient_load (name, measurement_unit) '
+                    'FROM STDIN WITH (FORMAT csv)', buffer)
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit FROM ingredient_load '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING')
+        return total
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api import feeds
+
+
+class Command(BaseCommand):
+    help = 'rebuilding subscription feed timelines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', default=1000, type=int)
+
+    def handle(self, *args, **options):
+        count = feeds.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в лентах: {count}'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api import fulltext
+
+
+class Command(BaseCommand):
+    help = 'rebuilding the recipe full-text search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', default=1000, type=int)
+
+    def handle(self, *args, **options):
+        count = fulltext.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано рецептов: {count}'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api import shopping_list
+
+
+class Command(BaseCommand):
+    help = 'rebuilding per-user shopping list aggregates from carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', dest='users', action='append',
+                            type=int, help='id пользователя (можно несколько)')
+        parser.add_argument('--batch-size', default=1000, type=int)
+
+    def handle(self, *args, **options):
+        count = shopping_list.rebuild(options['users'],
+                                      batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Записано позиций списка покупок: {count}'))
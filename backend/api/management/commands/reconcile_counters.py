@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import counters
+
+
+class Command(BaseCommand):
+    help = 'checking denormalized favorite/cart/recipe/follower counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipe', dest='recipes', action='append',
+                            type=int, help='id рецепта (можно несколько)')
+        parser.add_argument('--user', dest='users', action='append',
+                            type=int, help='id автора (можно несколько)')
+        parser.add_argument('--fix', action='store_true',
+                            help='записать пересчитанные значения')
+
+    def handle(self, *args, **options):
+        recipe_ids, user_ids = options['recipes'], options['users']
+        if recipe_ids and not user_ids:
+            user_ids = []
+        elif user_ids and not recipe_ids:
+            recipe_ids = []
+        drift = counters.find_drift(recipe_ids, user_ids)
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+            return
+        for kind, pk, field, stored, expected in drift[:100]:
+            self.stdout.write(
+                f'{kind}={pk} {field} stored={stored} expected={expected}')
+        if len(drift) > 100:
+            self.stdout.write(f'... и ещё {len(drift) - 100}')
+        if options['fix']:
+            count = counters.reconcile(drift)
+            self.stdout.write(self.style.SUCCESS(
+                f'Исправлено строк: {count}'))
+            return
+        raise CommandError(f'Найдено расхождений: {len(drift)}')
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from api import jobs
+
+
+class Command(BaseCommand):
+    help = 'running background export jobs from the database queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', default=jobs.WORKER_THREADS,
+                            type=int, help='одновременных заданий')
+        parser.add_argument('--once', action='store_true',
+                            help='выйти, когда очередь опустеет')
+        parser.add_argument('--poll-interval', default=jobs.POLL_INTERVAL,
+                            type=float, help='пауза при пустой очереди')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Воркер выгрузок: потоков {options["threads"]}')
+        try:
+            outcomes = jobs.work(threads=options['threads'],
+                                 once=options['once'],
+                                 poll_interval=options['poll_interval'])
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(self.style.SUCCESS(
+            'Заданий: ' + ', '.join(f'{status} {count}'
+                                    for status, count in outcomes.items())
+            if outcomes else 'Очередь пуста'))
@@ -0,0 +1,145 @@
+import io
+import random
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from PIL import Image
+
+from api import counters, feeds, fulltext, shopping_list
+from api.models import (Cart, Favorite, Ingredient, IngredientAmount, Recipe,
+                        Tag)
+from api.tags import update_tag_masks
+from api.versions import bump_model
+from users.models import Follow
+
+User = get_user_model()
+
+SEED_PASSWORD = 'seed-password'
+SEED_IMAGE = 'recipes/seed.png'
+
+
+class Skewed:
+    """
+    Выборка с распределением, близким к Ципфу: первые элементы
+    популяции выбираются заметно чаще остальных.
+    """
+
+    def __init__(self, population, exponent=1.1):
+        self.population = list(population)
+        self.cum_weights = list(accumulate(
+            1 / (rank ** exponent)
+            for rank in range(1, len(self.population) + 1)))
+
+    def sample(self, rng, k):
+        k = min(k, len(self.population))
+        chosen = {}
+        while len(chosen) < k:
+            chosen.update(dict.fromkeys(rng.choices(
+                self.population, cum_weights=self.cum_weights, k=k)))
+        return list(chosen)[:k]
+
+
+class Command(BaseCommand):
+    help = 'seeding the database with synthetic users, recipes and lists'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', default=100, type=int)
+        parser.add_argument('--recipes', default=1000, type=int)
+        parser.add_argument('--ingredients-per-recipe', default=8, type=int)
+        parser.add_argument('--favorites', default=20, type=int,
+                            help='избранных рецептов у пользователя')
+        parser.add_argument('--carts', default=5, type=int,
+                            help='рецептов в корзине у пользователя')
+        parser.add_argument('--follows', default=10, type=int,
+                            help='подписок у пользователя')
+        parser.add_argument('--seed', default=42, type=int)
+        parser.add_argument('--batch-size', default=1000, type=int)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        call_command('load_ingredients', stdout=io.StringIO())
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        with transaction.atomic():
+            tags = self.seed_tags()
+            users = self.seed_users(options['users'], batch_size)
+            # Авторы распределены неравномерно: у немногих много рецептов
+            # и подписчиков
+            authors = Skewed(rng.sample(users, len(users)))
+            image = self.seed_image()
+            recipes = Recipe.objects.bulk_create([
+                Recipe(author=authors.sample(rng, 1)[0],
+                       name=f'Рецепт {number}', image=image,
+                       text=f'Описание рецепта {number}',
+                       cooking_time=rng.randint(5, 180))
+                for number in range(options['recipes'])
+            ], batch_size=batch_size)
+            recipes = list(Recipe.objects.order_by('-id')[:len(recipes)])
+            popular = Skewed(rng.sample(recipes, len(recipes)))
+            Recipe.tags.through.objects.bulk_create([
+                Recipe.tags.through(recipe_id=recipe.id, tag_id=tag.id)
+                for recipe in recipes
+                for tag in rng.sample(tags, rng.randint(1, len(tags)))
+            ], batch_size=batch_size)
+            update_tag_masks([recipe.id for recipe in recipes], batch_size)
+            IngredientAmount.objects.bulk_create([
+                IngredientAmount(recipe_id=recipe.id,
+                                 ingredient_id=ingredient_id,
+                                 amount=rng.randint(1, 500))
+                for recipe in recipes
+                for ingredient_id in rng.sample(
+                    ingredient_ids, options['ingredients_per_recipe'])
+            ], batch_size=batch_size, ignore_conflicts=True)
+            relations = {Favorite: options['favorites'],
+                         Cart: options['carts']}
+            for model, count in relations.items():
+                model.objects.bulk_create([
+                    model(user=user, recipe=recipe)
+                    for user in users
+                    for recipe in popular.sample(rng, count)
+                ], batch_size=batch_size, ignore_conflicts=True)
+            Follow.objects.bulk_create([
+                Follow(user=user, author=author)
+                for user in users
+                for author in authors.sample(rng, options['follows'])
+                if author != user
+            ], batch_size=batch_size, ignore_conflicts=True)
+        shopping_list.rebuild(batch_size=batch_size)
+        fulltext.rebuild(batch_size=batch_size)
+        counters.reconcile(counters.find_drift(), batch_size)
+        feeds.rebuild(batch_size=batch_size)
+        for model in (Tag, Recipe, IngredientAmount, User, Favorite, Cart,
+                      Follow):
+            bump_model(model)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователей: {len(users)}, рецептов: {len(recipes)}, '
+            f'пароль: {SEED_PASSWORD}'))
+
+    def seed_tags(self):
+        for color, name in Tag.COLOR_CHOICES:
+            Tag.objects.get_or_create(
+                color=color, defaults={'name': name, 'slug': color[1:]})
+        return list(Tag.objects.all())
+
+    def seed_users(self, count, batch_size):
+        start = User.objects.count()
+        password = make_password(SEED_PASSWORD)
+        User.objects.bulk_create([
+            User(username=f'seed{number}', email=f'seed{number}@example.com',
+                 first_name='Имя', last_name='Фамилия', password=password)
+            for number in range(start, start + count)
+        ], batch_size=batch_size)
+        return list(User.objects.filter(username__startswith='seed'))
+
+    def seed_image(self):
+        if not default_storage.exists(SEED_IMAGE):
+            buffer = io.BytesIO()
+            Image.new('RGB', (800, 480), (230, 180, 90)).save(buffer, 'PNG')
+            default_storage.save(SEED_IMAGE, ContentFile(buffer.getvalue()))
+        return SEED_IMAGE
@@ -0,0 +1,300 @@
+"""
+Метрики запросов в формате Prometheus.
+
+Каждый процесс копит гистограммы у себя в памяти (`registry`) и время
+от времени сбрасывает их в файл `<METRICS_DIR>/<pid>.json`. Эндпоинт
+метрик складывает файлы всех воркеров gunicorn, поэтому ответ не
+зависит от того, какой воркер принял запрос; показатели пулов
+соединений (foodgram.db.pool) при этом суммируются по воркерам. Без
+METRICS_DIR отдаются метрики только текущего процесса. Каталог стоит
+очищать при каждом деплое: файлы завершившихся воркеров продолжают
+учитываться.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from foodgram.db import pool
+
+METRICS_DIR = getattr(settings, 'METRICS_DIR', None)
+FLUSH_INTERVAL = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+                   10)
+QUERIES_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+GAUGE = 'gauge'
+
+# Имя метрики: (описание, границы корзин, None для счётчика или GAUGE)
+METRICS = {
+    'foodgram_requests_total': (
+        'Обработанные запросы', None),
+    'foodgram_request_duration_seconds': (
+        'Время ответа', SECONDS_BUCKETS),
+    'foodgram_request_db_seconds': (
+        'Время в СУБД за запрос', SECONDS_BUCKETS),
+    'foodgram_request_queries': (
+        'Число SQL-запросов за запрос', QUERIES_BUCKETS),
+    'foodgram_request_phase_seconds': (
+        'Время этапа обработки: serialize, render', SECONDS_BUCKETS),
+    'foodgram_db_pool_connections': (
+        'Соединения пула: in_use, idle', GAUGE),
+    'foodgram_db_pool_max_size': (
+        'Предельный размер пула', GAUGE),
+    'foodgram_db_pool_waits_total': (
+        'Ожидания свободного соединения', None),
+    'foodgram_db_pool_wait_seconds_total': (
+        'Суммарное время ожидания соединения', None),
+    'foodgram_db_pool_timeouts_total': (
+        'Ожидания, не дождавшиеся соединения', None),
+    'foodgram_db_pool_connects_total': (
+        'Соединения, открытые пулом', None),
+    'foodgram_db_pool_discards_total': (
+        'Соединения, закрытые пулом: idle, lifetime, broken', None),
+}
+
+_timings = contextvars.ContextVar('foodgram_timings', default=None)
+
+
+class Timings:
+    """Замеры одного запроса: число запросов к СУБД и время этапов."""
+
+    def __init__(self):
+        self.queries = 0
+        self.phases = {'db': 0.0}
+
+    def add(self, phase, duration):
+        self.phases[phase] = self.phases.get(phase, 0.0) + duration
+
+    def __call__(self, execute, sql, params, many, context):
+        """Обёртка connection.execute_wrapper."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add('db', time.perf_counter() - start)
+            self.queries += 1
+
+
+def start_request():
+    """
+    Returns:
+        tuple[Timings, Token]: Замеры запроса и токен для finish_request.
+    """
+    timings = Timings()
+    return timings, _timings.set(timings)
+
+
+def finish_request(token):
+    _timings.reset(token)
+
+
+@contextmanager
+def bind(timings):
+    """Делает `timings` замерами текущего запроса внутри блока."""
+    token = _timings.set(timings)
+    try:
+        yield
+    finally:
+        _timings.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Обёртка execute_wrapper для всех соединений (см. install): запрос
+    засчитывается текущему запросу, в каком бы потоке он ни выполнялся —
+    контекст переходит в потоки вместе с sync_to_async.
+    """
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings(execute, sql, params, many, context)
+
+
+def install(connection):
+    """Подключает record_query к соединению, один раз."""
+    if record_query not in connection.execute_wrappers:
+        # В начало списка: execute_wrapper() снимает свою обёртку с конца,
+        # даже если соединение открылось внутри его блока
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def add(phase, duration):
+    """Добавляет время к этапу `phase` текущего запроса, если он идёт."""
+    timings = _timings.get()
+    if timings is not None:
+        timings.add(phase, duration)
+
+
+@contextmanager
+def timed(phase):
+    """Замеряет блок как этап `phase` текущего запроса."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(phase, time.perf_counter() - start)
+
+
+class Registry:
+    """Счётчики и гистограммы процесса."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+        self.flushed_at = 0.0
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][1]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            series = self.series.setdefault(
+                key, {'buckets': [0] * (len(buckets) + 1), 'sum': 0.0})
+            index = next((i for i, bound in enumerate(buckets)
+                          if value <= bound), len(buckets))
+            series['buckets'][index] += 1
+            series['sum'] += value
+
+    def observe_request(self, view, method, status, timings, duration):
+        labels = {'view': view, 'method': method}
+        self.inc('foodgram_requests_total', {**labels, 'status': status})
+        self.observe('foodgram_request_duration_seconds', labels, duration)
+        self.observe('foodgram_request_db_seconds', labels,
+                     timings.phases['db'])
+        self.observe('foodgram_request_queries', labels, timings.queries)
+        for phase, value in timings.phases.items():
+            if phase != 'db':
+                self.observe('foodgram_request_phase_seconds',
+                             {'view': view, 'phase': phase}, value)
+        self.maybe_flush()
+
+    def dump(self):
+        with self.lock:
+            series = [[name, list(map(list, labels)), value]
+                      for (name, labels), value in self.series.items()]
+        return series + _pool_series()
+
+    def maybe_flush(self, force=False):
+        """Сбрасывает метрики процесса в METRICS_DIR не чаще раза в
+        FLUSH_INTERVAL секунд."""
+        now = time.monotonic()
+        if not METRICS_DIR or not self.series or (
+                not force and now - self.flushed_at < FLUSH_INTERVAL):
+            return
+        self.flushed_at = now
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f'{os.getpid()}.json')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.dump(), f)
+        os.replace(tmp_path, path)
+
+
+registry = Registry()
+
+
+def _pool_series():
+    """Состояние пулов соединений процесса (см. foodgram.db.pool)."""
+    series = []
+    for alias, stats in pool.stats().items():
+        labels = [['database', alias]]
+        for state in ('in_use', 'idle'):
+            series.append(['foodgram_db_pool_connections',
+                           [*labels, ['state', state]], stats[state]])
+        for name, key in (('max_size', 'max_size'),
+                          ('waits_total', 'waits'),
+                          ('wait_seconds_total', 'wait_seconds'),
+                          ('timeouts_total', 'timeouts'),
+                          ('connects_total', 'connects')):
+            series.append([f'foodgram_db_pool_{name}', labels, stats[key]])
+        for reason, count in stats['discards'].items():
+            series.append(['foodgram_db_pool_discards_total',
+                           [*labels, ['reason', reason]], count])
+    return series
+
+
+def _load_dumps():
+    if not METRICS_DIR:
+        return [registry.dump()]
+    registry.maybe_flush(force=True)
+    dumps = []
+    for name in os.listdir(METRICS_DIR):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name),
+                      encoding='utf-8') as f:
+                dumps.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return dumps
+
+
+def collect():
+    """
+    Складывает метрики всех воркеров.
+
+    Returns:
+        dict: {(имя, метки): число или {'buckets', 'sum'}}.
+    """
+    merged = {}
+    for dump in _load_dumps():
+        for name, labels, value in dump:
+            key = (name, tuple(map(tuple, labels)))
+            if isinstance(value, dict):
+                series = merged.setdefault(
+                    key, {'buckets': [0] * len(value['buckets']),
+                          'sum': 0.0})
+                series['buckets'] = [
+                    a + b for a, b in zip(series['buckets'],
+                                          value['buckets'])]
+                series['sum'] += value['sum']
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def _labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"')
+               for _, value in pairs)
+    return '{' + ','.join(
+        f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def render_prometheus(merged):
+    """
+    Returns:
+        str: Метрики в текстовом формате Prometheus 0.0.4.
+    """
+    lines = []
+    for name, (description, buckets) in METRICS.items():
+        kind = ('counter' if buckets is None
+                else GAUGE if buckets == GAUGE else 'histogram')
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for (series_name, labels), value in sorted(merged.items()):
+            if series_name != name:
+                continue
+            if kind != 'histogram':
+                lines.append(f'{name}{_labels(labels)} {value}')
+                continue
+            total = 0
+            for bound, count in zip((*buckets, '+Inf'), value['buckets']):
+                total += count
+                lines.append(
+                    f'{name}_bucket{_labels(labels, le=bound)} {total}')
+            lines.append(f'{name}_sum{_labels(labels)} {value["sum"]}')
+            lines.append(f'{name}_count{_labels(labels)} {total}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,139 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from api import metrics, replicas
+
+
+class ServerTimingMiddleware:
+    """
+    Замеряет запрос: число SQL-запросов, время в СУБД, сериализацию
+    (`metrics.timed('serialize')` во view) и рендеринг ответа.
+
+    Замеры уходят в заголовок Server-Timing и в гистограммы
+    api.metrics. Потоковые ответы (выгрузка списка покупок) формируются
+    уже после того, как заголовки отправлены: время их генерации
+    попадает только в гистограммы, как этап render.
+
+    Работает и под WSGI, и под ASGI: SQL-запросы считает обёртка
+    metrics.record_query по контексту запроса, поэтому учитываются и
+    запросы из потоков api.offload.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        return self.finish(request, response, timings, start)
+
+    async def __acall__(self, request):
+        timings, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        return self.finish(request, response, timings, start)
+
+    def finish(self, request, response, timings, start):
+        response['Server-Timing'] = self.header(timings, start)
+        if not response.streaming:
+            self.observe(request, response, timings, start)
+        elif response.is_async:
+            response.streaming_content = self.astream(
+                response.streaming_content, request, response, timings,
+                start)
+        else:
+            response.streaming_content = self.stream(
+                response.streaming_content, request, response, timings,
+                start)
+        return response
+
+    def process_template_response(self, request, response):
+        # Middleware стоит первым, поэтому этот хук вызывается последним,
+        # непосредственно перед рендерингом Response
+        start = time.perf_counter()
+        response.add_post_render_callback(lambda response: metrics.add(
+            'render', time.perf_counter() - start))
+        return response
+
+    def stream(self, content, request, response, timings, start):
+        render_start = time.perf_counter()
+        try:
+            with metrics.bind(timings):
+                yield from content
+        finally:
+            timings.add('render', time.perf_counter() - render_start)
+            self.observe(request, response, timings, start)
+
+    async def astream(self, content, request, response, timings, start):
+        render_start = time.perf_counter()
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            timings.add('render', time.perf_counter() - render_start)
+            self.observe(request, response, timings, start)
+
+    def header(self, timings, start):
+        entries = [
+            f'db;dur={timings.phases["db"] * 1000:.2f};'
+            f'desc="{timings.queries} queries"'
+        ]
+        entries.extend(
+            f'{phase};dur={value * 1000:.2f}'
+            for phase, value in timings.phases.items() if phase != 'db')
+        entries.append(f'total;dur={(time.perf_counter() - start) * 1000:.2f}')
+        return ', '.join(entries)
+
+    def observe(self, request, response, timings, start):
+        match = getattr(request, 'resolver_match', None)
+        metrics.registry.observe_request(
+            match.view_name if match else 'unmatched', request.method,
+            response.status_code, timings, time.perf_counter() - start)
+
+
+class ReplicaMiddleware:
+    """
+    Направляет чтение запросов безопасными методами на реплику базы
+    (см. api.replicas); после записи клиент какое-то время читает из
+    default.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        replicas.check_cache()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = replicas.start_request(request)
+        try:
+            return self.get_response(request)
+        finally:
+            replicas.finish_request(request, token)
+
+    async def __acall__(self, request):
+        token = replicas.start_request(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            replicas.finish_request(request, token)
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.2 on 2026-10-18 04:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+
+
+def fill_shopping_lists(apps, schema_editor):
+    IngredientAmount = apps.get_model('api', 'IngredientAmount')
+    ShoppingListItem = apps.get_model('api', 'ShoppingListItem')
+    rows = IngredientAmount.objects.filter(
+        recipe__cart__isnull=False).values_list(
+        'recipe__cart__user_id', 'ingredient_id').annotate(
+        total=Sum('amount')).order_by()
+    ShoppingListItem.objects.bulk_create(
+        [ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                          total=total)
+         for user_id, ingredient_id, total in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0004_alter_ingredientamount_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Позиция списка покупок',
+                'verbose_name_plural': 'Список покупок',
+                'ordering': ['total'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique shopping list ingredient'),
+        ),
+        migrations.RunPython(fill_shopping_lists,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.2 on 2026-10-18 04:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Ключ')),
+                ('version', models.BigIntegerField(default=0, verbose_name='Версия')),
+                ('updated_at', models.DateTimeField(verbose_name='Изменено')),
+            ],
+            options={
+                'verbose_name': 'Версия таблицы',
+                'verbose_name_plural': 'Версии таблиц',
+            },
+        ),
+    ]
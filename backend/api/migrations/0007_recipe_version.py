@@ -0,0 +1,18 @@
+# Generated by Django 4.2.2 on 2026-10-18 04:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_modelversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия'),
+        ),
+    ]
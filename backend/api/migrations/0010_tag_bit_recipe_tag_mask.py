@@ -0,0 +1,46 @@
+# Generated by Django 4.2.2 on 2026-10-18 04:52
+
+from django.db import migrations, models
+
+# Совпадает с api.tags.MAX_TAGS: старший бит BigInteger занят знаком
+MAX_TAGS = 63
+
+
+def fill_tag_masks(apps, schema_editor):
+    Tag = apps.get_model('api', 'Tag')
+    Recipe = apps.get_model('api', 'Recipe')
+    tags = list(Tag.objects.order_by('id'))
+    if len(tags) > MAX_TAGS:
+        raise ValueError(f'Тегов больше {MAX_TAGS}, маска не поместится')
+    for bit, tag in enumerate(tags):
+        tag.bit = bit
+    Tag.objects.bulk_update(tags, ['bit'])
+    masks = {}
+    for recipe_id, bit in Recipe.tags.through.objects.values_list(
+            'recipe_id', 'tag__bit'):
+        masks[recipe_id] = masks.get(recipe_id, 0) | 1 << bit
+    Recipe.objects.bulk_update(
+        [Recipe(id=recipe_id, tag_mask=mask)
+         for recipe_id, mask in masks.items()],
+        ['tag_mask'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, unique=True, verbose_name='Бит в маске'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tag_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Маска тегов'),
+        ),
+        migrations.RunPython(fill_tag_masks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 4.2.2 on 2026-10-18 05:02
+
+from django.db import migrations
+
+# Индекс полнотекстового поиска (см. api.fulltext). На PostgreSQL —
+# tsvector с весами A/B/C для названия, ингредиентов и описания и GIN по
+# нему; на SQLite — виртуальная таблица FTS5 с rowid = id рецепта.
+SEARCH_CONFIG = 'russian'
+
+POSTGRESQL_CREATE = [
+    'CREATE TABLE IF NOT EXISTS api_recipesearch ('
+    ' recipe_id integer PRIMARY KEY'
+    ' REFERENCES api_recipe (id) ON DELETE CASCADE DEFERRABLE INITIALLY'
+    ' DEFERRED,'
+    ' document tsvector NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS api_recipesearch_document'
+    ' ON api_recipesearch USING GIN (document)',
+]
+POSTGRESQL_FILL = """
+    INSERT INTO api_recipesearch (recipe_id, document)
+    SELECT r.id,
+           setweight(to_tsvector(%s::regconfig, r.name), 'A')
+           || setweight(to_tsvector(%s::regconfig,
+                        COALESCE(STRING_AGG(i.name, ' '), '')), 'B')
+           || setweight(to_tsvector(%s::regconfig, r.text), 'C')
+    FROM api_recipe r
+    LEFT JOIN api_ingredientamount ia ON ia.recipe_id = r.id
+    LEFT JOIN api_ingredient i ON i.id = ia.ingredient_id
+    GROUP BY r.id, r.name, r.text
+"""
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS api_recipesearch USING fts5("
+    " name, ingredients, text,"
+    " tokenize = 'unicode61 remove_diacritics 2')",
+]
+SQLITE_FILL = """
+    INSERT INTO api_recipesearch (rowid, name, ingredients, text)
+    SELECT r.id, r.name, COALESCE(GROUP_CONCAT(i.name, ' '), ''), r.text
+    FROM api_recipe r
+    LEFT JOIN api_ingredientamount ia ON ia.recipe_id = r.id
+    LEFT JOIN api_ingredient i ON i.id = ia.ingredient_id
+    GROUP BY r.id, r.name, r.text
+"""
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for statement in POSTGRESQL_CREATE:
+            schema_editor.execute(statement)
+        schema_editor.execute(POSTGRESQL_FILL, [SEARCH_CONFIG] * 3)
+    elif vendor == 'sqlite':
+        for statement in SQLITE_CREATE:
+            schema_editor.execute(statement)
+        schema_editor.execute(SQLITE_FILL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute('DROP TABLE IF EXISTS api_recipesearch')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_tag_bit_recipe_tag_mask'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.2 on 2026-10-18 04:55
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_of(model):
+    return Coalesce(Subquery(model.objects.filter(
+        recipe=OuterRef('pk')).order_by().values('recipe').annotate(
+        total=Count('id')).values('total')), 0)
+
+
+def fill_recipe_counters(apps, schema_editor):
+    Recipe = apps.get_model('api', 'Recipe')
+    Favorite = apps.get_model('api', 'Favorite')
+    Cart = apps.get_model('api', 'Cart')
+    Recipe.objects.update(favorites_count=count_of(Favorite),
+                          in_carts_count=count_of(Cart))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_recipe_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзинах'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-id'], name='recipe_favorites_id_desc'),
+        ),
+        migrations.RunPython(fill_recipe_counters,
+                             migrations.RunPython.noop),
+    ]
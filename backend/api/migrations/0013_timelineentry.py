@@ -0,0 +1,45 @@
+# Generated by Django 4.2.2 on 2026-10-18 04:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    # Все авторы пока раскладываются по лентам; флаги pull_feed для
+    # популярных авторов расставляет команда rebuild_feeds
+    schema_editor.execute(
+        'INSERT INTO api_timelineentry (user_id, recipe_id, author_id) '
+        'SELECT f.user_id, r.id, r.author_id FROM users_follow f '
+        'JOIN api_recipe r ON r.author_id = f.author_id')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0012_recipe_counters'),
+        ('users', '0002_auto_20210930_1515'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Ленты подписок',
+                'ordering': ['-recipe'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique timeline recipe'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
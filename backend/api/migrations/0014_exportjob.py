@@ -0,0 +1,42 @@
+# Generated by Django 4.2.2 on 2026-10-18 05:09
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0013_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('shopping_list', 'Список покупок'), ('recipe_book', 'Книга рецептов')], max_length=20, verbose_name='Выгрузка')),
+                ('export_format', models.CharField(max_length=10, verbose_name='Формат')),
+                ('payload', models.JSONField(default=dict, verbose_name='Входные данные')),
+                ('input_hash', models.CharField(db_index=True, max_length=64, verbose_name='Хеш входных данных')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попытки')),
+                ('run_after', models.DateTimeField(verbose_name='Не раньше')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='Занято до')),
+                ('result', models.CharField(blank=True, max_length=255, verbose_name='Файл результата')),
+                ('error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершено')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='Хранится до')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Задание выгрузки',
+                'verbose_name_plural': 'Задания выгрузки',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['status', 'run_after'], name='export_job_queue')],
+            },
+        ),
+    ]
@@ -44,6 +44,10 @@ class Tag(models.Model):
                              verbose_name='Цвет в HEX')
     slug = models.SlugField(max_length=200, unique=True,
                             verbose_name='Уникальный слаг')
+    # Номер бита тега в Recipe.tag_mask, назначается при создании
+    bit = models.PositiveSmallIntegerField(unique=True, null=True,
+                                           editable=False,
+                                           verbose_name='Бит в маске')
 
     class Meta:
         ordering = ['-id']
@@ -53,6 +57,13 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self.bit is not None:
+            return super().save(*args, **kwargs)
+        # api.tags импортирует модели
+        from api.tags import save_with_free_bit
+        save_with_free_bit(self, super().save, *args, **kwargs)
+
 
 class Recipe(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE,
@@ -62,6 +73,11 @@ class Recipe(models.Model):
                             verbose_name='Название рецепта')
     image = models.ImageField(upload_to='recipes/',
                               verbose_name='Картинка рецепта')
+    # Уменьшенные копии картинки, их строит api.images вне запроса:
+    # {'source': имя оригинала, 'card': {'jpeg': имя, 'webp': имя}, ...}
+    image_variants = models.JSONField(default=dict, blank=True,
+                                      editable=False,
+                                      verbose_name='Варианты картинки')
     text = models.TextField(verbose_name='Описание рецепта')
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -78,11 +94,33 @@ class Recipe(models.Model):
             validators.MinValueValidator(
                 1, message='Минимальное время приготовления 1 минута'),),
         verbose_name='Время приготовления')
+    # Увеличивается при любом изменении, видимом в ответе API
+    # (см. api.fragments): рецепт, теги, ингредиенты, автор
+    version = models.PositiveIntegerField(default=0, editable=False,
+                                          verbose_name='Версия')
+    # Теги рецепта битами Tag.bit: фильтр по тегам без JOIN и DISTINCT.
+    # Пересчитывается сигналом при изменении tags (см. api.tags)
+    tag_mask = models.BigIntegerField(default=0, editable=False,
+                                      verbose_name='Маска тегов')
+    # Счётчики связей, их меняют F()-выражениями представления избранного
+    # и корзины; расхождения чинит команда reconcile_counters
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='В избранном')
+    in_carts_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='В корзинах')
 
     class Meta:
         ordering = ['-id']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            # Рецепты автора в порядке выдачи: фильтр author, подписки
+            models.Index(fields=['author', '-id'],
+                         name='recipe_author_id_desc'),
+            # Сортировка по популярности: ?ordering=-favorites_count
+            models.Index(fields=['-favorites_count', '-id'],
+                         name='recipe_favorites_id_desc'),
+        ]
 
 
 class IngredientAmount(models.Model):
@@ -158,3 +196,170 @@ class Cart(models.Model):
             models.UniqueConstraint(fields=['user', 'recipe'],
                                     name='unique cart user')
         ]
+
+
+class ShoppingListItem(models.Model):
+    """
+    Сумма ингредиента по всем рецептам в корзине пользователя.
+
+    Поддерживается инкрементально при изменении корзины и рецептов
+    (см. api.shopping_list), поэтому выгрузка списка покупок — одно чтение.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+    )
+    total = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        ordering = ['total']
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='unique shopping list ingredient')
+        ]
+
+
+class TimelineEntry(models.Model):
+    """
+    Рецепт в ленте подписчика его автора.
+
+    Записи создаются при публикации рецепта и при подписке (см.
+    api.feeds), поэтому лента читается по одному индексу, сколько бы
+    авторов ни было в подписках.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Рецепт',
+    )
+    # Дублирует recipe.author: отписка удаляет записи без JOIN
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+
+    class Meta:
+        ordering = ['-recipe']
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            # Индекс (user, recipe) обслуживает и чтение ленты по ключу
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique timeline recipe')
+        ]
+
+
+class ExportJob(models.Model):
+    """
+    Задание на выгрузку файла, очередь воркера run_export_worker.
+
+    Входные данные снимаются при постановке в очередь (`payload`), файл
+    результата называется по их хешу: одинаковые выгрузки разных
+    заданий рендерятся один раз (см. api.jobs).
+    """
+
+    SHOPPING_LIST = 'shopping_list'
+    RECIPE_BOOK = 'recipe_book'
+
+    KIND_CHOICES = [
+        (SHOPPING_LIST, 'Список покупок'),
+        (RECIPE_BOOK, 'Книга рецептов'),
+    ]
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='export_jobs',
+        verbose_name='Пользователь',
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES,
+                            verbose_name='Выгрузка')
+    export_format = models.CharField(max_length=10, verbose_name='Формат')
+    payload = models.JSONField(default=dict, verbose_name='Входные данные')
+    input_hash = models.CharField(max_length=64, db_index=True,
+                                  verbose_name='Хеш входных данных')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=PENDING, verbose_name='Статус')
+    attempts = models.PositiveSmallIntegerField(default=0,
+                                                verbose_name='Попытки')
+    # Раньше этого времени задание не берётся: пауза перед повтором
+    run_after = models.DateTimeField(verbose_name='Не раньше')
+    # Воркер, взявший задание, должен закончить до этого времени, иначе
+    # задание считается брошенным и берётся снова
+    locked_until = models.DateTimeField(null=True, blank=True,
+                                        verbose_name='Занято до')
+    result = models.CharField(max_length=255, blank=True,
+                              verbose_name='Файл результата')
+    error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True,
+                                      verbose_name='Создано')
+    finished_at = models.DateTimeField(null=True, blank=True,
+                                       verbose_name='Завершено')
+    expires_at = models.DateTimeField(null=True, blank=True,
+                                      verbose_name='Хранится до')
+
+    class Meta:
+        ordering = ['-id']
+        verbose_name = 'Задание выгрузки'
+        verbose_name_plural = 'Задания выгрузки'
+        indexes = [
+            # Выборка очереди: ожидающие задания по времени запуска
+            models.Index(fields=['status', 'run_after'],
+                         name='export_job_queue'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind}.{self.export_format} #{self.id}: {self.status}'
+
+
+class ModelVersion(models.Model):
+    """
+    Счётчик изменений таблицы (или её части для одного пользователя).
+
+    Из счётчиков строятся ETag и Last-Modified для условных GET-запросов
+    (см. api.versions).
+    """
+
+    name = models.CharField(max_length=100, unique=True,
+                            verbose_name='Ключ')
+    version = models.BigIntegerField(default=0, verbose_name='Версия')
+    updated_at = models.DateTimeField(verbose_name='Изменено')
+
+    class Meta:
+        verbose_name = 'Версия таблицы'
+        verbose_name_plural = 'Версии таблиц'
+
+    def __str__(self):
+        return f'{self.name}@{self.version}'
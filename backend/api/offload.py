@@ -0,0 +1,132 @@
+"""
+Асинхронные обёртки представлений для режима ASGI.
+
+Под ASGI Django выполняет синхронные представления в одном общем потоке
+(`thread_sensitive`), поэтому медленный запрос — выгрузка PDF, ожидание
+СУБД — задерживает все остальные запросы процесса. Обёрнутое здесь
+представление выполняется целиком, вместе с рендерингом ответа, в
+ограниченном пуле потоков (ASYNC_VIEW_THREADS), а цикл событий тем
+временем принимает другие запросы. У каждого потока пула своё
+соединение с СУБД, поэтому размер пула не должен превышать число
+соединений, которое готова принять база.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.urls import URLPattern
+
+from api import metrics
+
+POOL_SIZE = getattr(settings, 'ASYNC_VIEW_THREADS', 8)
+# Сколько прочитанных кусков потокового ответа ждут отправки клиенту
+STREAM_BUFFER = 8
+
+_END = object()
+
+executor = ThreadPoolExecutor(max_workers=POOL_SIZE,
+                              thread_name_prefix='foodgram-view')
+
+
+def _with_connections(func, *args, **kwargs):
+    # Django закрывает устаревшие соединения по сигналам начала и конца
+    # запроса, но только в своём потоке: потоки пула делают это сами
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run(func, *args, **kwargs):
+    """Выполняет синхронную функцию в пуле, не блокируя цикл событий."""
+    return await sync_to_async(_with_connections, thread_sensitive=False,
+                               executor=executor)(func, *args, **kwargs)
+
+
+def _respond(view, request, *args, **kwargs):
+    response = view(request, *args, **kwargs)
+    if hasattr(response, 'render') and callable(response.render):
+        with metrics.timed('render'):
+            response.render()
+    elif response.streaming and not response.is_async:
+        # Django читал бы синхронный итератор в общем потоке; здесь его
+        # читает поток пула, а клиенту куски уходят по мере готовности
+        response.streaming_content = _stream(response.streaming_content)
+    return response
+
+
+def _produce(chunks, queue, loop, stop):
+    """
+    Читает куски синхронного ответа и кладёт их в очередь цикла
+    событий; ждёт, пока в очереди не освободится место.
+    """
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    try:
+        for chunk in chunks:
+            put(chunk)
+            if stop.is_set():
+                break
+    except Exception as error:
+        put(error)
+        return
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    put(_END)
+
+
+async def _stream(chunks):
+    """
+    Returns:
+        AsyncIterator[bytes]: Куски ответа, прочитанные в потоке пула:
+        итератор и его соединение с СУБД остаются в одном потоке.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(STREAM_BUFFER)
+    stop = threading.Event()
+    asyncio.ensure_future(run(_produce, chunks, queue, loop, stop))
+    try:
+        while True:
+            item = await queue.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Клиент ушёл: освобождаем очередь, чтобы поток пула дописал
+        # кусок, увидел `stop` и вернулся в пул
+        stop.set()
+        while not queue.empty():
+            queue.get_nowait()
+
+
+def async_view(view):
+    """
+    Returns:
+        Callable: Асинхронное представление, выполняющее `view` в пуле.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await run(_respond, view, request, *args, **kwargs)
+    return wrapper
+
+
+def offload_patterns(patterns, names):
+    """
+    Заменяет представления маршрутов с именами из `names` асинхронными
+    обёртками; остальные маршруты возвращает как есть.
+    """
+    return [
+        URLPattern(pattern.pattern, async_view(pattern.callback),
+                   pattern.default_args, pattern.name)
+        if pattern.name in names else pattern
+        for pattern in patterns
+    ]
@@ -1,6 +1,65 @@
-from rest_framework.pagination import PageNumberPagination
+from django.db.models import QuerySet
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class LimitCursorPagination(CursorPagination):
+    """Keyset-пагинация по `-id` с прежним параметром `limit`."""
+
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = '-id'
+
+    def decode_cursor(self, request):
+        # Пустой `?cursor=` означает первую страницу
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super().decode_cursor(request)
 
 
 class LimitPageNumberPagination(PageNumberPagination):
+    """
+    Постраничная пагинация с параметром `limit`.
+
+    Если в запросе передан параметр `cursor` (в том числе пустой),
+    страница выбирается по ключу `-id` без OFFSET и COUNT(*),
+    а ссылки `next`/`previous` содержат непрозрачный курсор. Queryset,
+    упорядоченный иначе (по счётчикам, по релевантности поиска),
+    делится на обычные страницы: курсор потерял бы его порядок.
+    """
+
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    keyset_class = LimitCursorPagination
+
+    keyset = None
+
+    def is_keyset_ordered(self, queryset):
+        """
+        Returns:
+            bool: Queryset упорядочен по ключу курсора. Готовые списки
+            (например, ранжированные в памяти) ключа не имеют.
+        """
+        if not isinstance(queryset, QuerySet):
+            return False
+        query = queryset.query
+        ordering = query.order_by or (
+            queryset.model._meta.ordering if query.default_ordering else ())
+        return tuple(ordering) in ((), (self.keyset_class.ordering,))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (self.cursor_query_param in request.query_params
+                and self.is_keyset_ordered(queryset)):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_html_context(self):
+        if self.keyset is not None:
+            return self.keyset.get_html_context()
+        return super().get_html_context()
@@ -1,3 +1,6 @@
+import hmac
+
+from django.conf import settings
 from rest_framework.permissions import SAFE_METHODS, BasePermission
 
 
@@ -10,3 +13,17 @@ class IsAdminOrReadOnly(BasePermission):
     def has_permission(self, request, view):
         return (request.method in SAFE_METHODS
                 or request.user and request.user.is_staff)
+
+
+class IsMetricsScraper(BasePermission):
+    """
+    Пускает к метрикам с заголовком `Authorization: Bearer <METRICS_TOKEN>`.
+    Пока METRICS_TOKEN не задан, метрики видят только администраторы.
+    """
+
+    def has_permission(self, request, view):
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        if not token:
+            return bool(request.user and request.user.is_staff)
+        return hmac.compare_digest(
+            request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}')
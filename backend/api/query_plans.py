@@ -0,0 +1,161 @@
+"""
+Планы запросов горячих путей api.views, api.filters и users.views.
+
+Каждый запрос строится тем же кодом, что и в представлениях (фильтры
+RecipeViewSet, ViewerContext, recipe_lists, CustomUserViewSet), и
+описан таблицей, которую он должен читать по индексу. `check_plans`
+снимает EXPLAIN и отмечает запросы, где эта таблица читается
+последовательным сканированием. На PostgreSQL проверка идёт с
+`enable_seqscan = off`, чтобы результат не зависел от размера таблиц:
+Seq Scan в таком плане означает, что подходящего индекса нет.
+"""
+from collections import namedtuple
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from api.exports import get_shopping_list
+from api.fragments import ingredient_amounts
+from api.models import Cart, Favorite, Recipe
+from api.pagination import LimitPageNumberPagination
+from api.recipe_lists import listed
+from api.viewer import ViewerContext
+from api.views import RecipeViewSet
+from users.models import Follow
+from users.views import CustomUserViewSet
+
+User = get_user_model()
+
+HotQuery = namedtuple('HotQuery', 'name table build')
+PlanResult = namedtuple('PlanResult', 'query plan ok')
+
+PAGE_SIZE = LimitPageNumberPagination.page_size
+RECIPES_LIMIT = 3
+
+# Методы CustomUserViewSet, которые строят queryset, не зависят от запроса
+_users_view = CustomUserViewSet()
+
+
+def _sample():
+    user = User.objects.order_by('id').first()
+    if user is None:
+        raise LookupError('Нет пользователей для примеров запросов')
+    recipe_ids = list(Recipe.objects.values_list(
+        'id', flat=True)[:PAGE_SIZE]) or [0]
+    return user, recipe_ids
+
+
+def _recipe_page(**params):
+    """
+    Returns:
+        Callable: Строит страницу RecipeViewSet.list с фильтрами `params`
+        от имени пользователя.
+    """
+    def build(user, recipe_ids):
+        request = Request(RequestFactory().get('/', {
+            name: value(user) if callable(value) else value
+            for name, value in params.items()}))
+        request.user = user
+        view = RecipeViewSet(request=request, action='list',
+                             format_kwarg=None, args=(), kwargs={})
+        return view.get_page_queryset()[:PAGE_SIZE]
+    return build
+
+
+HOT_QUERIES = [
+    HotQuery(
+        'ViewerContext.favorite_ids', 'api_favorite',
+        lambda user, recipe_ids: ViewerContext(user).related_ids(
+            Favorite, 'recipe_id')),
+    HotQuery(
+        'recipe_lists.listed(Favorite)', 'api_favorite',
+        lambda user, recipe_ids: listed(Favorite, user, recipe_ids)),
+    HotQuery(
+        'RecipeViewSet.list ?is_favorited=1', 'api_favorite',
+        _recipe_page(is_favorited=1)),
+    HotQuery(
+        'ViewerContext.cart_ids', 'api_cart',
+        lambda user, recipe_ids: ViewerContext(user).related_ids(
+            Cart, 'recipe_id')),
+    HotQuery(
+        'RecipeViewSet.list ?is_in_shopping_cart=1', 'api_cart',
+        _recipe_page(is_in_shopping_cart=1)),
+    HotQuery(
+        'download_shopping_cart', 'api_shoppinglistitem',
+        lambda user, recipe_ids: get_shopping_list(user)),
+    HotQuery(
+        'ViewerContext.following_ids', 'users_follow',
+        lambda user, recipe_ids: ViewerContext(user).related_ids(
+            Follow, 'author_id')),
+    HotQuery(
+        'CustomUserViewSet.subscriptions', 'users_follow',
+        lambda user, recipe_ids: _users_view.get_subscriptions_queryset(
+            user)[:PAGE_SIZE]),
+    HotQuery(
+        'plan_queryset prefetch ingredientamount_set',
+        'api_ingredientamount',
+        lambda user, recipe_ids: ingredient_amounts().filter(
+            recipe_id__in=recipe_ids)),
+    HotQuery(
+        'RecipeViewSet.list ?author=', 'api_recipe',
+        _recipe_page(author=lambda user: user.id)),
+    HotQuery(
+        'CustomUserViewSet.subscriptions ?recipes_limit=', 'api_recipe',
+        lambda user, recipe_ids: _users_view.get_author_recipes(
+            [user.id], RECIPES_LIMIT)),
+]
+
+
+def explain(queryset):
+    """
+    Снимает план запроса.
+
+    QuerySet.explain() не работает с фильтром по оконной функции,
+    поэтому EXPLAIN выполняется над готовым SQL.
+
+    Returns:
+        str: План, по строке на узел.
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{connection.ops.explain_query_prefix()} {sql}', params)
+        return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+
+def is_sequential_scan(plan, table):
+    for line in plan.splitlines():
+        line = line.strip()
+        if connection.vendor == 'postgresql':
+            if f'Seq Scan on {table}' in line:
+                return True
+        elif connection.vendor == 'sqlite':
+            # «SCAN t» и «SCAN t USING COVERING INDEX» читают всю таблицу
+            # или весь индекс; выборка по ключу выглядит как «SEARCH t ...»
+            if line.startswith(f'SCAN {table}') and (
+                    line == f'SCAN {table}' or line[len(table) + 5] == ' '):
+                return True
+    return False
+
+
+def check_plans(queries=HOT_QUERIES):
+    """
+    Returns:
+        list[PlanResult]: План и вердикт для каждого горячего запроса.
+
+    Raises:
+        LookupError: В базе нет ни одного пользователя.
+    """
+    user, recipe_ids = _sample()
+    results = []
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        for query in queries:
+            plan = explain(query.build(user, recipe_ids))
+            results.append(PlanResult(
+                query, plan, not is_sequential_scan(plan, query.table)))
+    return results
@@ -0,0 +1,143 @@
+"""
+Избранное и корзина пользователя: добавление и удаление рецептов.
+
+Добавление — один INSERT через bulk_create, удаление — один DELETE
+по найденным строкам. bulk_create не шлёт post_save, поэтому счётчики
+рецептов (api.counters) и список покупок обновляются здесь, один раз
+на пачку.
+
+Каждое изменение начинается с увеличения счётчика изменений списка
+пользователя (api.versions): UPSERT блокирует его строку до конца
+транзакции, и изменения одного списка выполняются по очереди. Иначе
+два параллельных добавления одного рецепта оба сочли бы его новым и
+дважды увеличили счётчики. Добавление одного рецепта — это UPSERT
+счётчика, INSERT связи и UPDATE счётчика рецепта.
+"""
+from django.db import IntegrityError, router, transaction
+
+from api import shopping_list
+from api.counters import change_recipe_counters
+from api.models import Cart, Recipe
+from api.versions import bump_model
+
+ADDED = 'added'
+EXISTS = 'exists'
+REMOVED = 'removed'
+ABSENT = 'absent'
+NOT_FOUND = 'not_found'
+
+
+def _changed(model, user, recipe_ids, delta):
+    # UPDATE счётчиков блокирует строки рецептов до конца транзакции:
+    # состав рецепта ниже читается уже после параллельной правки автора
+    # (см. shopping_list.recipe_changed)
+    change_recipe_counters(model, recipe_ids, delta)
+    if model is Cart:
+        if delta > 0:
+            shopping_list.add_recipes(user, recipe_ids)
+        else:
+            shopping_list.remove_recipes(user, recipe_ids)
+
+
+def _lock(model, user):
+    """
+    Увеличивает счётчик изменений списка пользователя, блокируя его
+    строку до конца транзакции.
+    """
+    bump_model(model, user.id)
+
+
+def listed(model, user, recipe_ids):
+    """
+    Returns:
+        QuerySet: Строки списка `model` пользователя с рецептами
+        `recipe_ids`.
+    """
+    return model.objects.filter(user=user, recipe_id__in=recipe_ids)
+
+
+def _delete(model, user, recipe_ids):
+    """
+    Returns:
+        int: Число удалённых строк.
+    """
+    deleted, _ = listed(model, user, recipe_ids).using(
+        router.db_for_write(model)).delete()
+    return deleted
+
+
+def add_one(model, user, recipe_id):
+    """
+    Returns:
+        bool: Рецепт добавлен; False, если он уже был в списке.
+    """
+    try:
+        with transaction.atomic():
+            _lock(model, user)
+            model.objects.bulk_create([model(user=user, recipe_id=recipe_id)])
+            _changed(model, user, [recipe_id], 1)
+    except IntegrityError:
+        return False
+    return True
+
+
+def remove_one(model, user, recipe_id):
+    """
+    Returns:
+        bool: Рецепт удалён; False, если его не было в списке.
+    """
+    with transaction.atomic():
+        _lock(model, user)
+        if not _delete(model, user, [recipe_id]):
+            return False
+        _changed(model, user, [recipe_id], -1)
+    return True
+
+
+def add(model, user, recipe_ids):
+    """
+    Добавляет рецепты в список пользователя одним INSERT.
+
+    Returns:
+        dict: {recipe_id: ADDED | EXISTS | NOT_FOUND} в порядке
+        `recipe_ids`.
+    """
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    found = set(Recipe.objects.filter(id__in=recipe_ids).values_list(
+        'id', flat=True))
+    with transaction.atomic():
+        _lock(model, user)
+        # Под блокировкой список не меняется: вставленными окажутся
+        # ровно рецепты, которых в нём нет
+        present = set(listed(model, user, found).values_list(
+            'recipe_id', flat=True))
+        new = [recipe_id for recipe_id in recipe_ids
+               if recipe_id in found and recipe_id not in present]
+        if new:
+            model.objects.bulk_create(
+                [model(user=user, recipe_id=recipe_id) for recipe_id in new])
+            _changed(model, user, new, 1)
+    return {
+        recipe_id: (NOT_FOUND if recipe_id not in found
+                    else EXISTS if recipe_id in present else ADDED)
+        for recipe_id in recipe_ids
+    }
+
+
+def remove(model, user, recipe_ids):
+    """
+    Удаляет рецепты из списка пользователя одним DELETE.
+
+    Returns:
+        dict: {recipe_id: REMOVED | ABSENT} в порядке `recipe_ids`.
+    """
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    with transaction.atomic():
+        _lock(model, user)
+        present = set(listed(model, user, recipe_ids).values_list(
+            'recipe_id', flat=True))
+        if present:
+            _delete(model, user, present)
+            _changed(model, user, present, -1)
+    return {recipe_id: REMOVED if recipe_id in present else ABSENT
+            for recipe_id in recipe_ids}
@@ -0,0 +1,44 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class FileRenderer(BaseRenderer):
+    """
+    Рендерер для выгрузок, которые отдаются готовым потоком байтов.
+
+    Нужен, чтобы `?format=` проходил согласование контента DRF;
+    сами данные он не преобразует, а ответы с ошибками отдаёт как JSON.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, (bytes, str)):
+            return data
+        # Байты, а не строка: у PDFRenderer нет кодировки, и DRF не
+        # закодировал бы ответ с ошибкой сам
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+class PDFRenderer(FileRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+class PlainTextRenderer(FileRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(FileRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PrometheusRenderer(FileRenderer):
+    media_type = 'text/plain'
+    format = 'prometheus'
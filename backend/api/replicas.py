@@ -0,0 +1,106 @@
+"""
+Чтение с реплик базы.
+
+ReplicaMiddleware выбирает для запроса безопасным методом (GET, HEAD,
+OPTIONS) одну из реплик REPLICA_DATABASES, и ReplicaRouter направляет
+на неё чтение внутри запроса. Запись, чтение внутри транзакции, любые
+запросы вне HTTP (команды, воркер выгрузок) и поиск токена
+авторизации идут в default.
+
+Реплика может отставать, поэтому клиент, только что изменивший данные
+(избранное, корзина, рецепт), REPLICA_PIN_SECONDS секунд читает из
+default: метка лежит в кеше под хешем заголовка Authorization или
+сессии. Метку должны видеть все воркеры, поэтому с репликами кеш
+обязан быть общим (CACHE_BACKEND): с кешем в памяти процесса
+ReplicaMiddleware не запускается.
+"""
+import contextvars
+import hashlib
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICAS = list(getattr(settings, 'REPLICA_DATABASES', []))
+PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Приложения, которые читаются только из default: токен и сессия
+# нужны сразу после входа, когда реплика может их ещё не получить
+PRIMARY_APPS = ('authtoken', 'sessions')
+# Кеши, которые не видны другим процессам
+PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+_replica = contextvars.ContextVar('foodgram_replica', default=None)
+
+
+def check_cache():
+    """
+    Raises:
+        ImproperlyConfigured: Реплики заданы, а кеш с метками записи
+            живёт в памяти процесса.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if REPLICAS and backend in PROCESS_CACHES:
+        raise ImproperlyConfigured(
+            f'С репликами ({", ".join(REPLICAS)}) метки записи должны '
+            f'лежать в общем кеше, а {backend} виден только своему '
+            f'процессу: задайте CACHE_BACKEND и CACHE_LOCATION')
+
+
+def _client_key(request):
+    credentials = (request.headers.get('Authorization')
+                   or request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    if not credentials:
+        return None
+    digest = hashlib.sha256(credentials.encode('utf-8')).hexdigest()
+    return f'replica-pin:{digest}'
+
+
+def start_request(request):
+    """
+    Выбирает базу для чтения в запросе.
+
+    Returns:
+        Token: Токен для finish_request.
+    """
+    alias = None
+    if REPLICAS and request.method in SAFE_METHODS:
+        key = _client_key(request)
+        if key is None or not cache.get(key):
+            alias = random.choice(REPLICAS)
+    return _replica.set(alias)
+
+
+def finish_request(request, token):
+    _replica.reset(token)
+    if REPLICAS and request.method not in SAFE_METHODS:
+        key = _client_key(request)
+        if key is not None:
+            cache.set(key, True, PIN_SECONDS)
+
+
+class ReplicaRouter:
+    """Чтение — с реплики запроса, если она выбрана; запись — в default."""
+
+    def db_for_read(self, model, **hints):
+        alias = _replica.get()
+        if (alias is None or model._meta.app_label in PRIMARY_APPS
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # Явно: иначе Django сохранил бы объект, прочитанный с реплики,
+        # обратно в реплику
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же строки, что и default
+        databases = {DEFAULT_DB_ALIAS, *REPLICAS}
+        return (obj1._state.db in databases
+                and obj2._state.db in databases) or None
@@ -0,0 +1,117 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+
+from api.models import Ingredient
+
+# Через сколько секунд индекс перестраивается, даже если сигналов не было:
+# изменения, сделанные в других процессах, сюда не доходят
+INDEX_TTL = getattr(settings, 'INGREDIENT_INDEX_TTL', 300)
+
+
+def normalize(value):
+    return value.casefold().replace('ё', 'е').strip()
+
+
+class IngredientIndex:
+    """
+    Индекс названий ингредиентов в памяти процесса.
+
+    Хранит отсортированный массив нормализованных названий и отвечает на
+    префиксный поиск бинарным поиском, а на поиск по вхождению — проходом
+    по массиву, не обращаясь к базе. Строится лениво при первом запросе
+    и сбрасывается сигналами при изменении Ingredient.
+    """
+
+    def __init__(self, ttl=INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._state = None
+
+    def invalidate(self):
+        self._state = None
+
+    def _build(self):
+        rows = list(Ingredient.objects.values(
+            'id', 'name', 'measurement_unit'))
+        keyed = sorted(
+            ((normalize(row['name']), row['id']) for row in rows),
+        )
+        keys = [key for key, _ in keyed]
+        starts, offset = [], 0
+        for key in keys:
+            starts.append(offset)
+            offset += len(key) + 1
+        return {
+            'built_at': time.monotonic(),
+            'keys': keys,
+            # Все названия одной строкой для быстрого поиска по вхождению
+            'haystack': '\n'.join(keys),
+            'starts': starts,
+            'ids': [pk for _, pk in keyed],
+            # Порядок по умолчанию совпадает с Meta.ordering = ['-id']
+            'rows': {
+                row['id']: row
+                for row in sorted(rows, key=lambda row: -row['id'])
+            },
+        }
+
+    def _get_state(self):
+        state = self._state
+        if state is None or time.monotonic() - state['built_at'] > self.ttl:
+            with self._lock:
+                state = self._state
+                if (state is None
+                        or time.monotonic() - state['built_at'] > self.ttl):
+                    state = self._state = self._build()
+        return state
+
+    def all(self):
+        """
+        Returns:
+            list[dict]: Все ингредиенты в порядке `-id`.
+        """
+        return list(self._get_state()['rows'].values())
+
+    def search(self, query, limit=None):
+        """
+        Ищет ингредиенты по началу названия, затем по вхождению.
+
+        Returns:
+            list[dict]: Совпадения по префиксу в алфавитном порядке
+            (точное совпадение первым), за ними совпадения по вхождению.
+        """
+        query = normalize(query)
+        state = self._get_state()
+        keys, ids, rows = state['keys'], state['ids'], state['rows']
+        if not query:
+            return self.all()[:limit]
+        found = []
+        start = bisect_left(keys, query)
+        position = start
+        while position < len(keys) and keys[position].startswith(query):
+            found.append(ids[position])
+            position += 1
+        if limit is None or len(found) < limit:
+            found.extend(self._contains(state, query, start, position))
+        if limit is not None:
+            found = found[:limit]
+        return [rows[pk] for pk in found]
+
+    def _contains(self, state, query, skip_from, skip_to):
+        haystack, starts, ids = (
+            state['haystack'], state['starts'], state['ids'])
+        found, last = [], -1
+        offset = haystack.find(query)
+        while offset != -1:
+            position = bisect_right(starts, offset) - 1
+            if position != last and not skip_from <= position < skip_to:
+                found.append(ids[position])
+            last = position
+            offset = haystack.find(query, offset + 1)
+        return found
+
+
+ingredient_index = IngredientIndex()
@@ -1,16 +1,26 @@
+from django.db import transaction
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from rest_framework.validators import UniqueTogetherValidator
 
-from api.models import Ingredient, IngredientAmount, Recipe, Tag
+from api import fulltext, jobs, shopping_list
+from api.coverage import coverage_index
+from api.images import variant_urls
+from api.models import ExportJob, Ingredient, IngredientAmount, Recipe, Tag
+from api.versions import bump_recipes
+from api.viewer import get_viewer
 from users.models import Follow
 from users.serializers import CustomUserSerializer
 
+# Больше рецептов за один запрос к избранному или корзине не принимается
+RECIPE_BATCH_SIZE = 100
+
 
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
-        fields = '__all__'
+        fields = ('id', 'name', 'color', 'slug')
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -37,8 +47,28 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
         ]
 
 
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии картинки рецепта."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        urls = variant_urls(value)
+        request = self.context.get('request')
+        if request is None:
+            return urls
+        return {
+            variant: {image_format: request.build_absolute_uri(url)
+                      for image_format, url in formats.items()}
+            for variant, formats in urls.items()
+        }
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
+    image_variants = ImageVariantsField()
     tags = TagSerializer(read_only=True, many=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = IngredientAmountSerializer(
@@ -52,79 +82,189 @@ class RecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time')
-
-    def to_representation(self, instance):
-        return CropRecipeSerializer().to_representation(instance)
+                  'is_in_shopping_cart', 'name', 'image', 'image_variants',
+                  'text', 'cooking_time')
 
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Recipe.objects.filter(favorites__user=user, id=obj.id).exists()
+        viewer = get_viewer(self.context.get('request'))
+        return viewer.is_favorited(obj.id)
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Recipe.objects.filter(cart__user=user, id=obj.id).exists()
+        viewer = get_viewer(self.context.get('request'))
+        return viewer.is_in_shopping_cart(obj.id)
 
     def validate(self, data):
-        ingredients = data.get('ingredients')
+        ingredients = self.initial_data.get('ingredients')
+        tags = self.initial_data.get('tags')
+        if ingredients is not None or not self.partial:
+            data['ingredients'] = self.validate_ingredient_amounts(
+                ingredients)
+        if tags is not None or not self.partial:
+            data['tags'] = self.validate_tag_ids(tags)
+        return data
+
+    def validate_ingredient_amounts(self, ingredients):
+        """
+        Проверяет ингредиенты рецепта, сверяя их id с базой одним запросом.
+
+        Returns:
+            dict: {ingredient_id: amount}.
+        """
         if not ingredients:
             raise serializers.ValidationError({
                 'ingredients': 'Нужен хоть один ингредиент для рецепта'})
-        ingredient_list = []
+        amounts = {}
         for ingredient in ingredients:
-            ingredient_list.append(ingredient)
-            if int(ingredient['amount']) < 0:
+            try:
+                ingredient_id = int(ingredient['id'])
+                amount = int(ingredient['amount'])
+            except (KeyError, TypeError, ValueError):
+                raise serializers.ValidationError({
+                    'ingredients': 'Укажите id и количество ингредиента'})
+            if amount < 1:
                 raise serializers.ValidationError({
                     'ingredients': (
                         'Убедитесь, что значение количества '
                         'ингредиента больше 0'
                     )
                 })
-        data['ingredients'] = ingredients
-        return data
+            if ingredient_id in amounts:
+                raise serializers.ValidationError({
+                    'ingredients': 'Ингредиенты не должны повторяться'})
+            amounts[ingredient_id] = amount
+        found = set(Ingredient.objects.filter(
+            id__in=amounts).values_list('id', flat=True))
+        if found != set(amounts):
+            raise serializers.ValidationError({
+                'ingredients': (
+                    'Ингредиенты не найдены: '
+                    + ', '.join(map(str, sorted(set(amounts) - found)))
+                )
+            })
+        return amounts
 
-    def create_ingredients(self, ingredients, recipe):
-        objs = [
-            IngredientAmount(
-                recipe=recipe,
-                ingredient_id=ingredient.get('id'),
-                amount=ingredient.get('amount')) for ingredient in ingredients
-        ]
-        IngredientAmount.objects.bulk_create(objs, len(objs))
+    def validate_tag_ids(self, tags):
+        if not tags:
+            raise serializers.ValidationError({
+                'tags': 'Нужен хоть один тег для рецепта'})
+        try:
+            tag_ids = {int(tag) for tag in tags}
+        except (TypeError, ValueError):
+            raise serializers.ValidationError({
+                'tags': 'Теги передаются списком id'})
+        found = set(Tag.objects.filter(
+            id__in=tag_ids).values_list('id', flat=True))
+        if found != tag_ids:
+            raise serializers.ValidationError({
+                'tags': (
+                    'Теги не найдены: '
+                    + ', '.join(map(str, sorted(tag_ids - found)))
+                )
+            })
+        return tag_ids
+
+    def sync_ingredients(self, recipe, amounts):
+        """
+        Приводит ингредиенты рецепта к `amounts` ({ingredient_id: amount}),
+        добавляя, изменяя и удаляя только отличающиеся строки.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in IngredientAmount.objects.filter(recipe=recipe)
+        }
+        to_create, to_update = [], []
+        for ingredient_id, amount in amounts.items():
+            item = current.get(ingredient_id)
+            if item is None:
+                to_create.append(IngredientAmount(
+                    recipe=recipe, ingredient_id=ingredient_id,
+                    amount=amount))
+            elif item.amount != amount:
+                item.amount = amount
+                to_update.append(item)
+        to_delete = [item.pk for ingredient_id, item in current.items()
+                     if ingredient_id not in amounts]
+        IngredientAmount.objects.bulk_create(to_create)
+        IngredientAmount.objects.bulk_update(to_update, ['amount'])
+        IngredientAmount.objects.filter(pk__in=to_delete).delete()
+        if to_create or to_update or to_delete:
+            # bulk_create и bulk_update не отправляют сигналы
+            bump_recipes(pk=recipe.pk)
+        if to_create:
+            fulltext.schedule([recipe.pk])
+            coverage_index.schedule([recipe.pk])
 
+    @transaction.atomic
     def create(self, validated_data):
-        image = validated_data.pop('image')
         ingredients_data = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
-        recipe = Recipe.objects.create(image=image, **validated_data)
+        recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags_data)
-        self.create_ingredients(ingredients_data, recipe)
+        self.sync_ingredients(recipe, ingredients_data)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ret = super().update(instance, validated_data)
-        ret.tags.clear()
-        tags_data = self.initial_data.get('tags')
-        ret.tags.set(tags_data)
-        IngredientAmount.objects.filter(recipe=instance).delete()
-        self.create_ingredients(validated_data.get('ingredients'), instance)
-        return ret
+        ingredients_data = validated_data.pop('ingredients', None)
+        tags_data = validated_data.pop('tags', None)
+        old_amounts = shopping_list.recipe_amounts(instance.id)
+        instance = super().update(instance, validated_data)
+        if tags_data is not None:
+            # set() добавляет и удаляет только отличающиеся теги
+            instance.tags.set(tags_data)
+        if ingredients_data is not None:
+            self.sync_ingredients(instance, ingredients_data)
+            shopping_list.recipe_changed(instance.id, old_amounts)
+        return instance
 
 
 class CropRecipeSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    """Пачка рецептов для избранного или корзины: {"recipes": [id, ...]}."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=RECIPE_BATCH_SIZE,
+    )
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    """Задание выгрузки; `download` появляется, когда файл готов."""
+
+    format = serializers.CharField(source='export_format', default='pdf')
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = ('id', 'kind', 'format', 'status', 'attempts', 'error',
+                  'created_at', 'finished_at', 'expires_at', 'download')
+        read_only_fields = ('status', 'attempts', 'error', 'created_at',
+                            'finished_at', 'expires_at')
+
+    def validate(self, data):
+        if data['export_format'] not in jobs.formats(data['kind']):
+            raise serializers.ValidationError({
+                'format': 'Доступные форматы: '
+                          + ', '.join(jobs.formats(data['kind']))})
+        return data
+
+    def get_download(self, obj):
+        if obj.status != ExportJob.DONE:
+            return None
+        return reverse('api:export-download', kwargs={'pk': obj.id},
+                       request=self.context.get('request'))
+
+
 class FollowSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField(source='author.id')
     email = serializers.ReadOnlyField(source='author.email')
@@ -158,17 +298,23 @@ class FollowSerializer(serializers.ModelSerializer):
         return data
 
     def get_is_subscribed(self, obj):
-        return Follow.objects.filter(
-            user=obj.user, author=obj.author
-        ).exists()
+        # Сериализуются только подписки текущего пользователя
+        return obj.user_id == self.context.get('request').user.id
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj.author)
-        if limit:
-            queryset = queryset[:int(limit)]
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is not None:
+            queryset = recipes_by_author.get(obj.author_id, [])
+        else:
+            request = self.context.get('request')
+            limit = request.GET.get('recipes_limit')
+            queryset = Recipe.objects.filter(author=obj.author)
+            if limit:
+                queryset = queryset[:int(limit)]
         return CropRecipeSerializer(queryset, many=True).data
 
     def get_recipes_count(self, obj):
+        stats = getattr(obj.author, 'author_stats', None)
+        if stats is not None:
+            return stats.recipes_count
         return Recipe.objects.filter(author=obj.author).count()
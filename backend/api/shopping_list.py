@@ -0,0 +1,210 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Sum
+
+from api.models import Cart, IngredientAmount, ShoppingListItem
+from api.versions import bump_model
+
+
+def recipe_amounts(recipe_id):
+    """
+    Returns:
+        Counter: Количество каждого ингредиента рецепта по его id.
+    """
+    return Counter(dict(IngredientAmount.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', 'amount')))
+
+
+def recipes_amounts(recipe_ids):
+    """
+    Returns:
+        Counter: Суммарное количество каждого ингредиента рецептов.
+    """
+    return Counter(dict(IngredientAmount.objects.filter(
+        recipe_id__in=recipe_ids).values_list('ingredient_id').annotate(
+        total=Sum('amount')).order_by()))
+
+
+def apply_deltas(user_ids, deltas):
+    """
+    Прибавляет `deltas` ({ingredient_id: количество}) к спискам покупок
+    пользователей, удаляя позиции, сумма которых стала нулевой.
+    """
+    deltas = {key: value for key, value in deltas.items() if value}
+    if not deltas:
+        return
+    with transaction.atomic():
+        for user_id in user_ids:
+            items = {
+                item.ingredient_id: item
+                for item in ShoppingListItem.objects.select_for_update(
+                ).filter(user_id=user_id, ingredient_id__in=deltas)
+            }
+            to_create, to_update, to_delete = [], [], []
+            for ingredient_id, delta in deltas.items():
+                item = items.get(ingredient_id)
+                if item is None:
+                    if delta > 0:
+                        to_create.append(ShoppingListItem(
+                            user_id=user_id, ingredient_id=ingredient_id,
+                            total=delta))
+                    continue
+                item.total += delta
+                if item.total > 0:
+                    to_update.append(item)
+                else:
+                    to_delete.append(item.pk)
+            ShoppingListItem.objects.bulk_create(to_create)
+            ShoppingListItem.objects.bulk_update(to_update, ['total'])
+            ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+
+
+def add_recipe(user, recipe_id):
+    """Учитывает рецепт, добавленный в корзину пользователя."""
+    apply_deltas([user.pk], recipe_amounts(recipe_id))
+
+
+def remove_recipe(user, recipe_id):
+    """Вычитает рецепт, убранный из корзины пользователя."""
+    apply_deltas([user.pk], {
+        ingredient_id: -amount
+        for ingredient_id, amount in recipe_amounts(recipe_id).items()
+    })
+
+
+def add_recipes(user, recipe_ids):
+    """Учитывает несколько рецептов, добавленных в корзину разом."""
+    apply_deltas([user.pk], recipes_amounts(recipe_ids))
+
+
+def remove_recipes(user, recipe_ids):
+    """Вычитает несколько рецептов, убранных из корзины разом."""
+    apply_deltas([user.pk], {
+        ingredient_id: -amount
+        for ingredient_id, amount in recipes_amounts(recipe_ids).items()
+    })
+
+
+def _lock_carts(recipe_id):
+    """
+    Блокирует корзины всех, у кого рецепт в корзине, так же, как
+    api.recipe_lists, и по возрастанию id пользователя: параллельное
+    добавление рецепта в корзину не создаст ту же позицию списка и не
+    разойдётся с правкой рецепта. Вызывается внутри транзакции.
+
+    Returns:
+        list[int]: id этих пользователей.
+    """
+    user_ids = sorted(Cart.objects.filter(
+        recipe_id=recipe_id).values_list('user_id', flat=True))
+    for user_id in user_ids:
+        bump_model(Cart, user_id)
+    return user_ids
+
+
+@transaction.atomic
+def recipe_changed(recipe_id, old_amounts):
+    """
+    Переносит изменение состава рецепта на всех, у кого он в корзине.
+
+    Args:
+        old_amounts (Counter): Состав рецепта до изменения.
+    """
+    user_ids = _lock_carts(recipe_id)
+    if not user_ids:
+        return
+    deltas = recipe_amounts(recipe_id)
+    deltas.subtract(old_amounts)
+    apply_deltas(user_ids, deltas)
+
+
+@transaction.atomic
+def recipe_deleted(recipe_id):
+    """Вычитает удаляемый рецепт из списков всех, у кого он в корзине."""
+    user_ids = _lock_carts(recipe_id)
+    if not user_ids:
+        return
+    apply_deltas(user_ids, {
+        ingredient_id: -amount
+        for ingredient_id, amount in recipe_amounts(recipe_id).items()
+    })
+
+
+def expected_totals(user_ids=None):
+    """
+    Считает списки покупок заново по корзинам.
+
+    Returns:
+        dict: {user_id: {ingredient_id: количество}}.
+    """
+    # Условия на корзину — в одном filter(): второй вызов по многозначной
+    # связи добавил бы ещё один JOIN и размножил строки
+    lookups = {'recipe__cart__isnull': False}
+    if user_ids is not None:
+        lookups['recipe__cart__user_id__in'] = user_ids
+    queryset = IngredientAmount.objects.filter(**lookups)
+    totals = defaultdict(dict)
+    rows = queryset.values_list(
+        'recipe__cart__user_id', 'ingredient_id').annotate(
+        total=Sum('amount')).order_by()
+    for user_id, ingredient_id, total in rows:
+        totals[user_id][ingredient_id] = total
+    return totals
+
+
+def stored_totals(user_ids=None):
+    queryset = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+    totals = defaultdict(dict)
+    rows = queryset.values_list(
+        'user_id', 'ingredient_id', 'total').order_by()
+    for user_id, ingredient_id, total in rows:
+        totals[user_id][ingredient_id] = total
+    return totals
+
+
+def find_drift(user_ids=None):
+    """
+    Сравнивает сохранённые списки покупок с пересчитанными.
+
+    Returns:
+        list[tuple]: (user_id, ingredient_id, сохранено, ожидается)
+        для каждой расходящейся позиции.
+    """
+    expected = expected_totals(user_ids)
+    stored = stored_totals(user_ids)
+    drift = []
+    for user_id in sorted(set(expected) | set(stored)):
+        want = expected.get(user_id, {})
+        have = stored.get(user_id, {})
+        for ingredient_id in sorted(set(want) | set(have)):
+            if want.get(ingredient_id) != have.get(ingredient_id):
+                drift.append((user_id, ingredient_id,
+                              have.get(ingredient_id),
+                              want.get(ingredient_id)))
+    return drift
+
+
+def rebuild(user_ids=None, batch_size=1000):
+    """
+    Пересобирает списки покупок с нуля.
+
+    Returns:
+        int: Количество записанных позиций.
+    """
+    expected = expected_totals(user_ids)
+    items = [
+        ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                         total=total)
+        for user_id, totals in expected.items()
+        for ingredient_id, total in totals.items()
+    ]
+    with transaction.atomic():
+        queryset = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            queryset = queryset.filter(user_id__in=user_ids)
+        queryset.delete()
+        ShoppingListItem.objects.bulk_create(items, batch_size=batch_size)
+    return len(items)
@@ -0,0 +1,175 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from api import fulltext, metrics
+from api.coverage import coverage_index
+from api.images import schedule_variants
+from api.models import (Cart, Favorite, Ingredient, IngredientAmount, Recipe,
+                        Tag)
+from api.search import ingredient_index
+from api.tags import clear_tag_bit, tag_map, update_tag_masks
+from api.versions import bump_model, bump_recipes
+from users.models import AuthorStats, Follow
+
+User = get_user_model()
+
+# Поля пользователя, которые попадают в ответы API: сохранение без их
+# изменения (например, last_login при входе) не сбрасывает кеши
+USER_PAYLOAD_FIELDS = ('username', 'email', 'first_name', 'last_name')
+# Атрибут пользователя: изменились ли поля из USER_PAYLOAD_FIELDS
+PAYLOAD_CHANGED_ATTR = '_foodgram_payload_changed'
+
+
+@receiver(connection_created)
+def time_queries(connection, **kwargs):
+    metrics.install(connection)
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def reset_ingredient_index(**kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def reset_tag_map(**kwargs):
+    tag_map.invalidate()
+
+
+@receiver(pre_delete, sender=Tag)
+def clear_deleted_tag_bit(instance, **kwargs):
+    clear_tag_bit(instance)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def sync_recipe_tag_mask(instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            update_tag_masks([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        update_tag_masks(pk_set)
+    elif action == 'pre_clear':
+        clear_tag_bit(instance)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver([post_save, post_delete], sender=IngredientAmount)
+@receiver(post_delete, sender=User)
+def bump_table_version(sender, **kwargs):
+    bump_model(sender)
+
+
+@receiver(pre_save, sender=User)
+def detect_user_payload_change(instance, using, update_fields=None,
+                               **kwargs):
+    if instance._state.adding:
+        changed = True
+    elif update_fields is not None:
+        changed = not set(update_fields).isdisjoint(USER_PAYLOAD_FIELDS)
+    else:
+        # Читаем из базы, в которую пишем: реплика может отставать
+        saved = User.objects.using(using).filter(pk=instance.pk).values(
+            *USER_PAYLOAD_FIELDS).first()
+        changed = saved is None or any(
+            saved[field] != getattr(instance, field)
+            for field in USER_PAYLOAD_FIELDS)
+    setattr(instance, PAYLOAD_CHANGED_ATTR, changed)
+
+
+def user_payload_changed(instance):
+    return getattr(instance, PAYLOAD_CHANGED_ATTR, True)
+
+
+@receiver(post_save, sender=User)
+def bump_user_version(sender, instance, **kwargs):
+    if user_payload_changed(instance):
+        bump_model(sender)
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+@receiver([post_save, post_delete], sender=Cart)
+@receiver([post_save, post_delete], sender=Follow)
+def bump_viewer_version(sender, instance, **kwargs):
+    bump_model(sender, instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_tags_version(action, **kwargs):
+    if action.startswith('post_'):
+        bump_model(Recipe)
+
+
+@receiver(post_save, sender=Recipe)
+def bump_recipe_fragment(instance, **kwargs):
+    bump_recipes(pk=instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def build_recipe_image_variants(instance, **kwargs):
+    source = instance.image.name if instance.image else None
+    if source and (instance.image_variants or {}).get('source') != source:
+        transaction.on_commit(
+            lambda: schedule_variants(instance.pk, source))
+
+
+@receiver([post_save, post_delete], sender=IngredientAmount)
+def bump_recipe_ingredients_fragment(instance, **kwargs):
+    bump_recipes(pk=instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_tags_fragment(instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            bump_recipes(pk=instance.pk)
+    elif action in ('post_add', 'post_remove'):
+        bump_recipes(pk__in=pk_set)
+    elif action == 'pre_clear':
+        bump_recipes(tags=instance)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def bump_tag_fragments(instance, **kwargs):
+    bump_recipes(tags=instance)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def bump_ingredient_fragments(instance, **kwargs):
+    bump_recipes(ingredients=instance)
+
+
+@receiver(post_save, sender=User)
+def create_author_stats(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=User)
+def bump_author_fragments(instance, created, raw=False, **kwargs):
+    # У нового автора ещё нет рецептов
+    if not (created or raw) and user_payload_changed(instance):
+        bump_recipes(author=instance)
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def index_recipe(instance, **kwargs):
+    fulltext.schedule([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=IngredientAmount)
+def index_recipe_ingredients(instance, **kwargs):
+    fulltext.schedule([instance.recipe_id])
+    coverage_index.schedule([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def index_ingredient_recipes(instance, **kwargs):
+    fulltext.schedule(IngredientAmount.objects.filter(
+        ingredient=instance).values_list('recipe_id', flat=True))
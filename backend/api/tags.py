@@ -0,0 +1,149 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, router, transaction
+from django.db.models import F
+
+from api.models import Recipe, Tag
+
+# Старший бит BigInteger занят знаком
+MAX_TAGS = 63
+# Через сколько секунд карта слагов перечитывается, даже если сигналов
+# не было: изменения, сделанные в других процессах, сюда не доходят
+TAG_MAP_TTL = getattr(settings, 'TAG_MAP_TTL', 60)
+# Неизвестный слаг перечитывает карту не чаще раза в столько секунд
+MISS_RELOAD_INTERVAL = 1
+
+
+class TagMap:
+    """
+    Соответствие слагов тегов их битам в Recipe.tag_mask, в памяти
+    процесса. Тегов единицы, поэтому карта читается одним запросом и
+    сбрасывается сигналами при изменении Tag.
+    """
+
+    def __init__(self, ttl=TAG_MAP_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._state = None
+
+    def invalidate(self):
+        self._state = None
+
+    def _get_state(self, reload=False):
+        state = self._state
+        if (reload or state is None
+                or time.monotonic() - state['built_at'] > self.ttl):
+            with self._lock:
+                if self._state is state:
+                    state = self._state = {
+                        'built_at': time.monotonic(),
+                        'bits': dict(Tag.objects.filter(
+                            bit__isnull=False).values_list('slug', 'bit')),
+                    }
+                state = self._state
+        return state
+
+    def mask(self, slugs):
+        """
+        Returns:
+            tuple[int, bool]: Маска известных слагов и признак, что
+            все слаги найдены.
+        """
+        state = self._get_state()
+        if any(slug not in state['bits'] for slug in slugs) and (
+                time.monotonic() - state['built_at'] > MISS_RELOAD_INTERVAL):
+            # Тег мог появиться в другом процессе
+            state = self._get_state(reload=True)
+        bits = state['bits']
+        mask = 0
+        for slug in slugs:
+            if slug in bits:
+                mask |= 1 << bits[slug]
+        return mask, all(slug in bits for slug in slugs)
+
+
+tag_map = TagMap()
+
+
+def free_bit():
+    """
+    Returns:
+        int: Наименьший бит, не занятый ни одним тегом.
+    """
+    taken = set(Tag.objects.filter(bit__isnull=False).values_list(
+        'bit', flat=True))
+    for bit in range(MAX_TAGS):
+        if bit not in taken:
+            return bit
+    raise ValidationError(f'Тегов не может быть больше {MAX_TAGS}')
+
+
+def save_with_free_bit(tag, save, *args, **kwargs):
+    """
+    Сохраняет тег без бита, назначив ему наименьший свободный.
+
+    Параллельно создаваемый тег может занять тот же бит раньше: тогда
+    уникальный индекс отклоняет вставку, и бит выбирается заново.
+
+    Args:
+        save (callable): Model.save тега.
+    """
+    using = kwargs.get('using') or router.db_for_write(Tag, instance=tag)
+    while True:
+        tag.bit = free_bit()
+        try:
+            with transaction.atomic(using=using):
+                save(*args, **kwargs)
+            return
+        except IntegrityError:
+            taken = Tag.objects.using(using).filter(bit=tag.bit).exists()
+            if not taken:
+                # Нарушено другое ограничение, например имя тега
+                tag.bit = None
+                raise
+
+
+def filter_by_tags(queryset, slugs, match_all=False):
+    """
+    Фильтрует рецепты по маске тегов, без JOIN с таблицей тегов.
+
+    Args:
+        slugs (list[str]): Слаги тегов из запроса.
+        match_all (bool): Нужны все теги сразу, а не хотя бы один.
+
+    Returns:
+        QuerySet[Recipe]: Отфильтрованный queryset.
+    """
+    mask, complete = tag_map.mask(slugs)
+    if not mask or (match_all and not complete):
+        return queryset.none()
+    queryset = queryset.alias(tag_hits=F('tag_mask').bitand(mask))
+    if match_all:
+        return queryset.filter(tag_hits=mask)
+    return queryset.filter(tag_hits__gt=0)
+
+
+def update_tag_masks(recipe_ids, batch_size=1000):
+    """Пересчитывает tag_mask рецептов по их тегам."""
+    recipe_ids = list(recipe_ids)
+    masks = dict.fromkeys(recipe_ids, 0)
+    for start in range(0, len(recipe_ids), batch_size):
+        batch = recipe_ids[start:start + batch_size]
+        for recipe_id, bit in Recipe.tags.through.objects.filter(
+                recipe_id__in=batch, tag__bit__isnull=False).values_list(
+                'recipe_id', 'tag__bit'):
+            masks[recipe_id] |= 1 << bit
+    Recipe.objects.bulk_update(
+        [Recipe(id=recipe_id, tag_mask=mask)
+         for recipe_id, mask in masks.items()],
+        ['tag_mask'], batch_size=batch_size)
+
+
+def clear_tag_bit(tag):
+    """Убирает бит тега из масок всех его рецептов."""
+    if tag.bit is not None:
+        Recipe.objects.filter(tags=tag).update(
+            tag_mask=F('tag_mask').bitand(~(1 << tag.bit)))
@@ -0,0 +1,845 @@
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import update_last_login
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.files.storage import default_storage
+from django.db import IntegrityError
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from api import (feeds, images, jobs, recipe_lists, replicas,
+                 shopping_list, tags)
+from api.models import (Cart, ExportJob, Favorite, Ingredient,
+                        IngredientAmount, ModelVersion, Recipe, Tag,
+                        TimelineEntry)
+from api.coverage import coverage_index
+from api.query_plans import check_plans
+from api.versions import get_validators, version_key
+from users.models import AuthorStats
+
+User = get_user_model()
+
+RECIPES = 20
+
+
+class RecipeQueriesTest(APITestCase):
+    """
+    Число SQL-запросов к рецептам не зависит от размера страницы:
+    автор, теги и ингредиенты подгружаются фиксированным числом запросов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='secret',
+            first_name='Читатель', last_name='Рецептов')
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='secret',
+            first_name='Автор', last_name='Рецептов')
+        cls.token = Token.objects.create(user=cls.user)
+        tags = [Tag.objects.create(name=name, color=color, slug=slug)
+                for name, color, slug in (
+                    ('Завтрак', '#E26C2D', 'breakfast'),
+                    ('Обед', '#49B64E', 'lunch'))]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(3)]
+        for number in range(RECIPES):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/test.png')
+            recipe.tags.set(tags)
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(recipe=recipe, ingredient=ingredient,
+                                 amount=100)
+                for ingredient in ingredients)
+        cls.recipe = recipe
+
+    def setUp(self):
+        # Закешированные представления рецептов скрыли бы запросы
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def assert_list_queries(self, limit, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.get(reverse('api:recipe-list'),
+                                       {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        for limit in (1, 6, RECIPES):
+            with self.subTest(limit=limit):
+                cache.clear()
+                self.assert_list_queries(limit, 10)
+
+    def test_cached_list_reads_only_page(self):
+        self.assert_list_queries(6, 10)
+        # Представления рецептов взяты из кеша
+        self.assert_list_queries(6, 7)
+
+    def test_anonymous_list_queries(self):
+        self.client.credentials()
+        for limit in (1, 6, RECIPES):
+            with self.subTest(limit=limit):
+                cache.clear()
+                self.assert_list_queries(limit, 6)
+
+    def test_retrieve_queries(self):
+        with self.assertNumQueries(9):
+            response = self.client.get(
+                reverse('api:recipe-detail', args=[self.recipe.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['ingredients']), 3)
+        self.assertEqual(len(response.data['tags']), 2)
+
+
+class CursorPaginationTest(APITestCase):
+    """Курсор не меняет порядок, заданный сортировкой или поиском."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='secret')
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.recipes = [
+                Recipe.objects.create(author=author, name=name,
+                                      text=text, cooking_time=10)
+                for name, text in (('Борщ', 'Свёкла'),
+                                   ('Салат', 'Борщ без свёклы'),
+                                   ('Каша', 'Овсянка'))]
+        for recipe, favorites in zip(cls.recipes, (5, 1, 3)):
+            Recipe.objects.filter(id=recipe.id).update(
+                favorites_count=favorites)
+
+    def recipe_ids(self, **params):
+        response = self.client.get(reverse('api:recipe-list'),
+                                   {'cursor': '', 'limit': 2, **params})
+        self.assertEqual(response.status_code, 200)
+        return response, [recipe['id'] for recipe in response.data['results']]
+
+    def test_cursor_pages_by_id(self):
+        response, ids = self.recipe_ids()
+        self.assertNotIn('count', response.data)
+        self.assertEqual(ids, [self.recipes[2].id, self.recipes[1].id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([recipe['id'] for recipe in response.data['results']],
+                         [self.recipes[0].id])
+
+    def test_cursor_keeps_ordering(self):
+        response, ids = self.recipe_ids(ordering='-favorites_count')
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(ids, [self.recipes[0].id, self.recipes[2].id])
+
+    def test_cursor_keeps_search_rank(self):
+        response, ids = self.recipe_ids(search='борщ')
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(ids, [self.recipes[0].id, self.recipes[1].id])
+
+
+class ShoppingListExportTest(APITestCase):
+    """Список покупок: PDF готовым файлом, txt и csv потоком."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='buyer', email='buyer@example.com', password='secret')
+        cls.recipe = Recipe.objects.create(author=cls.user, name='Блины',
+                                           text='Описание', cooking_time=10)
+        IngredientAmount.objects.create(
+            recipe=cls.recipe, amount=200,
+            ingredient=Ingredient.objects.create(name='Мука',
+                                                 measurement_unit='г'))
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        self.client.post(reverse('api:recipe-shopping-cart',
+                                 args=[self.recipe.id]))
+
+    def download(self, export_format):
+        response = self.client.get(
+            reverse('api:recipe-download-shopping-cart'),
+            {'format': export_format})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'shopping_list.{export_format}',
+                      response['Content-Disposition'])
+        return response, b''.join(response.streaming_content)
+
+    def test_pdf_is_sent_as_file(self):
+        response, content = self.download('pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertEqual(int(response['Content-Length']), len(content))
+
+    def test_txt_and_csv_are_streamed(self):
+        response, content = self.download('txt')
+        self.assertNotIn('Content-Length', response)
+        self.assertEqual(content.decode(), '<1> Мука - 200, г\n')
+        response, content = self.download('csv')
+        self.assertEqual(content.decode().splitlines(),
+                         ['name,measurement_unit,amount', 'Мука,г,200'])
+
+
+class ShoppingListTest(APITestCase):
+    """Список покупок совпадает с суммой составов рецептов в корзине."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='secret')
+        cls.buyer = User.objects.create_user(
+            username='buyer', email='buyer@example.com', password='secret')
+        cls.salt, cls.flour, cls.milk = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Соль', 'Мука', 'Молоко'))
+        cls.pancakes, cls.bread = (
+            Recipe.objects.create(author=cls.author, name=name,
+                                  text='Описание', cooking_time=10)
+            for name in ('Блины', 'Хлеб'))
+        IngredientAmount.objects.bulk_create([
+            IngredientAmount(recipe=cls.pancakes, ingredient=cls.flour,
+                             amount=200),
+            IngredientAmount(recipe=cls.pancakes, ingredient=cls.milk,
+                             amount=500),
+            IngredientAmount(recipe=cls.bread, ingredient=cls.flour,
+                             amount=300),
+            IngredientAmount(recipe=cls.bread, ingredient=cls.salt,
+                             amount=5),
+        ])
+
+    def cart(self, method, recipe):
+        self.client.force_authenticate(self.buyer)
+        response = getattr(self.client, method)(
+            reverse('api:recipe-shopping-cart', args=[recipe.id]))
+        self.assertIn(response.status_code, (201, 204))
+
+    def assert_totals(self, totals):
+        self.assertEqual(shopping_list.find_drift(), [])
+        self.assertEqual(dict(shopping_list.stored_totals()),
+                         {self.buyer.id: totals} if totals else {})
+
+    def test_totals_follow_cart_and_recipe_edits(self):
+        self.cart('post', self.pancakes)
+        self.cart('post', self.bread)
+        self.assert_totals({self.flour.id: 500, self.milk.id: 500,
+                            self.salt.id: 5})
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(
+            reverse('api:recipe-detail', args=[self.pancakes.id]),
+            {'ingredients': [{'id': self.flour.id, 'amount': 250},
+                             {'id': self.salt.id, 'amount': 2}]},
+            format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assert_totals({self.flour.id: 550, self.salt.id: 7})
+        self.cart('delete', self.bread)
+        self.assert_totals({self.flour.id: 250, self.salt.id: 2})
+        self.assertEqual(shopping_list.rebuild(), 2)
+        self.assert_totals({self.flour.id: 250, self.salt.id: 2})
+        self.cart('delete', self.pancakes)
+        self.assert_totals({})
+
+
+class UserVersionTest(APITestCase):
+    """Кеши с пользователями сбрасываются только при изменении их полей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='secret')
+
+    def etag(self):
+        return get_validators([version_key(User)])[0]
+
+    def test_login_keeps_version(self):
+        etag = self.etag()
+        update_last_login(None, self.user)
+        self.user.save()
+        self.assertEqual(self.etag(), etag)
+
+    def test_payload_change_bumps_version(self):
+        etag = self.etag()
+        self.user.first_name = 'Читатель'
+        self.user.save()
+        self.assertNotEqual(self.etag(), etag)
+
+    def test_login_keeps_recipe_versions(self):
+        recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/test.png')
+        recipe.refresh_from_db()
+        version = recipe.version
+        update_last_login(None, self.user)
+        self.user.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.version, version)
+        self.user.last_name = 'Рецептов'
+        self.user.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.version, version + 1)
+
+
+class ImageVariantsTest(APITestCase):
+    """Готовые варианты картинки меняют ETag списка рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='secret')
+        cls.recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Описание', cooking_time=10,
+            image='recipes/test.png')
+
+    def etag(self):
+        return get_validators([version_key(Recipe)])[0]
+
+    def test_saved_variants_bump_version(self):
+        etag = self.etag()
+        variants = {'source': 'recipes/test.png'}
+        self.assertTrue(images.save_variants(self.recipe.id,
+                                             'recipes/test.png', variants))
+        self.assertNotEqual(self.etag(), etag)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, variants)
+
+    def test_replaced_image_keeps_version(self):
+        etag = self.etag()
+        self.assertFalse(images.save_variants(self.recipe.id,
+                                              'recipes/old.png', {}))
+        self.assertEqual(self.etag(), etag)
+
+
+class TagMaskTest(APITestCase):
+    """Фильтр по тегам читает маску рецепта, а не таблицу связей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='secret')
+        cls.breakfast, cls.lunch, cls.dinner = (
+            Tag.objects.create(name=name, color=color, slug=slug)
+            for name, color, slug in (
+                ('Завтрак', Tag.BLUE, 'breakfast'),
+                ('Обед', Tag.GREEN, 'lunch'),
+                ('Ужин', Tag.ORANGE, 'dinner')))
+        cls.both, cls.only_lunch = (
+            Recipe.objects.create(author=author, name=name, text='Описание',
+                                  cooking_time=10)
+            for name in ('Омлет', 'Суп'))
+        cls.both.tags.set([cls.breakfast, cls.lunch])
+        cls.only_lunch.tags.set([cls.lunch])
+
+    def setUp(self):
+        tags.tag_map.invalidate()
+
+    def recipe_ids(self, **params):
+        response = self.client.get(reverse('api:recipe-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return {recipe['id'] for recipe in response.data['results']}
+
+    def test_any_tag(self):
+        self.assertEqual(
+            self.recipe_ids(tags=['breakfast', 'lunch']),
+            {self.both.id, self.only_lunch.id})
+        self.assertEqual(self.recipe_ids(tags=['breakfast']), {self.both.id})
+        self.assertEqual(self.recipe_ids(tags=['dinner']), set())
+        self.assertEqual(self.recipe_ids(tags=['unknown']), set())
+
+    def test_all_tags(self):
+        self.assertEqual(
+            self.recipe_ids(tags=['breakfast', 'lunch'], tags_match='all'),
+            {self.both.id})
+        self.assertEqual(
+            self.recipe_ids(tags=['lunch', 'unknown'], tags_match='all'),
+            set())
+
+    def test_removed_tag_clears_mask(self):
+        self.both.tags.remove(self.breakfast)
+        self.assertEqual(self.recipe_ids(tags=['breakfast']), set())
+        self.lunch.delete()
+        self.assertEqual(self.recipe_ids(tags=['lunch']), set())
+
+    def test_bit_is_not_exposed(self):
+        response = self.client.get(reverse('api:tag-detail',
+                                           args=[self.lunch.id]))
+        self.assertEqual(set(response.data), {'id', 'name', 'color', 'slug'})
+
+    def test_taken_bit_is_chosen_again(self):
+        # Бит 0 занял параллельно созданный тег
+        with mock.patch.object(tags, 'free_bit', side_effect=[0, 3]):
+            tag = Tag.objects.create(name='Перекус', color=Tag.PURPLE,
+                                     slug='snack')
+        self.assertEqual(tag.bit, 3)
+
+    def test_other_conflict_is_raised(self):
+        tag = Tag(name='Обед', color=Tag.PURPLE, slug='snack')
+        with self.assertRaises(IntegrityError):
+            tag.save()
+        self.assertIsNone(tag.bit)
+
+    def test_tag_limit(self):
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {bit}', color=f'#{bit:06X}', slug=f'tag-{bit}',
+                bit=bit)
+            for bit in range(3, tags.MAX_TAGS))
+        with self.assertRaises(ValidationError):
+            Tag.objects.create(name='Лишний', color=Tag.PURPLE, slug='extra')
+
+
+class ViewerVersionTest(APITestCase):
+    """Связи пользователя меняют только его собственный счётчик."""
+
+    def test_favorite_bumps_only_user_key(self):
+        user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='secret')
+        recipe = Recipe.objects.create(author=user, name='Рецепт',
+                                       text='Описание', cooking_time=10)
+        favorite = Favorite.objects.create(user=user, recipe=recipe)
+        favorite.delete()
+        self.assertEqual(
+            dict(ModelVersion.objects.filter(
+                name__startswith='api.favorite').values_list(
+                'name', 'version')),
+            {version_key(Favorite, user.id): 2})
+
+    def test_counter_ordering_has_no_etag(self):
+        response = self.client.get(reverse('api:recipe-list'))
+        self.assertIn('ETag', response)
+        response = self.client.get(reverse('api:recipe-list'),
+                                   {'ordering': '-favorites_count'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+
+class RecipeFragmentTest(APITestCase):
+    """Закешированное представление рецепта сбрасывается его правками."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='secret',
+            first_name='Автор')
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@example.com', password='secret')
+        cls.tag = Tag.objects.create(name='Завтрак', color=Tag.BLUE,
+                                     slug='breakfast')
+        cls.ingredient = Ingredient.objects.create(name='Яйцо',
+                                                   measurement_unit='шт')
+        cls.recipe = Recipe.objects.create(author=cls.author, name='Омлет',
+                                           text='Описание', cooking_time=10)
+        cls.recipe.tags.set([cls.tag])
+        IngredientAmount.objects.create(recipe=cls.recipe,
+                                        ingredient=cls.ingredient, amount=2)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.reader)
+        # Первый запрос кладёт представление в кеш
+        self.get()
+
+    def get(self):
+        response = self.client.get(reverse('api:recipe-detail',
+                                           args=[self.recipe.id]))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_author_change(self):
+        self.author.first_name = 'Повар'
+        self.author.save()
+        self.assertEqual(self.get()['author']['first_name'], 'Повар')
+
+    def test_tag_change(self):
+        self.tag.name = 'Утро'
+        self.tag.save()
+        self.assertEqual(self.get()['tags'][0]['name'], 'Утро')
+        self.recipe.tags.clear()
+        self.assertEqual(self.get()['tags'], [])
+
+    def test_ingredient_change(self):
+        self.ingredient.name = 'Перепелиное яйцо'
+        self.ingredient.save()
+        self.assertEqual(self.get()['ingredients'][0]['name'],
+                         'Перепелиное яйцо')
+
+    def test_viewer_flags_are_not_cached(self):
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        self.assertTrue(self.get()['is_favorited'])
+        self.client.force_authenticate(self.author)
+        self.assertFalse(self.get()['is_favorited'])
+
+
+class QueryPlanTest(APITestCase):
+    """Горячие запросы представлений читают таблицы по индексам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='secret')
+        ingredient = Ingredient.objects.create(name='Соль',
+                                               measurement_unit='г')
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                author=user, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/test.png')
+            IngredientAmount.objects.create(recipe=recipe,
+                                            ingredient=ingredient, amount=5)
+            Favorite.objects.create(user=user, recipe=recipe)
+            Cart.objects.create(user=user, recipe=recipe)
+
+    def test_hot_queries_use_indexes(self):
+        for result in check_plans():
+            with self.subTest(query=result.query.name):
+                self.assertTrue(result.ok, result.plan)
+
+
+class RecipeSearchTest(APITestCase):
+    """Поиск ранжирует совпадения в названии выше совпадений в описании."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='secret')
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.in_text = Recipe.objects.create(
+                author=author, name='Салат', text='Борщ подают со сметаной',
+                cooking_time=10)
+            cls.in_name = Recipe.objects.create(
+                author=author, name='Борщ', text='Свёкла и капуста',
+                cooking_time=60)
+            Recipe.objects.create(
+                author=author, name='Каша', text='Овсянка на молоке',
+                cooking_time=15)
+
+    def test_search_orders_by_rank(self):
+        response = self.client.get(reverse('api:recipe-list'),
+                                   {'search': 'борщ'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([recipe['id'] for recipe in response.data['results']],
+                         [self.in_name.id, self.in_text.id])
+
+    def test_search_matches_prefix(self):
+        response = self.client.get(reverse('api:recipe-list'),
+                                   {'search': 'овся'})
+        self.assertEqual(response.data['count'], 1)
+
+
+class RecipeListsTest(APITestCase):
+    """Пачки избранного меняют счётчики только на реально изменённые строки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='secret')
+        cls.recipes = [
+            Recipe.objects.create(author=cls.user, name=f'Рецепт {number}',
+                                  text='Описание', cooking_time=10)
+            for number in range(3)]
+
+    def favorites_counts(self):
+        return [recipe.favorites_count for recipe in Recipe.objects.filter(
+            id__in=[recipe.id for recipe in self.recipes]).order_by('id')]
+
+    def test_add_counts_only_new_recipes(self):
+        first, second, third = (recipe.id for recipe in self.recipes)
+        recipe_lists.add_one(Favorite, self.user, first)
+        outcomes = recipe_lists.add(Favorite, self.user,
+                                    [first, second, 0, second])
+        self.assertEqual(outcomes, {first: recipe_lists.EXISTS,
+                                    second: recipe_lists.ADDED,
+                                    0: recipe_lists.NOT_FOUND})
+        self.assertEqual(self.favorites_counts(), [1, 1, 0])
+        outcomes = recipe_lists.remove(Favorite, self.user, [first, third])
+        self.assertEqual(outcomes, {first: recipe_lists.REMOVED,
+                                    third: recipe_lists.ABSENT})
+        self.assertEqual(self.favorites_counts(), [0, 1, 0])
+        self.assertFalse(recipe_lists.remove_one(Favorite, self.user, first))
+
+    def test_add_one_queries(self):
+        recipe_id = self.recipes[0].id
+        # UPSERT счётчика изменений, INSERT, UPDATE счётчика рецепта и
+        # точка сохранения транзакции вокруг них
+        with self.assertNumQueries(5):
+            self.assertTrue(
+                recipe_lists.add_one(Favorite, self.user, recipe_id))
+        self.assertFalse(recipe_lists.add_one(Favorite, self.user, recipe_id))
+        self.assertEqual(self.favorites_counts(), [1, 0, 0])
+
+
+class MetricsAccessTest(APITestCase):
+    """Метрики закрыты, пока не задан токен Prometheus."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='secret',
+            is_staff=True)
+
+    def test_without_token_only_staff(self):
+        url = reverse('api:metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(METRICS_TOKEN='scrape')
+    def test_token(self):
+        url = reverse('api:metrics')
+        self.assertEqual(self.client.get(
+            url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get(
+            url, HTTP_AUTHORIZATION='Bearer scrape').status_code, 200)
+
+
+class FeedTest(APITestCase):
+    """Лента подписок: рассылка при публикации и копия при подписке."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@example.com', password='secret')
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='secret')
+        cls.old = [cls.create_recipe(f'Рецепт {number}')
+                   for number in range(2)]
+
+    @classmethod
+    def create_recipe(cls, name):
+        return Recipe.objects.create(author=cls.author, name=name,
+                                     text='Описание', cooking_time=10)
+
+    def setUp(self):
+        self.client.force_authenticate(self.reader)
+
+    def subscribe(self, method='post'):
+        response = getattr(self.client, method)(
+            reverse('api_users:user-subscribe', args=[self.author.id]))
+        self.assertIn(response.status_code, (201, 204))
+
+    def publish(self, name):
+        recipe = self.create_recipe(name)
+        feeds.publish(recipe)
+        return recipe
+
+    def feed(self, **params):
+        response = self.client.get(reverse('api:recipe-feed'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, [recipe['id'] for recipe in response.data['results']]
+
+    def test_follow_backfills_and_unfollow_clears(self):
+        self.assertEqual(self.feed()[1], [])
+        self.subscribe()
+        self.assertEqual(self.feed()[1], [self.old[1].id, self.old[0].id])
+        new = self.publish('Новый')
+        self.assertEqual(self.feed()[1],
+                         [new.id, self.old[1].id, self.old[0].id])
+        self.subscribe('delete')
+        self.assertEqual(self.feed()[1], [])
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.reader).exists())
+
+    def test_cursor_pages(self):
+        self.subscribe()
+        new = self.publish('Новый')
+        response, ids = self.feed(limit=2)
+        self.assertEqual(ids, [new.id, self.old[1].id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([recipe['id'] for recipe in response.data['results']],
+                         [self.old[0].id])
+        self.assertIsNone(response.data['next'])
+
+    def test_popular_author_is_read_on_request(self):
+        self.subscribe()
+        with mock.patch.object(feeds, 'FANOUT_MAX_FOLLOWERS', 1):
+            new = self.publish('Новый')
+        self.assertTrue(AuthorStats.objects.get(user=self.author).pull_feed)
+        self.assertFalse(TimelineEntry.objects.filter(recipe=new).exists())
+        # Скопированные раньше записи не повторяются
+        self.assertEqual(self.feed()[1],
+                         [new.id, self.old[1].id, self.old[0].id])
+
+    def test_rebuild_matches_incremental(self):
+        self.subscribe()
+        self.publish('Новый')
+        entries = set(TimelineEntry.objects.values_list('user_id',
+                                                        'recipe_id'))
+        self.assertEqual(feeds.rebuild(), 3)
+        self.assertEqual(set(TimelineEntry.objects.values_list(
+            'user_id', 'recipe_id')), entries)
+
+
+class CoverageIndexTest(APITestCase):
+    """Подбор по ингредиентам видит правки состава после коммита."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='secret')
+        cls.egg, cls.milk, cls.flour = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Яйцо', 'Молоко', 'Мука'))
+        cls.omelette, cls.pancakes = (
+            Recipe.objects.create(author=cls.author, name=name,
+                                  text='Описание', cooking_time=10)
+            for name in ('Омлет', 'Блины'))
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe, ingredient in (
+                (cls.omelette, cls.egg), (cls.omelette, cls.milk),
+                (cls.pancakes, cls.egg), (cls.pancakes, cls.milk),
+                (cls.pancakes, cls.flour)))
+
+    def setUp(self):
+        coverage_index.invalidate()
+        self.addCleanup(coverage_index.invalidate)
+
+    def test_ranking(self):
+        self.assertEqual(
+            coverage_index.match([self.egg.id, self.milk.id]),
+            [(self.omelette.id, 2, 0), (self.pancakes.id, 2, 1)])
+        self.assertEqual(coverage_index.match([self.flour.id], max_missing=1),
+                         [])
+
+    def test_recipe_edit_updates_index(self):
+        coverage_index.match([self.egg.id])
+        self.client.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse('api:recipe-detail', args=[self.omelette.id]),
+                {'ingredients': [{'id': self.egg.id, 'amount': 3},
+                                 {'id': self.flour.id, 'amount': 1}]},
+                format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            coverage_index.match([self.milk.id]),
+            [(self.pancakes.id, 1, 2)])
+        self.assertEqual(
+            coverage_index.match([self.flour.id]),
+            [(self.omelette.id, 1, 1), (self.pancakes.id, 1, 2)])
+
+    def test_deleted_recipe_leaves_index(self):
+        coverage_index.match([self.egg.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pancakes.delete()
+        self.assertEqual(coverage_index.match([self.egg.id, self.flour.id]),
+                         [(self.omelette.id, 1, 1)])
+
+
+class ExportJobTest(APITestCase):
+    """Очередь выгрузок: взятие, аренда, повторы и общие файлы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other = (
+            User.objects.create_user(username=name,
+                                     email=f'{name}@example.com',
+                                     password='secret')
+            for name in ('reader', 'other'))
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def submit(self, user=None):
+        return jobs.submit(user or self.user, ExportJob.SHOPPING_LIST, 'txt')
+
+    def test_same_input_is_not_queued_twice(self):
+        job, created = self.submit()
+        self.assertTrue(created)
+        self.assertEqual(self.submit(), (job, False))
+
+    def test_run_renders_file_once(self):
+        job, _ = self.submit()
+        self.assertEqual(jobs.run_next(), ExportJob.DONE)
+        self.assertIsNone(jobs.run_next())
+        job.refresh_from_db()
+        self.assertTrue(default_storage.exists(job.result))
+        # Тот же список другого пользователя ссылается на готовый файл
+        other, created = self.submit(self.other)
+        self.assertTrue(created)
+        self.assertEqual((other.status, other.result),
+                         (ExportJob.DONE, job.result))
+
+    def test_recipe_book_is_rendered_to_pdf(self):
+        recipe = Recipe.objects.create(author=self.other, name='Омлет',
+                                       text='Взбить яйца', cooking_time=10)
+        Favorite.objects.create(user=self.user, recipe=recipe)
+        job, _ = jobs.submit(self.user, ExportJob.RECIPE_BOOK, 'pdf')
+        self.assertEqual(jobs.run_next(), ExportJob.DONE)
+        job.refresh_from_db()
+        with default_storage.open(job.result, 'rb') as result:
+            self.assertEqual(result.read(4), b'%PDF')
+
+    def test_failed_render_is_retried_then_failed(self):
+        job, _ = self.submit()
+        with mock.patch.object(jobs, '_render', side_effect=OSError('диск')), \
+                self.assertLogs('api.jobs', 'ERROR'):
+            self.assertEqual(jobs.run_next(), ExportJob.PENDING)
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, 1)
+            self.assertGreater(job.run_after, timezone.now())
+            # Пауза перед повтором ещё не прошла
+            self.assertIsNone(jobs.claim())
+            for attempt in range(2, jobs.MAX_ATTEMPTS + 1):
+                ExportJob.objects.filter(pk=job.pk).update(
+                    run_after=timezone.now())
+                outcome = jobs.run_next()
+        self.assertEqual(outcome, ExportJob.FAILED)
+        job.refresh_from_db()
+        self.assertEqual((job.attempts, job.error),
+                         (jobs.MAX_ATTEMPTS, 'диск'))
+
+    def test_expired_lease_is_claimed_again(self):
+        job, _ = self.submit()
+        claimed = jobs.claim()
+        self.assertEqual((claimed.pk, claimed.status),
+                         (job.pk, ExportJob.RUNNING))
+        self.assertIsNone(jobs.claim())
+        # Воркер упал, аренда истекла
+        ExportJob.objects.filter(pk=job.pk).update(
+            locked_until=timezone.now() - timedelta(seconds=1))
+        again = jobs.claim()
+        self.assertEqual((again.pk, again.attempts), (job.pk, 2))
+        # Прежний воркер уже не может закрыть задание
+        self.assertEqual(jobs.process(claimed), ExportJob.DONE)
+        claimed.refresh_from_db()
+        self.assertEqual(claimed.status, ExportJob.RUNNING)
+        self.assertEqual(jobs.process(again), ExportJob.DONE)
+        again.refresh_from_db()
+        self.assertEqual(again.status, ExportJob.DONE)
+
+    def test_active_jobs_limit(self):
+        for number in range(jobs.USER_ACTIVE_JOBS):
+            ExportJob.objects.create(
+                user=self.user, kind=ExportJob.SHOPPING_LIST,
+                export_format='txt', input_hash=str(number),
+                run_after=timezone.now())
+        with self.assertRaises(jobs.TooManyJobs):
+            self.submit()
+
+
+class ReplicaCacheTest(SimpleTestCase):
+    """С репликами метки записи должны лежать в общем кеше."""
+
+    def test_process_cache_is_rejected(self):
+        with mock.patch.object(replicas, 'REPLICAS', ['replica_1']):
+            with self.assertRaises(ImproperlyConfigured):
+                replicas.check_cache()
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://cache:6379'}})
+    def test_shared_cache_is_accepted(self):
+        with mock.patch.object(replicas, 'REPLICAS', ['replica_1']):
+            replicas.check_cache()
+
+    def test_no_replicas(self):
+        with mock.patch.object(replicas, 'REPLICAS', []):
+            replicas.check_cache()
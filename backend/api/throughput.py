@@ -0,0 +1,203 @@
+"""
+Пропускная способность под одновременными запросами: WSGI против ASGI.
+
+Режим wsgi повторяет нынешний деплой — синхронные воркеры gunicorn:
+воркер обслуживает один запрос за раз, остальные клиенты ждут в очереди.
+Режим asgi — один процесс с циклом событий и асинхронными
+представлениями api.offload. В обоих режимах `concurrency` клиентов без
+пауз запрашивают по кругу маршруты READ_CASES в течение `duration`
+секунд; задержка считается от отправки запроса, вместе с ожиданием
+свободного воркера. `db_latency` добавляет паузу к каждому SQL-запросу,
+чтобы изобразить базу по сети, а не файл SQLite рядом с процессом.
+
+Запросы только читают, но замер идёт из нескольких потоков и процессов
+и не откатывается, поэтому пароль и токен (см. benchmarks.Sample)
+выставляются только пользователям seed_data; без них замер не
+запускается. Маршруты выбираются при импорте
+api.urls по настройке ASYNC_VIEWS, поэтому команда benchmark_throughput
+запускает каждый режим в отдельном процессе.
+"""
+import asyncio
+import threading
+import time
+from urllib.parse import urlencode
+
+from django.db import close_old_connections, connection
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from api.benchmarks import SCENARIOS, Sample, _resolve, percentile
+
+READ_CASES = ('tags list', 'ingredients search', 'recipes list',
+              'recipes detail', 'shopping cart pdf')
+
+
+class DatabaseLatency:
+    """Обёртка execute_wrapper: пауза перед каждым SQL-запросом."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+def build_requests(sample):
+    """
+    Returns:
+        list[tuple[str, dict]]: Адрес и заголовки каждого запроса.
+    """
+    cases = {case.name: case for scenario in SCENARIOS for case in scenario}
+    requests = []
+    for name in READ_CASES:
+        case = cases[name]
+        url = reverse(case.url_name,
+                      kwargs=_resolve(case.kwargs, sample, {}))
+        params = _resolve(case.params, sample, {})
+        if params:
+            url = f'{url}?{urlencode(params, doseq=True)}'
+        headers = {}
+        if case.auth == 'user':
+            headers['Authorization'] = f'Token {sample.token}'
+        requests.append((url, headers))
+    return requests
+
+
+def run_wsgi(requests, concurrency, duration, workers):
+    """
+    Returns:
+        list[tuple[int, float]]: Статус и задержка каждого запроса.
+    """
+    free_workers = threading.Semaphore(workers)
+    deadline = time.perf_counter() + duration
+    results = []
+
+    def client(offset):
+        http = Client(raise_request_exception=False)
+        number = offset
+        while time.perf_counter() < deadline:
+            url, headers = requests[number % len(requests)]
+            number += 1
+            start = time.perf_counter()
+            with free_workers:
+                # Тестовый клиент не закрывает соединения по сигналам
+                # запроса, обработчик WSGI закрыл бы
+                close_old_connections()
+                response = http.get(url, headers=headers)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                close_old_connections()
+            results.append((response.status_code,
+                            time.perf_counter() - start))
+        connection.close()
+
+    threads = [threading.Thread(target=client, args=(offset,))
+               for offset in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+async def _run_asgi(requests, concurrency, duration):
+    http = AsyncClient(raise_request_exception=False)
+    deadline = time.perf_counter() + duration
+    results = []
+
+    async def client(offset):
+        number = offset
+        while time.perf_counter() < deadline:
+            url, headers = requests[number % len(requests)]
+            number += 1
+            start = time.perf_counter()
+            response = await http.get(url, headers=headers)
+            if response.streaming:
+                async for _ in response:
+                    pass
+            results.append((response.status_code,
+                            time.perf_counter() - start))
+
+    await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+    return results
+
+
+def run_asgi(requests, concurrency, duration):
+    """
+    Returns:
+        list[tuple[int, float]]: Статус и задержка каждого запроса.
+    """
+    return asyncio.run(_run_asgi(requests, concurrency, duration))
+
+
+def run(mode, concurrency=16, duration=10, workers=1, db_latency=0.0):
+    """
+    Прогревает кеши одним проходом по маршрутам и замеряет режим.
+
+    Args:
+        mode (str): 'wsgi' или 'asgi'.
+        workers (int): Синхронных воркеров в режиме wsgi.
+        db_latency (float): Пауза перед каждым SQL-запросом, секунды.
+
+    Returns:
+        dict: Число запросов и ошибок, запросов в секунду и перцентили
+        задержки.
+
+    Raises:
+        ValueError: В базе нет пользователей seed_data.
+    """
+    sample = Sample(seed_only=True)
+    requests = build_requests(sample)
+    latency = None
+    if db_latency:
+        latency = DatabaseLatency(db_latency)
+        connection_created.connect(latency.install)
+    try:
+        if mode == 'asgi':
+            asyncio.run(_warm_asgi(requests))
+            started = time.perf_counter()
+            results = run_asgi(requests, concurrency, duration)
+        else:
+            _warm_wsgi(requests)
+            started = time.perf_counter()
+            results = run_wsgi(requests, concurrency, duration, workers)
+        elapsed = time.perf_counter() - started
+    finally:
+        if latency is not None:
+            connection_created.disconnect(latency.install)
+    latencies = [delay for _, delay in results] or [0.0]
+    return {
+        'mode': mode,
+        'concurrency': concurrency,
+        'workers': workers if mode == 'wsgi' else None,
+        'db_latency_ms': db_latency * 1000,
+        'requests': len(results),
+        'errors': sum(1 for status, _ in results if status >= 400),
+        'rps': round(len(results) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def _warm_wsgi(requests):
+    http = Client(raise_request_exception=False)
+    for url, headers in requests:
+        response = http.get(url, headers=headers)
+        if response.streaming:
+            b''.join(response.streaming_content)
+
+
+async def _warm_asgi(requests):
+    http = AsyncClient(raise_request_exception=False)
+    for url, headers in requests:
+        response = await http.get(url, headers=headers)
+        if response.streaming:
+            async for _ in response:
+                pass
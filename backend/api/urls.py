@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api.views import IngredientsViewSet, RecipeViewSet, TagsViewSet
+from api.offload import offload_patterns
+from api.views import (ExportJobViewSet, IngredientsViewSet, MetricsView,
+                       RecipeViewSet, TagsViewSet)
 
 app_name = 'api'
 
@@ -9,7 +12,19 @@ router = DefaultRouter()
 router.register('tags', TagsViewSet)
 router.register('ingredients', IngredientsViewSet)
 router.register('recipes', RecipeViewSet)
+router.register('exports', ExportJobViewSet, basename='export')
+
+# Маршруты, которые в режиме ASGI выполняются в пуле потоков
+ASYNC_ROUTES = (
+    'tag-list', 'tag-detail', 'ingredient-list', 'ingredient-detail',
+    'recipe-list', 'recipe-detail', 'recipe-download-shopping-cart',
+)
+
+router_urls = router.urls
+if settings.ASYNC_VIEWS:
+    router_urls = offload_patterns(router_urls, ASYNC_ROUTES)
 
 urlpatterns = [
-    path('', include(router.urls)),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('', include(router_urls)),
 ]
@@ -2,8 +2,14 @@ from enum import Enum
 
 
 class Tuples(tuple, Enum):
-    # Размер сохраняемого изображения рецепта
+    # Размер сохраняемого изображения рецепта (вариант для карточки)
     RECIPE_IMAGE_SIZE = 500, 300
+    # Размер миниатюры рецепта (подписки, список покупок)
+    RECIPE_THUMB_SIZE = 250, 150
+    # Предельный размер полноразмерного варианта изображения
+    RECIPE_FULL_SIZE = 1600, 960
+    # Форматы, в которых сохраняются варианты изображения
+    RECIPE_IMAGE_FORMATS = 'JPEG', 'WEBP'
     # Поиск объектов только с переданным параметром.
     # Например только в избранном: `is_favorited=1`
     SYMBOL_TRUE_SEARCH = '1', 'true'
@@ -27,3 +33,13 @@ class UrlQueries(str, Enum):
     AUTHOR = 'author'
     # Параметр для поиска объектов по тэгам
     TAGS = 'tags'
+    # `tags_match=all` — только рецепты со всеми переданными тегами,
+    # иначе с любым из них
+    TAGS_MATCH = 'tags_match'
+    # Ингредиенты, которые есть у пользователя: `ingredients=1,2`
+    # или `ingredients=1&ingredients=2`
+    INGREDIENTS = 'ingredients'
+    # Не больше стольких недостающих ингредиентов в рецепте
+    MAX_MISSING = 'max_missing'
+    # Сортировка рецептов по счётчику: `ordering=-favorites_count`
+    ORDERING = 'ordering'
@@ -0,0 +1,80 @@
+import hashlib
+
+from django.db import connections, router
+from django.db.models import F
+from django.utils import timezone
+
+from api.models import ModelVersion, Recipe
+
+
+def version_key(model, user_id=None):
+    """
+    Returns:
+        str: Ключ счётчика, например `api.recipe` или `api.cart:5`.
+    """
+    key = model._meta.label_lower
+    if user_id is not None:
+        key = f'{key}:{user_id}'
+    return key
+
+
+def bump(*keys):
+    """
+    Увеличивает счётчики изменений с переданными ключами, по одному
+    INSERT ... ON CONFLICT DO UPDATE на ключ.
+
+    Строка счётчика остаётся заблокированной до конца транзакции,
+    поэтому им же упорядочиваются изменения списков пользователя
+    (см. api.recipe_lists). Ключи обходятся по порядку, чтобы две
+    транзакции не ждали друг друга по кругу.
+    """
+    connection = connections[router.db_for_write(ModelVersion)]
+    table = connection.ops.quote_name(ModelVersion._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        for key in sorted(set(keys)):
+            cursor.execute(
+                f'INSERT INTO {table} (name, version, updated_at) '
+                f'VALUES (%s, 1, %s) ON CONFLICT (name) DO UPDATE '
+                f'SET version = {table}.version + 1, '
+                f'updated_at = excluded.updated_at',
+                [key, now])
+
+
+def bump_model(model, user_id=None):
+    """
+    Увеличивает счётчик таблицы `model`, а если передан `user_id` —
+    только счётчик её строк этого пользователя. Общий счётчик связей
+    пользователей не нужен ни одному ETag и был бы строкой, которую
+    блокирует запись любого пользователя.
+    """
+    bump(version_key(model, user_id))
+
+
+def bump_recipes(**lookups):
+    """
+    Увеличивает версию рецептов, подходящих под `lookups`, сбрасывая
+    их закешированные представления (см. api.fragments).
+    """
+    Recipe.objects.filter(**lookups).update(version=F('version') + 1)
+
+
+def get_validators(keys):
+    """
+    Читает счётчики одним запросом и строит по ним валидаторы.
+
+    Returns:
+        tuple[str, datetime | None]: Сильный ETag и время последнего
+        изменения любой из таблиц.
+    """
+    rows = dict.fromkeys(keys, (0, None))
+    rows.update({
+        name: (version, updated_at)
+        for name, version, updated_at in ModelVersion.objects.filter(
+            name__in=keys).values_list('name', 'version', 'updated_at')
+    })
+    digest = hashlib.sha1('|'.join(
+        f'{key}={rows[key][0]}' for key in sorted(rows)
+    ).encode()).hexdigest()
+    dates = [updated_at for _, updated_at in rows.values() if updated_at]
+    return f'"{digest}"', max(dates) if dates else None
@@ -0,0 +1,73 @@
+from django.utils.functional import cached_property
+
+from api.models import Cart, Favorite
+from users.models import Follow
+
+# Атрибут запроса, в котором хранится контекст текущего пользователя
+VIEWER_ATTR = '_foodgram_viewer'
+
+
+class ViewerContext:
+    """
+    Связи текущего пользователя, загружаемые один раз за запрос.
+
+    Каждое множество читается одним запросом при первом обращении,
+    поэтому число запросов не зависит от количества сериализуемых объектов.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @property
+    def is_anonymous(self):
+        return self.user is None or self.user.is_anonymous
+
+    def related_ids(self, model, field):
+        """
+        Returns:
+            QuerySet: Значения `field` связей пользователя в `model`.
+        """
+        return model.objects.filter(user=self.user).values_list(
+            field, flat=True)
+
+    def _ids(self, model, field):
+        if self.is_anonymous:
+            return frozenset()
+        return frozenset(self.related_ids(model, field))
+
+    @cached_property
+    def favorite_ids(self):
+        return self._ids(Favorite, 'recipe_id')
+
+    @cached_property
+    def cart_ids(self):
+        return self._ids(Cart, 'recipe_id')
+
+    @cached_property
+    def following_ids(self):
+        return self._ids(Follow, 'author_id')
+
+    def is_favorited(self, recipe_id):
+        return recipe_id in self.favorite_ids
+
+    def is_in_shopping_cart(self, recipe_id):
+        return recipe_id in self.cart_ids
+
+    def is_subscribed(self, author_id):
+        return author_id in self.following_ids
+
+
+def get_viewer(request):
+    """
+    Возвращает контекст пользователя, закешированный на объекте запроса.
+
+    Returns:
+        ViewerContext: Связи текущего пользователя.
+    """
+    if request is None:
+        return ViewerContext(None)
+    viewer = getattr(request, VIEWER_ATTR, None)
+    if viewer is None:
+        viewer = ViewerContext(request.user)
+        setattr(request, VIEWER_ATTR, viewer)
+    return viewer
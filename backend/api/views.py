@@ -1,63 +1,125 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import FileResponse
 from django.shortcuts import get_object_or_404
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
-from rest_framework import status, viewsets
+from django.utils import timezone
+from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import Throttled, ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
-from api.filters import AuthorAndTagFilter, IngredientSearchFilter
-from api.models import (Cart, Favorite, Ingredient, IngredientAmount, Recipe,
-                        Tag)
+from api import feeds, jobs, recipe_lists, shopping_list
+from api.conditional import ConditionalGetMixin
+from api.counters import change_author_counter
+from api.coverage import coverage_index
+from api.exports import (SHOPPING_LIST_FORMATS, get_shopping_list,
+                         shopping_list_response)
+from api.fragments import render_recipes
+from api.filters import AuthorAndTagFilter
+from api.metrics import collect, render_prometheus
+from api.models import (Cart, ExportJob, Favorite, Ingredient,
+                        IngredientAmount, Recipe, Tag)
 from api.pagination import LimitPageNumberPagination
-from api.permissions import IsAdminOrReadOnly, IsOwnerOrReadOnly
-from api.serializers import (CropRecipeSerializer, IngredientSerializer,
+from api.permissions import (IsAdminOrReadOnly, IsMetricsScraper,
+                             IsOwnerOrReadOnly)
+from api.renderers import (CSVRenderer, PDFRenderer, PlainTextRenderer,
+                           PrometheusRenderer)
+from api.search import ingredient_index
+from api.serializers import (CropRecipeSerializer, ExportJobSerializer,
+                             IngredientSerializer, RecipeIdsSerializer,
                              RecipeSerializer, TagSerializer)
 from api.utils import UrlQueries
+from users.models import Follow
 
+User = get_user_model()
 
-class TagsViewSet(ReadOnlyModelViewSet):
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class TagsViewSet(ConditionalGetMixin, ReadOnlyModelViewSet):
     permission_classes = (IsAdminOrReadOnly,)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    versioned_models = (Tag,)
 
 
-class IngredientsViewSet(ReadOnlyModelViewSet):
+class IngredientsViewSet(ConditionalGetMixin, ReadOnlyModelViewSet):
     permission_classes = (IsAdminOrReadOnly,)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (IngredientSearchFilter,)
-    search_fields = ('^name',)
+    versioned_models = (Ingredient,)
+
+    def list(self, request, *args, **kwargs):
+        """
+        Отдаёт ингредиенты из индекса в памяти, не обращаясь к базе.
+
+        Returns:
+            Response: Совпадения по началу названия, затем по вхождению.
+        """
+        name = request.query_params.get(UrlQueries.SEARCH_ING_NAME.value)
+        if name:
+            return Response(ingredient_index.search(name))
+        return Response(ingredient_index.all())
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     pagination_class = LimitPageNumberPagination
-    filter_class = AuthorAndTagFilter
+    filterset_class = AuthorAndTagFilter
     permission_classes = [IsOwnerOrReadOnly]
+    versioned_models = (Recipe, Tag, Ingredient, IngredientAmount, User)
+    viewer_models = (Favorite, Cart, Follow)
 
-    def get_queryset(self):
+    def list(self, request, *args, **kwargs):
+        """
+        Собирает страницу из закешированных представлений рецептов:
+        из базы читаются только id и версии рецептов на странице.
         """
-        Получает queryset в соответствии с параметрами запроса.
+        queryset = self.get_page_queryset()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(render_recipes(page, request))
+        return Response(render_recipes(list(queryset), request))
 
+    def get_page_queryset(self):
+        """
         Returns:
-            QuerySet[Recipe]: Список запрошенных объектов.
+            QuerySet: Строки `{'id', 'version'}` отфильтрованных рецептов.
         """
-        queryset = self.queryset
-        tags: list = self.request.query_params.getlist(UrlQueries.TAGS.value)
-        if tags:
-            queryset = queryset.filter(
-                tags__slug__in=tags).distinct()
-        return queryset
+        return self.filter_queryset(self.get_queryset()).values(
+            'id', 'version')
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        rows = [{'id': instance.id, 'version': instance.version}]
+        return Response(render_recipes(rows, request)[0])
+
+    def get_version_keys(self):
+        if self.request.query_params.get(UrlQueries.ORDERING.value):
+            # Порядок по счётчикам меняется от чужого избранного и
+            # корзин, а общих счётчиков изменений у них нет
+            return None
+        return super().get_version_keys()
 
     def perform_create(self, serializer):
         serializer.is_valid()
-        serializer.save(author=self.request.user)
+        with transaction.atomic():
+            recipe = serializer.save(author=self.request.user)
+            change_author_counter(self.request.user.id, 'recipes_count', 1)
+            feeds.publish(recipe)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            shopping_list.recipe_deleted(instance.id)
+            instance.delete()
+            change_author_counter(instance.author_id, 'recipes_count', -1)
 
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
@@ -73,49 +135,196 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return self.add_obj(Cart, request.user, pk)
         return self.delete_obj(Cart, request.user, pk)
 
+    @action(detail=False, methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated], url_path='favorite',
+            url_name='favorite-batch')
+    def favorite_batch(self, request):
+        return self.change_objs(Favorite, request)
+
+    @action(detail=False, methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated], url_path='shopping_cart',
+            url_name='shopping-cart-batch')
+    def shopping_cart_batch(self, request):
+        return self.change_objs(Cart, request)
+
     @action(detail=False, methods=['get'],
-            permission_classes=[IsAuthenticated])
+            permission_classes=[IsAuthenticated],
+            renderer_classes=[JSONRenderer, PDFRenderer, PlainTextRenderer,
+                              CSVRenderer])
     def download_shopping_cart(self, request):
-        final_ingredients = IngredientAmount.objects.filter(
-            recipe__cart__user=request.user).values(
-            'ingredient__name', 'ingredient__measurement_unit').annotate(
-            total=Sum('amount')).order_by('total')
-        pdfmetrics.registerFont(
-            TTFont('Slimamif', 'Slimamif.ttf', 'UTF-8'))
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = ('attachment; '
-                                           'filename="shopping_list.pdf"')
-        page = canvas.Canvas(response)
-        page.setFont('Slimamif', size=24)
-        page.drawString(200, 800, 'Список ингредиентов')
-        page.setFont('Slimamif', size=16)
-        height = 750
-        for i, data in enumerate(final_ingredients, 1):
-            page.drawString(
-                75, height, (f'<{i}> {data.get("ingredient__name")}'
-                             + f' - {data.get("total")}, '
-                             + f'{data.get("ingredient__measurement_unit")}')
-            )
-            height -= 25
-        page.showPage()
-        page.save()
-        return response
+        export_format = request.query_params.get('format', 'pdf')
+        if export_format not in SHOPPING_LIST_FORMATS:
+            export_format = 'pdf'
+        final_ingredients = get_shopping_list(request.user).iterator()
+        return shopping_list_response(final_ingredients, export_format)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """
+        Лента рецептов авторов из подписок, новые сначала.
+
+        Returns:
+            Response: Страница рецептов и ссылка `next` с курсором —
+            id последнего рецепта страницы.
+        """
+        cursor_param = self.paginator.cursor_query_param
+        before = self.get_int_params(cursor_param)
+        limit = self.paginator.get_page_size(request)
+        recipe_ids = feeds.page(request.user.id,
+                                before[0] if before else None, limit + 1)
+        next_link = None
+        if len(recipe_ids) > limit:
+            recipe_ids = recipe_ids[:limit]
+            next_link = replace_query_param(
+                request.build_absolute_uri(), cursor_param, recipe_ids[-1])
+        versions = dict(Recipe.objects.filter(
+            id__in=recipe_ids).values_list('id', 'version'))
+        data = render_recipes(
+            [{'id': recipe_id, 'version': versions[recipe_id]}
+             for recipe_id in recipe_ids if recipe_id in versions],
+            request)
+        return Response({'next': next_link, 'previous': None,
+                         'results': data})
+
+    @action(detail=False, methods=['get'])
+    def cook_with(self, request):
+        """
+        Подбирает рецепты по ингредиентам, которые уже есть.
+
+        Returns:
+            Response: Страница рецептов, где больше всего совпадений, с
+            полями `matched_ingredients` и `missing_ingredients`.
+        """
+        ingredient_ids = self.get_int_params(UrlQueries.INGREDIENTS.value)
+        if not ingredient_ids:
+            raise ValidationError({
+                UrlQueries.INGREDIENTS.value: 'Укажите id ингредиентов'})
+        max_missing = self.get_int_params(UrlQueries.MAX_MISSING.value)
+        ranked = coverage_index.match(
+            ingredient_ids, max_missing[0] if max_missing else None)
+        page = self.paginate_queryset(ranked)
+        versions = dict(Recipe.objects.filter(
+            id__in=[recipe_id for recipe_id, _, _ in page]).values_list(
+            'id', 'version'))
+        counts = {recipe_id: (matched, missing)
+                  for recipe_id, matched, missing in page}
+        data = render_recipes(
+            [{'id': recipe_id, 'version': versions[recipe_id]}
+             for recipe_id, _, _ in page if recipe_id in versions],
+            request)
+        for recipe in data:
+            recipe['matched_ingredients'], recipe['missing_ingredients'] = (
+                counts[recipe['id']])
+        return self.get_paginated_response(data)
+
+    def get_int_params(self, name):
+        """
+        Returns:
+            list[int]: Числа из параметра, переданного несколько раз или
+            через запятую.
+        """
+        values = [value for param in self.request.query_params.getlist(name)
+                  for value in param.split(',') if value.strip()]
+        try:
+            return [int(value) for value in values]
+        except ValueError:
+            raise ValidationError({name: 'Ожидаются целые числа'})
 
     def add_obj(self, model, user, pk):
-        if model.objects.filter(user=user, recipe__id=pk).exists():
+        recipe = get_object_or_404(Recipe.objects.only(
+            'id', 'name', 'image', 'image_variants', 'cooking_time'), id=pk)
+        if not recipe_lists.add_one(model, user, recipe.id):
             return Response({
                 'errors': 'Рецепт уже добавлен в список'
             }, status=status.HTTP_400_BAD_REQUEST)
-        recipe = get_object_or_404(Recipe, id=pk)
-        model.objects.create(user=user, recipe=recipe)
         serializer = CropRecipeSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete_obj(self, model, user, pk):
-        obj = model.objects.filter(user=user, recipe__id=pk)
-        if obj.exists():
-            obj.delete()
+        if recipe_lists.remove_one(model, user, pk):
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response({
             'errors': 'Рецепт уже удален'
         }, status=status.HTTP_400_BAD_REQUEST)
+
+    def change_objs(self, model, request):
+        """
+        Добавляет (POST) или удаляет (DELETE) пачку рецептов.
+
+        Returns:
+            Response: {"results": [{"id", "status"}, ...]} в порядке
+            запроса; status — added, exists, not_found, removed или
+            absent.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        if request.method == 'POST':
+            outcomes = recipe_lists.add(model, request.user, recipe_ids)
+        else:
+            outcomes = recipe_lists.remove(model, request.user, recipe_ids)
+        return Response({'results': [
+            {'id': recipe_id, 'status': outcome}
+            for recipe_id, outcome in outcomes.items()]})
+
+
+class ExportJobViewSet(mixins.CreateModelMixin, mixins.ListModelMixin,
+                       mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Фоновые выгрузки пользователя: POST ставит задание в очередь, GET
+    показывает статус, download отдаёт готовый файл.
+    """
+
+    serializer_class = ExportJobSerializer
+    permission_classes = (IsAuthenticated,)
+    pagination_class = LimitPageNumberPagination
+
+    def get_queryset(self):
+        return ExportJob.objects.filter(user=self.request.user).defer(
+            'payload')
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            job, created = jobs.submit(
+                request.user, serializer.validated_data['kind'],
+                serializer.validated_data['export_format'])
+        except jobs.TooManyJobs:
+            raise Throttled(detail='Дождитесь завершения начатых выгрузок')
+        return Response(
+            self.get_serializer(job).data,
+            status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'],
+            renderer_classes=[JSONRenderer, PDFRenderer, PlainTextRenderer,
+                              CSVRenderer])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status == ExportJob.DONE and job.expires_at < timezone.now():
+            return Response({'errors': 'Срок хранения выгрузки истёк'},
+                            status=status.HTTP_410_GONE)
+        if job.status == ExportJob.DONE and not default_storage.exists(
+                job.result):
+            jobs.requeue(job)
+            job.status = ExportJob.PENDING
+        if job.status != ExportJob.DONE:
+            return Response({'errors': 'Выгрузка ещё не готова',
+                             'status': job.status},
+                            status=status.HTTP_409_CONFLICT)
+        return FileResponse(default_storage.open(job.result, 'rb'),
+                            as_attachment=True, filename=jobs.filename(job),
+                            content_type=jobs.content_type(job.export_format))
+
+
+class MetricsView(APIView):
+    """Метрики всех воркеров в текстовом формате Prometheus."""
+
+    authentication_classes = ()
+    permission_classes = (IsMetricsScraper,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request):
+        return Response(render_prometheus(collect()),
+                        content_type=PROMETHEUS_CONTENT_TYPE)
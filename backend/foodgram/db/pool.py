@@ -0,0 +1,252 @@
+"""
+Пул соединений с СУБД внутри процесса.
+
+Django держит по соединению на поток: с CONN_MAX_AGE > 0 каждый поток
+воркера (потоки gunicorn, пул асинхронных представлений, воркер
+выгрузок) хранит своё соединение, пока жив. Пул отдаёт соединения
+потокам на время запроса и забирает их обратно, так что число
+соединений процесса ограничено MAX_SIZE, а не числом потоков. Когда все
+соединения заняты, поток ждёт свободное не дольше TIMEOUT секунд.
+
+Перед выдачей соединение, пролежавшее в пуле дольше CHECK_IDLE секунд,
+проверяется запросом `SELECT 1`. Соединения старше MAX_LIFETIME и
+простаивающие дольше MAX_IDLE закрываются.
+"""
+import functools
+import os
+import threading
+import time
+from collections import deque
+
+from django.db.utils import OperationalError
+
+DEFAULTS = {
+    'MAX_SIZE': 10,
+    'TIMEOUT': 5,
+    'MAX_IDLE': 300,
+    'MAX_LIFETIME': 3600,
+    'CHECK_IDLE': 1,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(OperationalError):
+    """Свободное соединение не появилось за TIMEOUT секунд."""
+
+
+class ConnectionPool:
+    """Соединения одной базы: выданные и свободные."""
+
+    def __init__(self, name, options):
+        self.name = name
+        self.options = {**DEFAULTS, **options}
+        self.pid = os.getpid()
+        self.condition = threading.Condition()
+        # (соединение, когда открыто, когда возвращено), свежие справа
+        self.idle = deque()
+        # id выданного соединения: когда оно открыто
+        self.in_use = {}
+        # Открытые соединения: выданные, свободные и открывающиеся
+        self.size = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.discards = {}
+
+    def _discard(self, connection, reason):
+        self.discards[reason] = self.discards.get(reason, 0) + 1
+        self.size -= 1
+        self.condition.notify()
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _take_idle(self, now):
+        """Свободное соединение или None; устаревшие закрываются."""
+        while self.idle and (
+                now - self.idle[0][2] > self.options['MAX_IDLE']):
+            self._discard(self.idle.popleft()[0], 'idle')
+        if self.idle:
+            return self.idle.pop()
+        return None
+
+    def _checkout(self):
+        """
+        Ждёт свободное соединение или место под новое.
+
+        Returns:
+            tuple | None: Свободное соединение (соединение, когда открыто,
+            когда возвращено); None, если место под новое занято за
+            вызывающим.
+        """
+        waited_from = None
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                entry = self._take_idle(now)
+                if entry is not None or self.size < self.options['MAX_SIZE']:
+                    break
+                if waited_from is None:
+                    waited_from = now
+                    self.waits += 1
+                remaining = waited_from + self.options['TIMEOUT'] - now
+                if remaining <= 0 or not self.condition.wait(remaining):
+                    self.wait_seconds += time.monotonic() - waited_from
+                    self.timeouts += 1
+                    raise PoolTimeout(
+                        f'Пул соединений {self.name}: все '
+                        f'{self.options["MAX_SIZE"]} соединений заняты')
+            if entry is None:
+                self.size += 1
+                self.connects += 1
+            if waited_from is not None:
+                self.wait_seconds += now - waited_from
+            return entry
+
+    def acquire(self, connect, ping):
+        """
+        Выдаёт свободное соединение или открывает новое.
+
+        Args:
+            connect (Callable): Открывает соединение.
+            ping (Callable): Проверяет соединение, бросает исключение,
+                если оно неисправно.
+
+        Raises:
+            PoolTimeout: Все MAX_SIZE соединений заняты дольше TIMEOUT.
+        """
+        while True:
+            entry = self._checkout()
+            if entry is None:
+                return self._open(connect)
+            connection, opened, released = entry
+            if time.monotonic() - released > self.options['CHECK_IDLE']:
+                try:
+                    ping(connection)
+                except Exception:
+                    with self.condition:
+                        self._discard(connection, 'broken')
+                    continue
+            with self.condition:
+                self.in_use[id(connection)] = opened
+            return connection
+
+    def _open(self, connect):
+        try:
+            connection = connect()
+        except BaseException:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.in_use[id(connection)] = time.monotonic()
+        return connection
+
+    def release(self, connection, reset):
+        """
+        Возвращает соединение в пул.
+
+        Args:
+            reset (Callable): Откатывает незавершённую транзакцию, бросает
+                исключение, если соединение неисправно.
+        """
+        with self.condition:
+            opened = self.in_use.pop(id(connection), None)
+        if opened is None:
+            # Соединение открыто до форка или не этим пулом
+            connection.close()
+            return
+        now = time.monotonic()
+        reason = None
+        if now - opened > self.options['MAX_LIFETIME']:
+            reason = 'lifetime'
+        if reason is None:
+            try:
+                reset(connection)
+            except Exception:
+                reason = 'broken'
+        with self.condition:
+            if reason is not None:
+                self._discard(connection, reason)
+                return
+            self.idle.append((connection, opened, now))
+            self.condition.notify()
+
+    def stats(self):
+        with self.condition:
+            return {
+                'in_use': self.size - len(self.idle),
+                'idle': len(self.idle),
+                'max_size': self.options['MAX_SIZE'],
+                'waits': self.waits,
+                'wait_seconds': self.wait_seconds,
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'discards': dict(self.discards),
+            }
+
+
+def get_pool(alias, database, options):
+    """
+    Returns:
+        ConnectionPool: Пул базы `database` текущего процесса; после
+        форка воркера создаётся новый.
+    """
+    key = (alias, database)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.pid != os.getpid():
+            pool = _pools[key] = ConnectionPool(alias, options)
+        return pool
+
+
+def stats():
+    """
+    Returns:
+        dict: {имя базы: статистика пула} текущего процесса.
+    """
+    with _pools_lock:
+        pools = [pool for pool in _pools.values()
+                 if pool.pid == os.getpid()]
+    return {pool.name: pool.stats() for pool in pools}
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Подмешивается к DatabaseWrapper бэкенда: соединение берётся из пула
+    при подключении и возвращается в него при закрытии. Настройки пула —
+    в ключе POOL базы в DATABASES.
+    """
+
+    def _pool(self):
+        return get_pool(self.alias, self.settings_dict['NAME'],
+                        self.settings_dict.get('POOL', {}))
+
+    def get_new_connection(self, conn_params):
+        return self._pool().acquire(
+            functools.partial(super().get_new_connection, conn_params),
+            self._ping)
+
+    def _ping(self, connection):
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+
+    def _reset(self, connection, check):
+        # Соединение могли закрыть посреди transaction.atomic
+        connection.rollback()
+        if check:
+            self._ping(connection)
+
+    def _close(self):
+        if self.connection is not None:
+            # После ошибки СУБД соединение проверяется до возврата в пул
+            self._pool().release(self.connection, functools.partial(
+                self._reset, check=self.errors_occurred))
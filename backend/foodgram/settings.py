@@ -25,6 +25,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ServerTimingMiddleware',
+    'api.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -54,6 +56,26 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
+ASGI_APPLICATION = 'foodgram.asgi.application'
+
+# Асинхронные представления для чтения (см. api.offload); foodgram.asgi
+# включает их по умолчанию, под WSGI они только добавили бы накладных
+# расходов
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'false').lower() == 'true'
+# Потоки, в которых выполняются асинхронные представления, на процесс:
+# у каждого своё соединение с базой
+ASYNC_VIEW_THREADS = int(os.environ.get('ASYNC_VIEW_THREADS', 8))
+
+# Пул соединений процесса (см. foodgram.db.pool), только для PostgreSQL:
+# соединения выдаются потокам на время запроса, не больше MAX_SIZE на
+# процесс; поток ждёт свободное не дольше TIMEOUT секунд
+DB_POOL = os.environ.get('DB_POOL', 'false').lower() == 'true'
+DB_POOL_OPTIONS = {
+    'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+    'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+    'MAX_IDLE': int(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+    'MAX_LIFETIME': int(os.environ.get('DB_POOL_MAX_LIFETIME', 3600)),
+}
 
 DATABASES = {
     'default': {
@@ -63,8 +85,42 @@ DATABASES = {
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
         'HOST': os.environ.get('DB_HOST'),
         'PORT': os.environ.get('DB_PORT'),
+        # Сколько секунд соединение живёт между запросами вместо
+        # подключения заново на каждый запрос; перед повторным
+        # использованием оно проверяется
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.environ.get(
+            'DB_CONN_HEALTH_CHECKS', 'true').lower() == 'true',
     }
 }
+if DB_POOL and DATABASES['default']['ENGINE'] == (
+        'django.db.backends.postgresql'):
+    DATABASES['default'].update(
+        ENGINE='foodgram.db.postgresql',
+        POOL=DB_POOL_OPTIONS,
+        # Соединение возвращается в пул в конце каждого запроса
+        CONN_MAX_AGE=0,
+    )
+
+# Реплики для чтения (см. api.replicas): адреса HOST[:PORT] через
+# запятую или, например для проверки на SQLite, имена баз. Реплики
+# повторяют настройки default, в тестах их заменяет default
+_replicas = [
+    dict(zip(('HOST', 'PORT'), address.strip().split(':', 1)))
+    for address in filter(
+        None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))
+] + [
+    {'NAME': name.strip()}
+    for name in filter(None, os.environ.get('DB_REPLICA_NAMES', '').split(','))
+]
+REPLICA_DATABASES = [f'replica_{number}'
+                     for number in range(1, len(_replicas) + 1)]
+for alias, overrides in zip(REPLICA_DATABASES, _replicas):
+    DATABASES[alias] = {**DATABASES['default'], **overrides,
+                        'TEST': {'MIRROR': 'default'}}
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+# Сколько секунд после записи клиент читает из default, а не с реплики
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
 """
 DATABASES = {
     'default': {
@@ -89,6 +145,13 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Вход по токену идёт по email (DJOSER['LOGIN_FIELD']), в админку — по
+# username
+AUTHENTICATION_BACKENDS = [
+    'django.contrib.auth.backends.ModelBackend',
+    'users.backends.EmailBackend',
+]
+
 LANGUAGE_CODE = 'en-us'
 
 TIME_ZONE = 'UTC'
@@ -126,9 +189,61 @@ DJOSER = {
         'user_create': 'users.serializers.CustomUserCreateSerializer',
         'user': 'users.serializers.CustomUserSerializer',
         'current_user': 'users.serializers.CustomUserSerializer',
+        'set_username': 'users.serializers.CustomSetUsernameSerializer',
     },
     'PERMISSIONS': {
         'user': ('rest_framework.permissions.IsAuthenticated',),
         'user_list': ('rest_framework.permissions.AllowAny',)
     }
 }
+
+# Через сколько секунд индекс ингредиентов в памяти строится заново
+INGREDIENT_INDEX_TTL = int(os.environ.get('INGREDIENT_INDEX_TTL', 300))
+
+# Через сколько секунд индекс «ингредиент → рецепты» строится заново
+COVERAGE_INDEX_TTL = int(os.environ.get('COVERAGE_INDEX_TTL', 300))
+
+# Авторы, у которых столько подписчиков или рецептов, не раскладывают
+# рецепты по лентам подписчиков: лента читает их при запросе
+FEED_FANOUT_MAX_FOLLOWERS = int(
+    os.environ.get('FEED_FANOUT_MAX_FOLLOWERS', 1000))
+FEED_BACKFILL_MAX_RECIPES = int(
+    os.environ.get('FEED_BACKFILL_MAX_RECIPES', 500))
+
+# Через сколько секунд карта слагов тегов в памяти перечитывается
+TAG_MAP_TTL = int(os.environ.get('TAG_MAP_TTL', 60))
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# Время жизни закешированного представления рецепта, секунды
+RECIPE_FRAGMENT_TIMEOUT = int(os.environ.get('RECIPE_FRAGMENT_TIMEOUT', 3600))
+
+# Число потоков, строящих уменьшенные копии картинок рецептов
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+
+# Каталог, куда воркеры сбрасывают метрики для /api/metrics/;
+# без него метрики отдаются только по текущему процессу
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+# Токен Prometheus для /api/metrics/; без него метрики видят только
+# администраторы
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Фоновые выгрузки (см. api.jobs): сколько секунд хранится готовый файл,
+# сколько попыток и с какой начальной паузой, сколько секунд воркер
+# держит задание, прежде чем его возьмёт другой
+EXPORT_RESULT_TTL = int(os.environ.get('EXPORT_RESULT_TTL', 24 * 60 * 60))
+EXPORT_MAX_ATTEMPTS = int(os.environ.get('EXPORT_MAX_ATTEMPTS', 3))
+EXPORT_RETRY_DELAY = int(os.environ.get('EXPORT_RETRY_DELAY', 30))
+EXPORT_JOB_TIMEOUT = int(os.environ.get('EXPORT_JOB_TIMEOUT', 600))
+# Одновременно выполняемых заданий на все воркеры, потоков на воркер и
+# незавершённых заданий на пользователя
+EXPORT_MAX_RUNNING = int(os.environ.get('EXPORT_MAX_RUNNING', 4))
+EXPORT_WORKER_THREADS = int(os.environ.get('EXPORT_WORKER_THREADS', 2))
+EXPORT_USER_ACTIVE_JOBS = int(os.environ.get('EXPORT_USER_ACTIVE_JOBS', 3))
@@ -0,0 +1,104 @@
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from foodgram.db.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def ok(connection):
+    pass
+
+
+def broken(connection):
+    raise OSError('соединение разорвано')
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    """Выдача, ожидание и закрытие соединений пула."""
+
+    def pool(self, **options):
+        return ConnectionPool('default', {'CHECK_IDLE': 60, **options})
+
+    def test_released_connection_is_reused(self):
+        pool = self.pool()
+        connection = pool.acquire(FakeConnection, ok)
+        pool.release(connection, ok)
+        self.assertIs(pool.acquire(FakeConnection, ok), connection)
+        self.assertEqual(pool.stats()['connects'], 1)
+        self.assertEqual(pool.stats()['in_use'], 1)
+
+    def test_full_pool_times_out(self):
+        pool = self.pool(MAX_SIZE=1, TIMEOUT=0.05)
+        pool.acquire(FakeConnection, ok)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(FakeConnection, ok)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_waiter_gets_released_connection(self):
+        pool = self.pool(MAX_SIZE=1, TIMEOUT=5)
+        connection = pool.acquire(FakeConnection, ok)
+        timer = threading.Timer(0.05, pool.release, (connection, ok))
+        timer.start()
+        self.addCleanup(timer.join)
+        self.assertIs(pool.acquire(FakeConnection, ok), connection)
+        stats = pool.stats()
+        self.assertEqual((stats['waits'], stats['timeouts']), (1, 0))
+
+    def test_broken_idle_connection_is_replaced(self):
+        pool = self.pool(CHECK_IDLE=0)
+        connection = pool.acquire(FakeConnection, ok)
+        pool.release(connection, ok)
+        time.sleep(0.01)
+        fresh = pool.acquire(FakeConnection, broken)
+        self.assertIsNot(fresh, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['discards'], {'broken': 1})
+
+    def test_failed_reset_discards_connection(self):
+        pool = self.pool()
+        connection = pool.acquire(FakeConnection, ok)
+        pool.release(connection, broken)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['idle'], 0)
+        self.assertEqual(pool.stats()['discards'], {'broken': 1})
+
+    def test_old_connection_is_closed(self):
+        pool = self.pool(MAX_LIFETIME=0.005)
+        connection = pool.acquire(FakeConnection, ok)
+        time.sleep(0.01)
+        pool.release(connection, ok)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['discards'], {'lifetime': 1})
+
+    def test_idle_connection_is_closed(self):
+        pool = self.pool(MAX_IDLE=0.005)
+        connection = pool.acquire(FakeConnection, ok)
+        pool.release(connection, ok)
+        time.sleep(0.01)
+        self.assertIsNot(pool.acquire(FakeConnection, ok), connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['discards'], {'idle': 1})
+
+    def test_failed_connect_frees_slot(self):
+        pool = self.pool(MAX_SIZE=1, TIMEOUT=0.05)
+        with self.assertRaises(OSError):
+            pool.acquire(lambda: broken(None), ok)
+        pool.acquire(FakeConnection, ok)
+        self.assertEqual(pool.stats()['in_use'], 1)
+
+    def test_foreign_connection_is_closed(self):
+        pool = self.pool()
+        connection = FakeConnection()
+        pool.release(connection, ok)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['idle'], 0)
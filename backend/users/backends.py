@@ -0,0 +1,28 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+User = get_user_model()
+
+
+class EmailBackend(ModelBackend):
+    """
+    Вход по email: djoser с LOGIN_FIELD = 'email' передаёт адрес
+    в `email` или в `username`, в зависимости от версии.
+    """
+
+    def authenticate(self, request, username=None, password=None,
+                     email=None, **kwargs):
+        email = email or username
+        if email is None or password is None:
+            return None
+        user = User._default_manager.filter(
+            email__iexact=email).order_by('id').first()
+        if user is None:
+            # Хеширование, как и для существующего пользователя: время
+            # ответа не выдаёт, зарегистрирован ли адрес
+            User().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(
+                user):
+            return user
+        return None
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.2 on 2026-10-18 04:55
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_author_stats(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Recipe = apps.get_model('api', 'Recipe')
+    Follow = apps.get_model('users', 'Follow')
+    AuthorStats = apps.get_model('users', 'AuthorStats')
+    recipes = dict(Recipe.objects.order_by().values('author').annotate(
+        total=Count('id')).values_list('author', 'total'))
+    followers = dict(Follow.objects.order_by().values('author').annotate(
+        total=Count('id')).values_list('author', 'total'))
+    AuthorStats.objects.bulk_create(
+        [AuthorStats(user_id=user_id,
+                     recipes_count=recipes.get(user_id, 0),
+                     followers_count=followers.get(user_id, 0))
+         for user_id in User.objects.values_list('id', flat=True)],
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0002_auto_20210930_1515'),
+        ('api', '0012_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='author_stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('recipes_count', models.PositiveIntegerField(default=0, verbose_name='Рецептов')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+            ],
+            options={
+                'verbose_name': 'Счётчики автора',
+                'verbose_name_plural': 'Счётчики авторов',
+            },
+        ),
+        migrations.RunPython(fill_author_stats, migrations.RunPython.noop),
+    ]
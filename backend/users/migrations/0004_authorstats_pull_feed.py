@@ -0,0 +1,18 @@
+# Generated by Django 4.2.2 on 2026-10-18 04:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_authorstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='pull_feed',
+            field=models.BooleanField(default=False, verbose_name='Лента без рассылки'),
+        ),
+    ]
@@ -28,3 +28,32 @@ class Follow(models.Model):
                 name='unique follow',
             )
         ]
+
+
+class AuthorStats(models.Model):
+    """
+    Счётчики автора, которые иначе пришлось бы считать COUNT по рецептам
+    и подпискам. Меняются F()-выражениями там же, где создаются и
+    удаляются рецепты и подписки; расхождения чинит reconcile_counters.
+    """
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='author_stats',
+        verbose_name='Автор',
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0, verbose_name='Рецептов')
+    followers_count = models.PositiveIntegerField(
+        default=0, verbose_name='Подписчиков')
+    # Рецепты автора не раскладываются по лентам подписчиков, а читаются
+    # при запросе ленты (см. api.feeds). Флаг не снимается сам: снять его
+    # можно командой rebuild_feeds, которая заполнит ленты заново
+    pull_feed = models.BooleanField(
+        default=False, verbose_name='Лента без рассылки')
+
+    class Meta:
+        verbose_name = 'Счётчики автора'
+        verbose_name_plural = 'Счётчики авторов'
@@ -1,9 +1,10 @@
 from django.contrib.auth import get_user_model
-from djoser.serializers import UserCreateSerializer, UserSerializer
+from djoser.serializers import (CurrentPasswordSerializer,
+                                UserCreateSerializer, UserSerializer)
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
-from users.models import Follow
+from api.viewer import get_viewer
 
 User = get_user_model()
 
@@ -37,7 +38,22 @@ class CustomUserSerializer(UserSerializer):
             'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Follow.objects.filter(user=user, author=obj.id).exists()
+        viewer = get_viewer(self.context.get('request'))
+        return viewer.is_subscribed(obj.id)
+
+
+class CustomSetUsernameSerializer(CurrentPasswordSerializer):
+    """
+    Смена username полем `new_username`: представление djoser читает
+    его из данных сериализатора, а свой сериализатор djoser строит по
+    LOGIN_FIELD (email).
+    """
+
+    new_username = serializers.CharField(
+        source='username', max_length=150,
+        validators=[UniqueValidator(queryset=User.objects.all())])
+
+    def validate_new_username(self, value):
+        for validator in User._meta.get_field('username').validators:
+            validator(value)
+        return value
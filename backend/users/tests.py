@@ -0,0 +1,34 @@
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+User = get_user_model()
+
+
+class AccountTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='secret')
+
+    def test_token_login_by_email(self):
+        response = self.client.post(reverse('api_users:login'), {
+            'email': 'reader@example.com', 'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Token.objects.filter(
+            user=self.user, key=response.data['auth_token']).exists())
+
+    def test_token_login_wrong_password(self):
+        response = self.client.post(reverse('api_users:login'), {
+            'email': 'reader@example.com', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_set_username(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse('api_users:user-set-username'), {
+            'current_password': 'secret', 'new_username': 'writer'})
+        self.assertEqual(response.status_code, 204)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.username, 'writer')
@@ -1,4 +1,9 @@
+from collections import defaultdict
+
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from djoser.views import UserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
@@ -6,6 +11,10 @@ from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from api import feeds
+from api.counters import change_author_counter
+from api.metrics import timed
+from api.models import Recipe
 from api.pagination import LimitPageNumberPagination
 from api.serializers import FollowSerializer
 from users.models import Follow
@@ -30,7 +39,10 @@ class CustomUserViewSet(UserViewSet):
             context={'request': request}
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
+            change_author_counter(author.id, 'followers_count', 1)
+            feeds.follow(user.id, author.id)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
@@ -39,7 +51,10 @@ class CustomUserViewSet(UserViewSet):
         author = get_object_or_404(User, id=id)
         follow = Follow.objects.filter(user=user, author=author)
         if follow.exists():
-            follow.delete()
+            with transaction.atomic():
+                follow.delete()
+                change_author_counter(author.id, 'followers_count', -1)
+            feeds.unfollow(user.id, author.id)
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         return Response({
@@ -48,12 +63,49 @@ class CustomUserViewSet(UserViewSet):
 
     @action(detail=False, permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
-        user = request.user
-        queryset = Follow.objects.filter(user=user)
-        pages = self.paginate_queryset(queryset)
+        pages = self.paginate_queryset(
+            self.get_subscriptions_queryset(request.user))
+        limit = request.query_params.get('recipes_limit')
+        limit = int(limit) if limit and limit.isdigit() else None
+        recipes = self.recipes_by_author(
+            [follow.author_id for follow in pages], limit)
         serializer = FollowSerializer(
             pages,
             many=True,
-            context={'request': request}
+            context={'request': request, 'recipes_by_author': recipes}
         )
-        return self.get_paginated_response(serializer.data)
+        with timed('serialize'):
+            data = serializer.data
+        return self.get_paginated_response(data)
+
+    def get_subscriptions_queryset(self, user):
+        return Follow.objects.filter(user=user).select_related(
+            'author__author_stats').order_by('-id')
+
+    def get_author_recipes(self, author_ids, limit=None):
+        """
+        Выбирает первые `limit` рецептов каждого автора одним запросом
+        с ROW_NUMBER() OVER (PARTITION BY author_id).
+
+        Returns:
+            QuerySet[Recipe]: Рецепты авторов в порядке `-id`.
+        """
+        queryset = Recipe.objects.filter(author_id__in=author_ids)
+        if limit is not None:
+            queryset = queryset.annotate(row_number=Window(
+                expression=RowNumber(),
+                partition_by=F('author_id'),
+                order_by=F('id').desc(),
+            )).filter(row_number__lte=limit)
+        return queryset.only('id', 'author_id', 'name', 'image',
+                             'image_variants', 'cooking_time')
+
+    def recipes_by_author(self, author_ids, limit=None):
+        """
+        Returns:
+            dict: {author_id: [Recipe, ...]} в порядке `-id`.
+        """
+        recipes = defaultdict(list)
+        for recipe in self.get_author_recipes(author_ids, limit):
+            recipes[recipe.author_id].append(recipe)
+        return recipes